@@ -1,14 +1,24 @@
 from typing import Optional
 import os
+import re
+import uuid
 
 import httpx
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 ORCH_URL = os.getenv("ORCH_URL", "http://orchestrator:8001")
 
+# Trace id shared with the orchestrator (see apps/orchestrator/telemetry.py)
+TRACE_HEADER = "X-Trace-Id"
+_TRACE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
 app = FastAPI(title="Ross-LLM Gateway", version="1.0.0")
 
+# Long-lived client for streamed relays; read timeout is per chunk, not total.
+_stream_client = httpx.AsyncClient(timeout=httpx.Timeout(30, read=120))
+
 class ChatIn(BaseModel):
     user_id: str
     text: str
@@ -18,16 +28,25 @@ class ChatOut(BaseModel):
     reply: str
     profile: Optional[str] = None
 
+def _trace_id(request: Request) -> str:
+    """Keep the caller's X-Trace-Id if it is well-formed, else start a trace."""
+    trace_id = request.headers.get(TRACE_HEADER, "").strip()
+    return trace_id if _TRACE_ID_RE.match(trace_id) else uuid.uuid4().hex
+
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
 @app.post("/chat", response_model=ChatOut)
-def chat(m: ChatIn):
+def chat(m: ChatIn, request: Request, response: Response):
+    trace_id = _trace_id(request)
+    response.headers[TRACE_HEADER] = trace_id
     try:
         r = httpx.post(
             f"{ORCH_URL}/chat",
             json=m.model_dump(),
+            headers={TRACE_HEADER: trace_id},
             timeout=30,
         )
         r.raise_for_status()
@@ -41,3 +60,42 @@ def chat(m: ChatIn):
 
     # We assume orchestrator returns { "reply": "...", "profile": "..." }
     return data
+
+
+@app.post("/chat/stream")
+async def chat_stream(m: ChatIn, request: Request):
+    """Relay the orchestrator's SSE stream chunk by chunk without buffering."""
+    trace_id = _trace_id(request)
+    req = _stream_client.build_request(
+        "POST",
+        f"{ORCH_URL}/chat/stream",
+        json=m.model_dump(),
+        headers={TRACE_HEADER: trace_id},
+    )
+    try:
+        r = await _stream_client.send(req, stream=True)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Gateway → Orchestrator error: {e}")
+
+    if r.status_code >= 400:
+        body = await r.aread()
+        await r.aclose()
+        raise HTTPException(status_code=502, detail=f"Gateway → Orchestrator error: {r.status_code} {body[:300]!r}")
+
+    async def relay():
+        try:
+            async for chunk in r.aiter_raw():
+                yield chunk
+        finally:
+            await r.aclose()
+
+    return StreamingResponse(
+        relay(),
+        media_type=r.headers.get("content-type", "text/event-stream"),
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", TRACE_HEADER: trace_id},
+    )
+
+
+@app.on_event("shutdown")
+async def _close_stream_client() -> None:
+    await _stream_client.aclose()
@@ -0,0 +1,188 @@
+"""
+Shared Postgres access for the orchestrator (psycopg 3).
+
+- One AsyncConnectionPool per process, opened lazily on first use and
+  closed from the app shutdown hook. pgvector types are registered once
+  per physical connection via the pool's `configure` callback.
+- A cached "does this model have any embeddings?" flag replaces the
+  per-request count(*) over ross.chunk_embeddings. A positive answer is
+  kept until invalidated; a negative answer is re-checked after
+  EMBEDDINGS_FLAG_NEGATIVE_TTL seconds so out-of-process ingestion
+  (scripts, workers) is picked up without a restart. embedding_worker
+  invalidates it right away: it NOTIFYs EMBEDDINGS_CHANNEL in the
+  transaction that writes or deletes embeddings, and
+  `listen_embedding_changes()` (a main.py background task) drops the flag.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pgvector.psycopg import register_vector, register_vector_async
+from psycopg import AsyncConnection, Connection
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/rossllm")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+EMBEDDINGS_FLAG_NEGATIVE_TTL = float(os.getenv("EMBEDDINGS_FLAG_NEGATIVE_TTL", "30"))
+EMBEDDINGS_CHANNEL = "ross_embeddings"
+
+_pool: Optional[AsyncConnectionPool] = None
+_pool_lock: Optional[asyncio.Lock] = None
+
+# Per-connection setup (e.g. session temp tables) so request paths never
+# issue DDL. Register at import time, before the pool opens.
+_session_setup: List[str] = []
+
+
+def register_session_setup(sql: str) -> None:
+    if sql not in _session_setup:
+        _session_setup.append(sql)
+
+
+async def _configure(conn: AsyncConnection) -> None:
+    await register_vector_async(conn)
+    for sql in _session_setup:
+        await conn.execute(sql)
+    # The type lookup opened a transaction; the pool wants connections idle.
+    await conn.commit()
+
+
+async def get_pool() -> AsyncConnectionPool:
+    """Return the process-wide pool, opening it on first use."""
+    global _pool, _pool_lock
+    if _pool is not None:
+        return _pool
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            pool = AsyncConnectionPool(
+                DATABASE_URL,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                timeout=DB_POOL_TIMEOUT,
+                configure=_configure,
+                open=False,
+            )
+            await pool.open()
+            _pool = pool
+    return _pool
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+# ---------- sync pool (worker threads) ----------
+
+# Small blocking pool for code that already runs off the event loop, e.g.
+# the embedding cache lookups inside the inference thread.
+DB_SYNC_POOL_MAX_SIZE = int(os.getenv("DB_SYNC_POOL_MAX_SIZE", "4"))
+
+_sync_pool: Optional[ConnectionPool] = None
+_sync_pool_lock = threading.Lock()
+
+
+def _configure_sync(conn: Connection) -> None:
+    conn.autocommit = True
+    register_vector(conn)
+
+
+def get_sync_pool() -> ConnectionPool:
+    global _sync_pool
+    if _sync_pool is None:
+        with _sync_pool_lock:
+            if _sync_pool is None:
+                _sync_pool = ConnectionPool(
+                    DATABASE_URL,
+                    min_size=1,
+                    max_size=DB_SYNC_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    configure=_configure_sync,
+                    open=True,
+                )
+    return _sync_pool
+
+
+def close_sync_pool() -> None:
+    global _sync_pool
+    if _sync_pool is not None:
+        _sync_pool.close()
+        _sync_pool = None
+
+
+# ---------- cached backend checks ----------
+
+_has_embeddings: Dict[Tuple[str, Optional[str]], Tuple[bool, float]] = {}
+
+
+async def has_embeddings(model: str, tenant: Optional[str] = None) -> bool:
+    """True once ross.chunk_embeddings holds a row for `model` (in `tenant`)."""
+    key = (model, tenant)
+    cached = _has_embeddings.get(key)
+    if cached is not None:
+        present, checked_at = cached
+        if present or time.monotonic() - checked_at < EMBEDDINGS_FLAG_NEGATIVE_TTL:
+            return present
+
+    pool = await get_pool()
+    async with pool.connection() as conn, conn.cursor() as cur:
+        if tenant is None:
+            await cur.execute(
+                "SELECT EXISTS (SELECT 1 FROM ross.chunk_embeddings WHERE model = %s)",
+                (model,),
+            )
+        else:
+            await cur.execute(
+                "SELECT EXISTS (SELECT 1 FROM ross.chunk_embeddings WHERE tenant = %s AND model = %s)",
+                (tenant, model),
+            )
+        (present,) = await cur.fetchone()
+
+    _has_embeddings[key] = (bool(present), time.monotonic())
+    return bool(present)
+
+
+def invalidate_embeddings_flag(model: Optional[str] = None) -> None:
+    """Call after writing or deleting chunk embeddings."""
+    if model is None:
+        _has_embeddings.clear()
+    else:
+        for key in [k for k in _has_embeddings if k[0] == model]:
+            _has_embeddings.pop(key, None)
+
+
+def notify_embeddings_changed(conn: Connection, model: str) -> None:
+    """
+    Tell every orchestrator process that `model`'s embeddings changed. Inside
+    a transaction the notification is only delivered on commit.
+    """
+    conn.execute("SELECT pg_notify(%s, %s)", (EMBEDDINGS_CHANNEL, model))
+    invalidate_embeddings_flag(model)
+
+
+async def listen_embedding_changes(retry_seconds: float = 5.0) -> None:
+    """Invalidate the embeddings flag on EMBEDDINGS_CHANNEL notifications; runs forever."""
+    while True:
+        try:
+            conn = await AsyncConnection.connect(DATABASE_URL, autocommit=True)
+            async with conn:
+                await conn.execute(f"LISTEN {EMBEDDINGS_CHANNEL}")
+                # anything written while we were not listening
+                invalidate_embeddings_flag()
+                async for note in conn.notifies():
+                    invalidate_embeddings_flag(note.payload or None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # pragma: no cover
+            print(f"[db] embeddings listener: {e}; retrying in {retry_seconds:.0f}s")
+        await asyncio.sleep(retry_seconds)
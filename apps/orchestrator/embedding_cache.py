@@ -0,0 +1,279 @@
+"""
+Embedding cache keyed by (model tag, sha256(text)).
+
+Two tiers, checked in order before any inference runs:
+  1) in-process LRU of EMBED_CACHE_SIZE vectors
+  2) durable Postgres table ross.embedding_cache (EMBED_CACHE_DURABLE=1),
+     shared by every orchestrator/worker process; created by migration
+     003_embedding_cache
+
+Misses are embedded by the caller and written back to both tiers. The
+durable tier is best-effort and runs on its own small executor, never on
+the inference thread: a lookup is waited on for at most
+EMBED_CACHE_DURABLE_WAIT_MS (a late answer still lands in the LRU), writes
+are fire-and-forget, and pool checkout gives up after
+EMBED_CACHE_POOL_TIMEOUT seconds. If the DB is unreachable the tier is
+skipped for EMBED_CACHE_RETRY_SECONDS and inference carries on.
+
+Durable rows carry last_used (refreshed by a hit at most once a day).
+`prune()`, run by main.py every EMBED_CACHE_PRUNE_INTERVAL seconds, deletes
+rows unused for EMBED_CACHE_TTL_DAYS and, with EMBED_CACHE_MAX_ROWS set,
+the least recently used rows beyond that many, so every distinct query
+string does not stay in the table forever.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "20000"))
+EMBED_CACHE_DURABLE = os.getenv("EMBED_CACHE_DURABLE", "1") in ("1", "true", "True")
+EMBED_CACHE_RETRY_SECONDS = float(os.getenv("EMBED_CACHE_RETRY_SECONDS", "60"))
+EMBED_CACHE_DURABLE_WAIT_MS = float(os.getenv("EMBED_CACHE_DURABLE_WAIT_MS", "50"))
+EMBED_CACHE_POOL_TIMEOUT = float(os.getenv("EMBED_CACHE_POOL_TIMEOUT", "0.5"))
+EMBED_CACHE_MAX_PENDING_WRITES = int(os.getenv("EMBED_CACHE_MAX_PENDING_WRITES", "64"))
+EMBED_CACHE_TTL_DAYS = float(os.getenv("EMBED_CACHE_TTL_DAYS", "30"))
+EMBED_CACHE_MAX_ROWS = int(os.getenv("EMBED_CACHE_MAX_ROWS", "0"))  # 0 = no cap
+EMBED_CACHE_PRUNE_INTERVAL = float(os.getenv("EMBED_CACHE_PRUNE_INTERVAL", "3600"))
+_PRUNE_BATCH = 10_000
+
+# Hits refresh last_used in the same round trip, only when it is a day old.
+DURABLE_GET_SQL = """
+WITH hit AS (
+  SELECT content_hash, embedding, last_used FROM ross.embedding_cache
+  WHERE model = %(model)s AND content_hash = ANY(%(hashes)s)
+), touch AS (
+  UPDATE ross.embedding_cache c SET last_used = now()
+  FROM hit
+  WHERE c.model = %(model)s AND c.content_hash = hit.content_hash
+    AND hit.last_used < now() - interval '1 day'
+)
+SELECT content_hash, embedding FROM hit;
+"""
+
+PRUNE_AGE_SQL = """
+DELETE FROM ross.embedding_cache WHERE ctid = ANY(ARRAY(
+  SELECT ctid FROM ross.embedding_cache
+  WHERE last_used < now() - make_interval(days => %(days)s)
+  LIMIT %(batch)s
+));
+"""
+
+PRUNE_SIZE_SQL = """
+DELETE FROM ross.embedding_cache WHERE ctid = ANY(ARRAY(
+  SELECT ctid FROM ross.embedding_cache
+  ORDER BY last_used
+  LIMIT %(excess)s
+));
+"""
+
+# Durable-tier round trips get their own threads so a slow or unreachable
+# DB never holds up the embedding executor.
+_durable_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="embed-cache")
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, size: int = EMBED_CACHE_SIZE, durable: bool = EMBED_CACHE_DURABLE) -> None:
+        self.size = size
+        self.durable = durable
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._durable_down_until = 0.0
+        self._pending_writes = 0
+        self.stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "durable_hits": 0,
+            "misses": 0,
+            "durable_errors": 0,
+            "durable_timeouts": 0,
+            "durable_writes_dropped": 0,
+            "durable_pruned": 0,
+        }
+
+    # ---------- durable tier ----------
+
+    def _durable_ok(self) -> bool:
+        return self.durable and time.monotonic() >= self._durable_down_until
+
+    def _durable_failed(self) -> None:
+        self.stats["durable_errors"] += 1
+        self._durable_down_until = time.monotonic() + EMBED_CACHE_RETRY_SECONDS
+
+    def _durable_get(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        from db import get_sync_pool
+
+        with get_sync_pool().connection(timeout=EMBED_CACHE_POOL_TIMEOUT) as conn:
+            rows = conn.execute(DURABLE_GET_SQL, {"model": model, "hashes": hashes}).fetchall()
+        return {h: np.asarray(v, dtype=np.float32) for h, v in rows}
+
+    def _durable_put(self, model: str, items: List[Tuple[str, np.ndarray]]) -> None:
+        from db import get_sync_pool
+
+        with get_sync_pool().connection(timeout=EMBED_CACHE_POOL_TIMEOUT) as conn:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "INSERT INTO ross.embedding_cache (model, content_hash, embedding) "
+                    "VALUES (%s, %s, %s) ON CONFLICT DO NOTHING",
+                    [(model, h, v) for h, v in items],
+                )
+
+    def prune(self) -> int:
+        """Delete expired rows, then the least recently used beyond EMBED_CACHE_MAX_ROWS."""
+        if not self.durable:
+            return 0
+        from db import get_sync_pool
+
+        deleted = 0
+        with get_sync_pool().connection() as conn:
+            while EMBED_CACHE_TTL_DAYS > 0:
+                n = conn.execute(PRUNE_AGE_SQL, {"days": EMBED_CACHE_TTL_DAYS, "batch": _PRUNE_BATCH}).rowcount
+                deleted += n
+                if n < _PRUNE_BATCH:
+                    break
+            if EMBED_CACHE_MAX_ROWS > 0:
+                # planner estimate, no count(*) scan
+                (rows,) = conn.execute(
+                    "SELECT GREATEST(reltuples, 0)::bigint FROM pg_class "
+                    "WHERE oid = 'ross.embedding_cache'::regclass"
+                ).fetchone()
+                excess = rows - EMBED_CACHE_MAX_ROWS
+                while excess > 0:
+                    n = conn.execute(PRUNE_SIZE_SQL, {"excess": min(excess, _PRUNE_BATCH)}).rowcount
+                    deleted += n
+                    excess -= _PRUNE_BATCH
+                    if not n:
+                        break
+        self.stats["durable_pruned"] += deleted
+        return deleted
+
+    def _submit_get(self, model: str, hashes: List[str]) -> Optional[Future]:
+        if not hashes or not self._durable_ok():
+            return None
+        fut = _durable_executor.submit(self._durable_get, model, hashes)
+        fut.add_done_callback(lambda f: self._durable_got(model, f))
+        return fut
+
+    def _durable_got(self, model: str, fut: Future) -> None:
+        # Runs even when the caller stopped waiting, so late hits still warm the LRU.
+        if fut.cancelled():
+            return
+        try:
+            durable = fut.result()
+        except Exception:
+            self._durable_failed()
+            return
+        self._remember(model, durable.items())
+
+    def _write_behind(self, model: str, items: List[Tuple[str, np.ndarray]]) -> None:
+        try:
+            self._durable_put(model, items)
+        except Exception:
+            self._durable_failed()
+        finally:
+            with self._lock:
+                self._pending_writes -= 1
+
+    # ---------- public API ----------
+
+    def _memory_get(self, model: str, hashes: List[str]) -> Tuple[Dict[str, np.ndarray], List[str]]:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for h in hashes:
+                v = self._lru.get((model, h))
+                if v is not None:
+                    self._lru.move_to_end((model, h))
+                    found[h] = v
+        self.stats["memory_hits"] += len(found)
+        return found, [h for h in dict.fromkeys(hashes) if h not in found]
+
+    def _merge(
+        self, found: Dict[str, np.ndarray], missing: List[str], durable: Dict[str, np.ndarray]
+    ) -> Dict[str, np.ndarray]:
+        self.stats["durable_hits"] += len(durable)
+        found.update(durable)
+        self.stats["misses"] += len([h for h in missing if h not in found])
+        return found
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found, missing = self._memory_get(model, hashes)
+        fut = self._submit_get(model, missing)
+        durable: Dict[str, np.ndarray] = {}
+        if fut is not None:
+            try:
+                durable = fut.result(timeout=EMBED_CACHE_DURABLE_WAIT_MS / 1000.0)
+            except concurrent.futures.TimeoutError:
+                self.stats["durable_timeouts"] += 1
+            except Exception:
+                pass  # counted by _durable_got
+        return self._merge(found, missing, durable)
+
+    async def aget_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """get_many() for the event loop: the durable lookup is awaited, not blocked on."""
+        found, missing = self._memory_get(model, hashes)
+        fut = self._submit_get(model, missing)
+        durable: Dict[str, np.ndarray] = {}
+        if fut is not None:
+            try:
+                durable = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(fut)), EMBED_CACHE_DURABLE_WAIT_MS / 1000.0
+                )
+            except asyncio.TimeoutError:
+                self.stats["durable_timeouts"] += 1
+            except Exception:
+                pass
+        return self._merge(found, missing, durable)
+
+    def put_many(self, model: str, items: List[Tuple[str, np.ndarray]]) -> None:
+        if not items:
+            return
+        self._remember(model, items)
+        if not self._durable_ok():
+            return
+        with self._lock:
+            if self._pending_writes >= EMBED_CACHE_MAX_PENDING_WRITES:
+                self.stats["durable_writes_dropped"] += 1
+                return
+            self._pending_writes += 1
+        _durable_executor.submit(self._write_behind, model, list(items))
+
+    def _remember(self, model: str, items) -> None:
+        with self._lock:
+            for h, v in items:
+                self._lru[(model, h)] = v
+                self._lru.move_to_end((model, h))
+            while len(self._lru) > self.size:
+                self._lru.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._lru)
+        return {
+            "entries": entries,
+            "capacity": self.size,
+            "durable": self.durable,
+            "durable_available": self._durable_ok(),
+            "durable_pending_writes": self._pending_writes,
+            **self.stats,
+        }
+
+
+_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache()
+    return _cache
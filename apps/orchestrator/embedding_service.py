@@ -0,0 +1,322 @@
+"""
+The orchestrator's one embedding service.
+
+Every caller (retrieval, /ingest, /retrieve/vector, the response cache)
+goes through here, so each SentenceTransformer is loaded at most once per
+process no matter how many modules ask for it.
+
+Config:
+  EMBED_MODEL_NAME      HF model name (falls back to HF_EMBED_MODEL)
+  EMBED_MODEL_TAG       value stored in ross.chunk_embeddings.model
+  EMBED_MODELS          extra models served side by side during model
+                        migrations, as "tag=hf/name,tag2=hf/name2"
+  EMBED_STORAGE         ANN index format per model tag, as
+                        "tag=halfvec,tag2=binary" (default: vector)
+  EMBED_BATCH_SIZE      encode() batch size
+  EMBED_MAX_SEQ_LENGTH  truncate inputs to N tokens (0 = model default)
+  EMBED_WORKERS         threads in the dedicated inference executor
+  EMBED_BATCH_WAIT_MS   micro-batcher: max time to wait for more callers
+  EMBED_BATCH_MAX_ITEMS micro-batcher: flush once this many texts queued
+
+Async callers share a micro-batcher (`aembed`), which coalesces texts from
+concurrent requests into one encode() so CPU inference doesn't run at
+batch size 1 under load.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import APIRouter
+
+from embedding_cache import content_hash, get_embedding_cache
+from histogram import LATENCY_BUCKETS_MS, SIZE_BUCKETS, Histogram
+import telemetry
+
+EMBED_MODEL_NAME = (
+    os.getenv("EMBED_MODEL_NAME")
+    or os.getenv("HF_EMBED_MODEL")
+    or "sentence-transformers/all-MiniLM-L6-v2"
+)
+EMBED_MODEL_TAG = os.getenv("EMBED_MODEL_TAG", "all-MiniLM-L6-v2")
+EMBED_MODELS = os.getenv("EMBED_MODELS", "")
+EMBED_STORAGE = os.getenv("EMBED_STORAGE", "")
+STORAGE_FORMATS = ("vector", "halfvec", "binary")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_MAX_SEQ_LENGTH = int(os.getenv("EMBED_MAX_SEQ_LENGTH", "0"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", str(EMBED_BATCH_SIZE)))
+
+router = APIRouter(prefix="/embeddings", tags=["embeddings"])
+
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+# Model inference never runs on the event loop; it gets its own small pool
+# so a burst of encodes cannot starve FastAPI's default threadpool.
+_executor = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+
+
+def registered_models() -> Dict[str, str]:
+    """Model tag -> HF model name for every model that may hold embeddings."""
+    models = {EMBED_MODEL_TAG: EMBED_MODEL_NAME}
+    for item in EMBED_MODELS.split(","):
+        tag, sep, name = item.strip().partition("=")
+        if sep and tag.strip() and name.strip():
+            models[tag.strip()] = name.strip()
+    return models
+
+
+def model_name_for_tag(tag: Optional[str]) -> str:
+    """HF model name for a registered tag; KeyError for unknown tags."""
+    if not tag:
+        return EMBED_MODEL_NAME
+    return registered_models()[tag]
+
+
+def storage_format(tag: Optional[str] = None) -> str:
+    """
+    How `tag`'s vectors are indexed: full float32 "vector", "halfvec"
+    (float16, 2x smaller) or "binary" (1 bit per dim, 32x smaller).
+    Quantized formats re-score a shortlist with the float32 column.
+    """
+    tag = tag or EMBED_MODEL_TAG
+    for item in EMBED_STORAGE.split(","):
+        key, sep, fmt = item.strip().partition("=")
+        if sep and key.strip() == tag and fmt.strip() in STORAGE_FORMATS:
+            return fmt.strip()
+    return "vector"
+
+
+def get_model(model_name: Optional[str] = None):
+    """Return the shared SentenceTransformer for `model_name`, loading it once."""
+    name = model_name or EMBED_MODEL_NAME
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _models_lock:
+        model = _models.get(name)
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+
+            # first call will download weights if not present
+            model = SentenceTransformer(name)
+            if EMBED_MAX_SEQ_LENGTH > 0:
+                model.max_seq_length = EMBED_MAX_SEQ_LENGTH
+            _models[name] = model
+    return model
+
+
+def cache_tag(model_name: Optional[str] = None) -> str:
+    """Model identity used as the embedding-cache key prefix."""
+    name = model_name or EMBED_MODEL_NAME
+    tags = [t for t, n in registered_models().items() if n == name]
+    tag = tags[0] if tags else name
+    if EMBED_MAX_SEQ_LENGTH > 0:
+        # truncation changes the vectors, so it is part of the identity
+        tag = f"{tag}@{EMBED_MAX_SEQ_LENGTH}"
+    return tag
+
+
+def _encode(texts: List[str], model_name: Optional[str], batch_size: Optional[int]) -> np.ndarray:
+    m = get_model(model_name)
+    vecs = m.encode(
+        texts,
+        batch_size=batch_size or EMBED_BATCH_SIZE,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+    )
+    return np.asarray(vecs, dtype=np.float32)
+
+
+def embed(
+    texts: List[str],
+    model_name: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    cached: Optional[Dict[str, np.ndarray]] = None,
+) -> np.ndarray:
+    """
+    Encode `texts` in batches; returns an (n, dim) float32 array of unit vectors.
+
+    Texts already in the embedding cache (memory or durable tier) skip
+    inference; duplicates within one call are encoded once. `cached` is a
+    lookup the caller already did (content hash -> vector), which skips it here.
+    """
+    if not texts:
+        return np.zeros((0, dimension(model_name)), dtype=np.float32)
+
+    cache = get_embedding_cache()
+    tag = cache_tag(model_name)
+    hashes = [content_hash(t) for t in texts]
+    found = dict(cached) if cached is not None else cache.get_many(tag, hashes)
+
+    todo = {h: t for h, t in zip(hashes, texts) if h not in found}
+    if todo:
+        vecs = _encode(list(todo.values()), model_name, batch_size)
+        fresh = list(zip(todo.keys(), vecs))
+        cache.put_many(tag, fresh)
+        found.update(fresh)
+
+    return np.stack([found[h] for h in hashes]).astype(np.float32, copy=False)
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent embed requests into one encode() call.
+
+    Callers enqueue their texts and await a future. A single consumer task
+    takes the first waiting request, keeps collecting for up to
+    `max_wait_ms` or until `max_items` texts are queued, runs one encode on
+    the inference executor, and slices the result back to each caller.
+    Requests that arrive while an encode is running form the next batch.
+    """
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        max_wait_ms: float = EMBED_BATCH_WAIT_MS,
+        max_items: int = EMBED_BATCH_MAX_ITEMS,
+    ) -> None:
+        self.model_name = model_name
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_items = max_items
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batch_sizes = Histogram(SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.batches = 0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        assert self._queue is not None
+        return self._queue
+
+    async def submit(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return embed(texts, self.model_name)
+        queue = self._ensure_started()
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        await queue.put((texts, fut, time.perf_counter()))
+        return await fut
+
+    async def _collect(self, queue: asyncio.Queue) -> List[Tuple[List[str], asyncio.Future, float]]:
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        n = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while n < self.max_items:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            n += len(item[0])
+        return batch
+
+    async def _run(self) -> None:
+        queue = self._queue
+        assert queue is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect(queue)
+            started = time.perf_counter()
+            texts: List[str] = []
+            for item_texts, _, enqueued in batch:
+                texts.extend(item_texts)
+                self.queue_wait_ms.observe((started - enqueued) * 1000.0)
+            self.batch_sizes.observe(len(texts))
+            self.batches += 1
+
+            try:
+                # cache lookup happens here, so the inference executor only encodes
+                cached = await get_embedding_cache().aget_many(
+                    cache_tag(self.model_name), [content_hash(t) for t in texts]
+                )
+                vecs = await loop.run_in_executor(
+                    _executor, functools.partial(embed, texts, self.model_name, cached=cached)
+                )
+            except Exception as e:
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, fut, _ in batch:
+                if not fut.done():
+                    fut.set_result(vecs[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name or EMBED_MODEL_NAME,
+            "batches": self.batches,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_items": self.max_items,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+
+_batchers: Dict[str, MicroBatcher] = {}
+
+
+def get_batcher(model_name: Optional[str] = None) -> MicroBatcher:
+    name = model_name or EMBED_MODEL_NAME
+    batcher = _batchers.get(name)
+    if batcher is None:
+        batcher = _batchers[name] = MicroBatcher(name)
+    return batcher
+
+
+async def aembed(texts: List[str], model_name: Optional[str] = None) -> np.ndarray:
+    """Embed via the shared micro-batcher; safe to call from many requests at once."""
+    with telemetry.stage("embed", texts=len(texts)):
+        return await get_batcher(model_name).submit(texts)
+
+
+async def aclose() -> None:
+    for batcher in list(_batchers.values()):
+        await batcher.aclose()
+
+
+def dimension(model_name: Optional[str] = None) -> int:
+    return int(get_model(model_name).get_sentence_embedding_dimension())
+
+
+def loaded_models() -> List[str]:
+    return list(_models.keys())
+
+
+@router.get("/stats")
+def embedding_stats() -> Dict[str, Any]:
+    return {
+        "ok": True,
+        "loaded_models": loaded_models(),
+        "batchers": [b.stats() for b in _batchers.values()],
+        "cache": get_embedding_cache().snapshot(),
+    }
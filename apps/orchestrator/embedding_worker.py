@@ -0,0 +1,346 @@
+"""
+Background embedding worker: drains ross.embedding_jobs.
+
+Run any number of these next to the orchestrator (same image):
+
+    python embedding_worker.py                   # loop forever
+    python embedding_worker.py --once            # drain what's pending, then exit
+    python embedding_worker.py --enqueue-missing # queue docs with no embeddings yet
+
+Each loop claims up to EMBED_JOB_BATCH jobs with FOR UPDATE SKIP LOCKED,
+so workers never step on each other. The claimed documents are chunked,
+all chunks are embedded in one large batch (embedding_service, so the
+embedding cache applies), and chunks + embeddings are bulk-written
+per job in one transaction. Failures go back to 'pending' until
+max_attempts, then to 'dead'. Jobs whose worker died mid-flight are
+reclaimed after EMBED_JOB_STALE_SECONDS.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict, List, Optional
+
+import psycopg
+from pgvector.psycopg import register_vector
+from psycopg.rows import dict_row
+
+import embedding_service
+from db import DATABASE_URL, notify_embeddings_changed
+from embedding_cache import content_hash
+
+WORKER_ID = os.getenv("EMBED_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+EMBED_JOB_BATCH = int(os.getenv("EMBED_JOB_BATCH", "16"))
+EMBED_WORKER_POLL_SECONDS = float(os.getenv("EMBED_WORKER_POLL_SECONDS", "2"))
+EMBED_WORKER_BATCH_SIZE = int(os.getenv("EMBED_WORKER_BATCH_SIZE", "256"))
+EMBED_JOB_STALE_SECONDS = int(os.getenv("EMBED_JOB_STALE_SECONDS", "900"))
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
+
+_stop = False
+
+
+def _log(msg: str) -> None:
+    print(f"[embedding_worker {WORKER_ID}] {msg}", flush=True)
+
+
+def chunk_text(text: str, max_chars: int = CHUNK_MAX_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Split text into <= max_chars pieces with `overlap` chars of context.
+
+    Cuts prefer a paragraph break, then a line break, then a sentence end,
+    then whitespace, searched in the back half of the window.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    chunks: List[str] = []
+    n = len(text)
+    start = 0
+    while start < n:
+        end = min(start + max_chars, n)
+        if end < n:
+            for sep in ("\n\n", "\n", ". ", " "):
+                i = text.rfind(sep, start + max_chars // 2, end)
+                if i != -1:
+                    end = i + len(sep)
+                    break
+        piece = text[start:end].strip()
+        if piece:
+            chunks.append(piece)
+        if end >= n:
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def accepted_models() -> List[str]:
+    return list(embedding_service.registered_models())
+
+
+# ---------- SQL ----------
+
+CLAIM_SQL = """
+UPDATE ross.embedding_jobs j
+SET status = 'claimed',
+    claimed_by = %(worker)s,
+    claimed_at = now(),
+    updated_at = now(),
+    attempts = j.attempts + 1
+WHERE j.id IN (
+  SELECT id
+  FROM ross.embedding_jobs
+  WHERE model = ANY(%(models)s)
+    AND (
+      status = 'pending'
+      OR (status IN ('claimed', 'processing')
+          AND claimed_at < now() - make_interval(secs => %(stale)s))
+    )
+  ORDER BY created_at
+  FOR UPDATE SKIP LOCKED
+  LIMIT %(n)s
+)
+RETURNING j.id, j.document_id, j.model, j.attempts, j.max_attempts;
+"""
+
+UPSERT_CHUNKS_SQL = """
+INSERT INTO ross.document_chunks (document_id, chunk_index, content, content_hash)
+SELECT %(doc)s, u.idx, u.content, u.hash
+FROM unnest(%(idx)s::int[], %(content)s::text[], %(hash)s::text[]) AS u(idx, content, hash)
+ON CONFLICT (document_id, chunk_index) DO UPDATE
+  SET content = EXCLUDED.content,
+      content_hash = EXCLUDED.content_hash
+RETURNING id, chunk_index;
+"""
+
+UPSERT_EMBEDDING_SQL = """
+INSERT INTO ross.chunk_embeddings (tenant, chunk_id, model, embedding_384)
+VALUES (%s, %s, %s, %s)
+ON CONFLICT (tenant, chunk_id, model) DO UPDATE
+  SET embedding_384 = EXCLUDED.embedding_384,
+      created_at = now();
+"""
+
+FAIL_SQL = """
+UPDATE ross.embedding_jobs
+SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'pending' END,
+    last_error = %(err)s,
+    error = %(err)s,
+    claimed_by = NULL,
+    claimed_at = NULL,
+    updated_at = now()
+WHERE id = ANY(%(ids)s)
+RETURNING id, status;
+"""
+
+ENQUEUE_MISSING_SQL = """
+INSERT INTO ross.embedding_jobs (document_id, model)
+SELECT d.id, %(model)s
+FROM ross.documents d
+WHERE NOT EXISTS (
+    SELECT 1
+    FROM ross.document_chunks c
+    JOIN ross.chunk_embeddings e
+      ON e.tenant = d.tenant AND e.chunk_id = c.id AND e.model = %(model)s
+    WHERE c.document_id = d.id
+  )
+  AND NOT EXISTS (
+    SELECT 1 FROM ross.embedding_jobs j
+    WHERE j.document_id = d.id AND j.model = %(model)s
+      AND j.status IN ('pending', 'claimed', 'processing')
+  );
+"""
+
+
+def connect() -> psycopg.Connection:
+    conn = psycopg.connect(DATABASE_URL, autocommit=True)
+    register_vector(conn)
+    return conn
+
+
+def enqueue_documents(conn: psycopg.Connection, document_ids: List[int], model: Optional[str] = None) -> int:
+    """Queue embedding jobs; call this from ingestion paths instead of embedding inline."""
+    if not document_ids:
+        return 0
+    with conn.cursor() as cur:
+        cur.executemany(
+            "INSERT INTO ross.embedding_jobs (document_id, model) VALUES (%s, %s)",
+            [(d, model or embedding_service.EMBED_MODEL_TAG) for d in document_ids],
+        )
+    return len(document_ids)
+
+
+def enqueue_missing(conn: psycopg.Connection) -> int:
+    total = 0
+    for model in accepted_models():
+        cur = conn.execute(ENQUEUE_MISSING_SQL, {"model": model})
+        total += cur.rowcount
+    return total
+
+
+# ---------- processing ----------
+
+def claim(conn: psycopg.Connection) -> List[Dict[str, Any]]:
+    with conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(CLAIM_SQL, {
+            "worker": WORKER_ID,
+            "models": accepted_models(),
+            "stale": EMBED_JOB_STALE_SECONDS,
+            "n": EMBED_JOB_BATCH,
+        })
+        jobs = cur.fetchall()
+
+    # Reclaimed jobs can come back already past their budget.
+    over = [j["id"] for j in jobs if j["attempts"] > j["max_attempts"]]
+    if over:
+        fail(conn, over, "exceeded max_attempts (reclaimed after stale claim)")
+    return [j for j in jobs if j["id"] not in over]
+
+
+def fail(conn: psycopg.Connection, job_ids: List[int], error: str) -> None:
+    rows = conn.execute(FAIL_SQL, {"ids": job_ids, "err": error[:2000]}).fetchall()
+    for job_id, status in rows:
+        _log(f"job {job_id} failed -> {status}: {error[:200]}")
+
+
+def process(conn: psycopg.Connection, jobs: List[Dict[str, Any]]) -> int:
+    ids = [j["id"] for j in jobs]
+    conn.execute(
+        "UPDATE ross.embedding_jobs SET status = 'processing', updated_at = now() WHERE id = ANY(%s)",
+        (ids,),
+    )
+
+    docs = {
+        r[0]: (r[1], r[2])
+        for r in conn.execute(
+            "SELECT id, content, tenant FROM ross.documents WHERE id = ANY(%s)",
+            ([j["document_id"] for j in jobs],),
+        ).fetchall()
+    }
+
+    # Chunk everything first so the whole claim is embedded in one batch per model.
+    plans: List[Dict[str, Any]] = []
+    for job in jobs:
+        if job["document_id"] not in docs:
+            fail(conn, [job["id"]], "document not found")
+            continue
+        content, tenant = docs[job["document_id"]]
+        plans.append({"job": job, "tenant": tenant, "chunks": chunk_text(content)})
+
+    by_model: Dict[str, List[Dict[str, Any]]] = {}
+    for plan in plans:
+        by_model.setdefault(plan["job"]["model"], []).append(plan)
+
+    done = 0
+    for model, model_plans in by_model.items():
+        texts = [c for p in model_plans for c in p["chunks"]]
+        try:
+            vecs = embedding_service.embed(
+                texts,
+                model_name=embedding_service.model_name_for_tag(model),
+                batch_size=EMBED_WORKER_BATCH_SIZE,
+            )
+        except Exception as e:
+            fail(conn, [p["job"]["id"] for p in model_plans], f"embed failed: {e!r}")
+            continue
+
+        offset = 0
+        for plan in model_plans:
+            job, chunks = plan["job"], plan["chunks"]
+            job_vecs = vecs[offset:offset + len(chunks)]
+            offset += len(chunks)
+            try:
+                write_job(conn, job, plan["tenant"], chunks, job_vecs)
+                done += 1
+            except Exception as e:
+                fail(conn, [job["id"]], f"write failed: {e!r}")
+    return done
+
+
+def write_job(conn: psycopg.Connection, job: Dict[str, Any], tenant: str, chunks: List[str], vecs) -> None:
+    doc_id = job["document_id"]
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute(UPSERT_CHUNKS_SQL, {
+            "doc": doc_id,
+            "idx": list(range(len(chunks))),
+            "content": chunks,
+            "hash": [content_hash(c) for c in chunks],
+        })
+        chunk_ids = {idx: cid for cid, idx in cur.fetchall()}
+        # Drop chunks left over from a longer previous version of the document.
+        cur.execute(
+            "DELETE FROM ross.document_chunks WHERE document_id = %s AND chunk_index >= %s",
+            (doc_id, len(chunks)),
+        )
+        # A document whose tenant changed must not stay searchable in the old one.
+        cur.execute(
+            "DELETE FROM ross.chunk_embeddings WHERE chunk_id = ANY(%s) AND tenant <> %s",
+            (list(chunk_ids.values()), tenant),
+        )
+        cur.executemany(
+            UPSERT_EMBEDDING_SQL,
+            [(tenant, chunk_ids[i], job["model"], vecs[i]) for i in range(len(chunks))],
+        )
+        # delivered on commit; drops the orchestrators' cached has-embeddings flag
+        notify_embeddings_changed(conn, job["model"])
+        cur.execute(
+            """
+            UPDATE ross.embedding_jobs
+            SET status = 'completed', error = NULL, updated_at = now()
+            WHERE id = %s
+            """,
+            (job["id"],),
+        )
+
+
+def run(once: bool = False) -> None:
+    _log(f"starting; models={accepted_models()} batch={EMBED_JOB_BATCH}")
+    conn: Optional[psycopg.Connection] = None
+    while not _stop:
+        try:
+            if conn is None or conn.closed:
+                conn = connect()
+            jobs = claim(conn)
+            if not jobs:
+                if once:
+                    break
+                time.sleep(EMBED_WORKER_POLL_SECONDS)
+                continue
+            started = time.time()
+            done = process(conn, jobs)
+            _log(f"completed {done}/{len(jobs)} jobs in {int((time.time() - started) * 1000)} ms")
+        except psycopg.OperationalError as e:
+            _log(f"db error, reconnecting: {e}")
+            conn = None
+            time.sleep(EMBED_WORKER_POLL_SECONDS)
+    if conn is not None:
+        conn.close()
+    _log("stopped")
+
+
+def _handle_stop(signum, frame) -> None:  # pragma: no cover
+    global _stop
+    _stop = True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Drain ross.embedding_jobs")
+    parser.add_argument("--once", action="store_true", help="exit when no jobs are pending")
+    parser.add_argument("--enqueue-missing", action="store_true", help="queue jobs for documents without embeddings")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, _handle_stop)
+    signal.signal(signal.SIGINT, _handle_stop)
+
+    if args.enqueue_missing:
+        with connect() as conn:
+            _log(f"enqueued {enqueue_missing(conn)} jobs")
+        return
+    run(once=args.once)
+
+
+if __name__ == "__main__":
+    main()
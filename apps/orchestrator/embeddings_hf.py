@@ -1,21 +1,12 @@
-import os
 from typing import List
 
-_MODEL = None
+import embedding_service
+
+# Thin compatibility layer: the model itself lives in embedding_service.
 
-def _get_model():
-    global _MODEL
-    if _MODEL is None:
-        from sentence_transformers import SentenceTransformer
-        name = os.getenv("HF_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-        _MODEL = SentenceTransformer(name)
-    return _MODEL
 
 def embed_texts(texts: List[str]) -> List[List[float]]:
-    m = _get_model()
-    vecs = m.encode(texts, normalize_embeddings=True)
-    return [v.tolist() for v in vecs]
+    return embedding_service.embed(texts).tolist()
 
 def embedding_dim() -> int:
-    m = _get_model()
-    return int(m.get_sentence_embedding_dimension())
+    return embedding_service.dimension()
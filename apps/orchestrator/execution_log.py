@@ -1,43 +1,296 @@
 from __future__ import annotations
 
+import bisect
 import json
+import os
+import queue
 import sqlite3
 import threading
 import time
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 
-# Simple SQLite-backed execution logger
+import telemetry
+from histogram import LATENCY_BUCKETS_MS, Histogram
+
+# SQLite-backed execution logger.
+#
+# log_event() only stamps the row and appends it to a bounded in-memory
+# queue; one background thread owns a long-lived WAL-mode connection and
+# writes queued rows in batched transactions (every EXEC_LOG_FLUSH_MS or
+# EXEC_LOG_BATCH rows, whichever comes first). A full queue drops the row
+# and counts it instead of blocking the caller (or the event loop).
+#
+# The same transaction folds each batch into execution_log_rollup: one row
+# per (UTC minute, endpoint) with count/errors/sum/min/max and latency
+# histogram buckets (histogram.LATENCY_BUCKETS_MS), so /metrics/summary
+# reads a few rows per minute of window instead of scanning the raw log.
+#
+# Request traces (telemetry.py) go through the same writer into
+# execution_trace: one row per request hop, spans as a compact JSON array,
+# indexed by trace_id for /logs/trace/{id}.
 DB_PATH = Path(__file__).resolve().parent.parent.parent / "data" / "execution_log.sqlite"
-_DB_LOCK = threading.Lock()
+EXEC_LOG_QUEUE_MAX = int(os.getenv("EXEC_LOG_QUEUE_MAX", "10000"))
+EXEC_LOG_BATCH = int(os.getenv("EXEC_LOG_BATCH", "256"))
+EXEC_LOG_FLUSH_MS = float(os.getenv("EXEC_LOG_FLUSH_MS", "200"))
 
 router = APIRouter(prefix="/logs", tags=["logs"])
 
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS execution_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    latency_ms INTEGER NOT NULL,
+    payload TEXT
+)
+"""
+
+INSERT_SQL = """
+INSERT INTO execution_log (ts, endpoint, status, latency_ms, payload)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+TRACE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS execution_trace (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    trace_id TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    started_at REAL NOT NULL,         -- unix epoch seconds
+    endpoint TEXT NOT NULL,           -- "METHOD /route"
+    status INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    spans TEXT NOT NULL,              -- JSON [[name, start_ms, dur_ms, parent, attrs], ...]
+    dropped_spans INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+TRACE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS execution_trace_trace_id ON execution_trace (trace_id)"
+
+TRACE_INSERT_SQL = """
+INSERT INTO execution_trace (trace_id, ts, started_at, endpoint, status, latency_ms, spans, dropped_spans)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# b0..bN: counts per LATENCY_BUCKETS_MS bucket, last one is +Inf
+BUCKET_COLUMNS = [f"b{i}" for i in range(len(LATENCY_BUCKETS_MS) + 1)]
+
+ROLLUP_SCHEMA_SQL = f"""
+CREATE TABLE IF NOT EXISTS execution_log_rollup (
+    minute INTEGER NOT NULL,          -- unix epoch // 60 (UTC)
+    endpoint TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    sum_ms REAL NOT NULL,
+    min_ms REAL NOT NULL,
+    max_ms REAL NOT NULL,
+    {", ".join(f"{c} INTEGER NOT NULL DEFAULT 0" for c in BUCKET_COLUMNS)},
+    PRIMARY KEY (minute, endpoint)
+)
+"""
+
+ROLLUP_UPSERT_SQL = f"""
+INSERT INTO execution_log_rollup
+    (minute, endpoint, count, errors, sum_ms, min_ms, max_ms, {", ".join(BUCKET_COLUMNS)})
+VALUES ({", ".join(["?"] * (7 + len(BUCKET_COLUMNS)))})
+ON CONFLICT (minute, endpoint) DO UPDATE SET
+    count = count + excluded.count,
+    errors = errors + excluded.errors,
+    sum_ms = sum_ms + excluded.sum_ms,
+    min_ms = MIN(min_ms, excluded.min_ms),
+    max_ms = MAX(max_ms, excluded.max_ms),
+    {", ".join(f"{c} = {c} + excluded.{c}" for c in BUCKET_COLUMNS)}
+"""
+
+
+def rollup_rows(rows: List[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+    """Aggregate queued rows (epoch, ts, endpoint, status, latency, payload) per minute+endpoint."""
+    agg: Dict[Tuple[int, str], List[Any]] = {}
+    for epoch, _ts, endpoint, status, latency, _payload in rows:
+        key = (int(epoch // 60), endpoint)
+        a = agg.get(key)
+        if a is None:
+            a = agg[key] = [0, 0, 0.0, float(latency), float(latency)] + [0] * len(BUCKET_COLUMNS)
+        a[0] += 1
+        a[1] += int(status) >= 400
+        a[2] += latency
+        a[3] = min(a[3], latency)
+        a[4] = max(a[4], latency)
+        # same bucketing as Histogram.bucket_index: first bound >= value
+        a[5 + bisect.bisect_left(LATENCY_BUCKETS_MS, latency)] += 1
+    return [(minute, endpoint, *a) for (minute, endpoint), a in agg.items()]
+
+
+def connect(readonly: bool = False) -> sqlite3.Connection:
+    """Connection to the log DB; WAL lets readers run while the writer commits."""
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=5.0)
+    if not readonly:
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: durable across app crashes, one fsync per checkpoint
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _backfill_rollups(conn: sqlite3.Connection) -> None:
+    """One-time: fold rows logged before the rollup table existed."""
+    cur = conn.execute("SELECT ts, endpoint, status, latency_ms FROM execution_log")
+    while True:
+        chunk = cur.fetchmany(5000)
+        if not chunk:
+            break
+        rows = []
+        for ts, endpoint, status, latency in chunk:
+            try:
+                epoch = time.mktime(time.strptime(ts, "%Y-%m-%d %H:%M:%S"))
+            except Exception:
+                continue
+            rows.append((epoch, ts, endpoint, status, latency, None))
+        conn.executemany(ROLLUP_UPSERT_SQL, rollup_rows(rows))
+
 
 def _init_db() -> None:
-    with _DB_LOCK:
-        conn = sqlite3.connect(DB_PATH)
+    conn = connect()
+    try:
+        with conn:
+            conn.execute(SCHEMA_SQL)
+            new_rollups = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'execution_log_rollup'"
+            ).fetchone() is None
+            conn.execute(ROLLUP_SCHEMA_SQL)
+            if new_rollups:
+                _backfill_rollups(conn)
+            conn.execute(TRACE_SCHEMA_SQL)
+            conn.execute(TRACE_INDEX_SQL)
+    finally:
+        conn.close()
+
+
+class LogWriter:
+    """Queue items are ("log", row) for execution_log or ("trace", row) for execution_trace."""
+
+    def __init__(
+        self,
+        max_queue: int = EXEC_LOG_QUEUE_MAX,
+        batch: int = EXEC_LOG_BATCH,
+        flush_ms: float = EXEC_LOG_FLUSH_MS,
+    ) -> None:
+        self.batch = batch
+        self.flush_s = flush_ms / 1000.0
+        self._queue: "queue.Queue[Optional[Tuple[Any, ...]]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.flush_latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.stats: Dict[str, int] = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "batches": 0,
+            "errors": 0,
+            "queue_high_water": 0,
+        }
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="execution-log", daemon=True)
+                self._thread.start()
+
+    def put(self, row: Tuple[Any, ...], table: str = "log") -> bool:
+        self._ensure_started()
         try:
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS execution_log (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ts TEXT NOT NULL,
-                    endpoint TEXT NOT NULL,
-                    status INTEGER NOT NULL,
-                    latency_ms INTEGER NOT NULL,
-                    payload TEXT
-                )
-                """
-            )
-            conn.commit()
+            self._queue.put_nowait((table, row))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["enqueued"] += 1
+        depth = self._queue.qsize()
+        if depth > self.stats["queue_high_water"]:
+            self.stats["queue_high_water"] = depth
+        return True
+
+    def _drain(self, first: Tuple[Any, ...], deadline: float) -> Tuple[List[Tuple[Any, ...]], bool]:
+        rows, stop = [first], False
+        while len(rows) < self.batch:
+            timeout = deadline - time.monotonic()
+            try:
+                row = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is None:
+                stop = True
+                break
+            rows.append(row)
+        return rows, stop
+
+    def _write(self, conn: sqlite3.Connection, items: List[Tuple[str, Tuple[Any, ...]]]) -> None:
+        started = time.monotonic()
+        rows = [r for table, r in items if table == "log"]
+        traces = [r for table, r in items if table == "trace"]
+        try:
+            with conn:  # one transaction (one commit) per batch
+                if rows:
+                    conn.executemany(INSERT_SQL, [r[1:] for r in rows])
+                    conn.executemany(ROLLUP_UPSERT_SQL, rollup_rows(rows))
+                if traces:
+                    conn.executemany(TRACE_INSERT_SQL, traces)
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.stats["dropped"] += len(items)
+            print(f"[execution_log] batch of {len(items)} failed: {e!r}")
+            return
+        self.stats["written"] += len(items)
+        self.stats["batches"] += 1
+        self.flush_latency_ms.observe((time.monotonic() - started) * 1000.0)
+
+    def _run(self) -> None:
+        conn = connect()
+        conn.execute(SCHEMA_SQL)
+        conn.execute(ROLLUP_SCHEMA_SQL)
+        conn.execute(TRACE_SCHEMA_SQL)
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    break
+                rows, stop = self._drain(first, time.monotonic() + self.flush_s)
+                self._write(conn, rows)
+                if stop:
+                    break
         finally:
             conn.close()
 
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flush what is queued and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            print("[execution_log] queue still full at shutdown; unflushed rows dropped")
+            return
+        thread.join(timeout)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "queue_depth": self._queue.qsize(),
+            "queue_max": self._queue.maxsize,
+            "batch": self.batch,
+            "flush_ms": self.flush_s * 1000.0,
+            "flush_latency_ms": self.flush_latency_ms.snapshot(),
+        }
+
 
 _init_db()
+_writer = LogWriter()
 
 
 def log_event(
@@ -49,7 +302,8 @@ def log_event(
     """
     Lightweight log sink used by orchestrator endpoints.
 
-    Called from e.g.:
+    Never blocks: the row is queued for the background writer (or dropped
+    and counted if the queue is full). Called from e.g.:
 
         log_event(
             endpoint="/plan",
@@ -60,33 +314,51 @@ def log_event(
     """
     if payload is None:
         payload = {}
+    trace_id = telemetry.current_trace_id()
+    if trace_id and "trace_id" not in payload:
+        payload = {**payload, "trace_id": trace_id}
 
-    record = {
-        "endpoint": endpoint,
-        "status": status,
-        "latency_ms": int(latency_ms),
-        "payload": payload,
-    }
+    now = time.time()
+    _writer.put(
+        (
+            now,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+            endpoint,
+            status,
+            int(latency_ms),
+            json.dumps(payload, ensure_ascii=False, default=str),
+        )
+    )
+
+
+def log_trace(trace: "telemetry.Trace", endpoint: str, status: int, latency_ms: float) -> None:
+    """Queue one request's spans (called by telemetry.TimingMiddleware)."""
+    _writer.put(
+        (
+            trace.trace_id,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(trace.started_at)),
+            trace.started_at,
+            endpoint,
+            status,
+            round(latency_ms, 3),
+            json.dumps(trace.spans, ensure_ascii=False, separators=(",", ":"), default=str),
+            trace.dropped,
+        ),
+        table="trace",
+    )
+
+
+def flush_and_stop() -> None:
+    _writer.stop()
 
-    with _DB_LOCK:
-        conn = sqlite3.connect(DB_PATH)
-        try:
-            conn.execute(
-                """
-                INSERT INTO execution_log (ts, endpoint, status, latency_ms, payload)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                (
-                    time.strftime("%Y-%m-%d %H:%M:%S"),
-                    record["endpoint"],
-                    record["status"],
-                    record["latency_ms"],
-                    json.dumps(record["payload"], ensure_ascii=False),
-                ),
-            )
-            conn.commit()
-        finally:
-            conn.close()
+
+# Included routers' shutdown handlers run with the app's.
+router.add_event_handler("shutdown", flush_and_stop)
+
+
+@router.get("/writer")
+async def writer_stats() -> Dict[str, Any]:
+    return {"ok": True, **_writer.snapshot()}
 
 
 @router.get("/latest")
@@ -111,10 +383,8 @@ async def latest_logs(limit: int = Query(20, ge=1, le=200)) -> Dict[str, Any]:
       ]
     }
     """
-    _init_db()
-
-    with _DB_LOCK:
-        conn = sqlite3.connect(DB_PATH)
+    def _read() -> List[sqlite3.Row]:
+        conn = connect(readonly=True)
         conn.row_factory = sqlite3.Row
         try:
             cur = conn.execute(
@@ -126,10 +396,12 @@ async def latest_logs(limit: int = Query(20, ge=1, le=200)) -> Dict[str, Any]:
                 """,
                 (limit,),
             )
-            rows = cur.fetchall()
+            return cur.fetchall()
         finally:
             conn.close()
 
+    rows = await run_in_threadpool(_read)
+
     parsed: List[Dict[str, Any]] = []
     for row in rows:
         try:
@@ -153,3 +425,72 @@ async def latest_logs(limit: int = Query(20, ge=1, le=200)) -> Dict[str, Any]:
         "count": len(parsed),
         "rows": parsed,
     }
+
+
+@router.get("/trace/{trace_id}")
+async def get_trace(trace_id: str) -> Dict[str, Any]:
+    """
+    Every logged hop of one trace (gateway-forwarded requests, /plan and
+    its sub-calls), each with its spans expanded, plus one merged timeline
+    on a common clock (ms since the first hop started).
+    """
+    def _read() -> List[sqlite3.Row]:
+        conn = connect(readonly=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            return conn.execute(
+                """
+                SELECT ts, started_at, endpoint, status, latency_ms, spans, dropped_spans
+                FROM execution_trace
+                WHERE trace_id = ?
+                ORDER BY started_at
+                """,
+                (trace_id,),
+            ).fetchall()
+        finally:
+            conn.close()
+
+    rows = await run_in_threadpool(_read)
+    if not rows:
+        raise HTTPException(404, f"trace {trace_id!r} not found (not sampled, or not flushed yet)")
+
+    t0 = rows[0]["started_at"]
+    hops: List[Dict[str, Any]] = []
+    timeline: List[Dict[str, Any]] = []
+    for hop_no, row in enumerate(rows):
+        offset_ms = (row["started_at"] - t0) * 1000.0
+        spans = []
+        for name, start_ms, dur_ms, parent, attrs in json.loads(row["spans"]):
+            spans.append(
+                {
+                    "name": name,
+                    "start_ms": start_ms,
+                    "duration_ms": dur_ms,
+                    "parent": parent,
+                    **({"attrs": attrs} if attrs else {}),
+                }
+            )
+            timeline.append(
+                {
+                    "hop": hop_no,
+                    "name": name,
+                    "start_ms": round(offset_ms + start_ms, 3),
+                    "duration_ms": dur_ms,
+                    **({"attrs": attrs} if attrs else {}),
+                }
+            )
+        hops.append(
+            {
+                "hop": hop_no,
+                "ts": row["ts"],
+                "offset_ms": round(offset_ms, 3),
+                "endpoint": row["endpoint"],
+                "status": row["status"],
+                "latency_ms": row["latency_ms"],
+                "dropped_spans": row["dropped_spans"],
+                "spans": spans,
+            }
+        )
+    timeline.sort(key=lambda s: s["start_ms"])
+
+    return {"ok": True, "trace_id": trace_id, "hops": hops, "timeline": timeline}
@@ -0,0 +1,26 @@
+"""
+Cheap change detection for small config directories (profiles, persona).
+
+A directory "signature" is the sorted (name, mtime_ns, size) of the files
+matching a glob. Comparing signatures costs a handful of stat() calls, so
+callers can poll it on the request path and only re-parse on change.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional, Tuple
+
+Signature = Tuple[Tuple[str, int, int], ...]
+
+
+def dir_signature(directory: Optional[Path], pattern: str) -> Signature:
+    if directory is None or not directory.is_dir():
+        return ()
+    out = []
+    for p in sorted(directory.glob(pattern)):
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        out.append((p.name, st.st_mtime_ns, st.st_size))
+    return tuple(out)
@@ -0,0 +1,99 @@
+"""
+Small fixed-bucket histogram used for in-process latency/size stats.
+
+Bucket i counts observations <= bounds[i]; the last bucket is +Inf.
+Quantiles are estimated by linear interpolation inside the bucket that
+contains the target rank, which is what Prometheus' histogram_quantile()
+does as well.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+LATENCY_BUCKETS_MS: Sequence[float] = (
+    1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000,
+)
+SIZE_BUCKETS: Sequence[float] = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def quantile_from_buckets(
+    bounds: Sequence[float],
+    counts: Sequence[int],
+    q: float,
+    max_value: Optional[float] = None,
+) -> Optional[float]:
+    """Estimate the q-quantile (0..1) from per-bucket counts (len(bounds) + 1)."""
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = q * total
+    seen = 0
+    for i, c in enumerate(counts):
+        if c and seen + c >= rank:
+            lower = bounds[i - 1] if i > 0 else 0.0
+            if i < len(bounds):
+                upper = bounds[i]
+            else:
+                # +Inf bucket: the best we know is the observed max
+                return max_value if max_value is not None else lower
+            if max_value is not None:
+                upper = min(upper, max_value)
+            return lower + (upper - lower) * ((rank - seen) / c)
+        seen += c
+    return max_value
+
+
+class Histogram:
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS_MS) -> None:
+        self.bounds = tuple(sorted(bounds))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts: List[int] = [0] * (len(self.bounds) + 1)
+            self.count = 0
+            self.sum = 0.0
+            self.min: Optional[float] = None
+            self.max: Optional[float] = None
+
+    def bucket_index(self, value: float) -> int:
+        for i, b in enumerate(self.bounds):
+            if value <= b:
+                return i
+        return len(self.bounds)
+
+    def observe(self, value: float) -> None:
+        idx = self.bucket_index(value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            counts = list(self.counts)
+            max_value = self.max
+        return quantile_from_buckets(self.bounds, counts, q, max_value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self.counts)
+            count, total, lo, hi = self.count, self.sum, self.min, self.max
+        return {
+            "count": count,
+            "sum": total,
+            "min": lo,
+            "max": hi,
+            "avg": (total / count) if count else None,
+            "p50": quantile_from_buckets(self.bounds, counts, 0.50, hi),
+            "p95": quantile_from_buckets(self.bounds, counts, 0.95, hi),
+            "p99": quantile_from_buckets(self.bounds, counts, 0.99, hi),
+            "buckets": {
+                **{str(b): c for b, c in zip(self.bounds, counts)},
+                "+Inf": counts[-1],
+            },
+        }
@@ -0,0 +1,476 @@
+"""
+ANN index management for the vector tables the orchestrator queries.
+
+At startup (after migrations) `ensure_indexes()` makes sure each queried
+vector column has an HNSW or ivfflat index (ANN_INDEX_METHOD), with build
+parameters picked from the table's estimated row count. Indexes are built
+CONCURRENTLY so writes are never blocked; an invalid leftover from an
+interrupted build is dropped and rebuilt. Each index records the row count
+it was tuned for (as its comment); once the table has grown or shrunk by
+ANN_RETUNE_FACTOR and that calls for other parameters, a replacement is
+built concurrently next to it and swapped in. A pass holds an advisory
+lock (pg_try_advisory_lock); other processes skip theirs. main.py re-runs
+`ensure_indexes()` every ANN_RETUNE_INTERVAL seconds, which also builds
+ivfflat indexes deferred while their table was empty.
+
+Tables that mix several embedding models or tenants get one partial
+index per value instead of a single shared one (`WHERE model = '<tag>'`
+on ross.chunk_embeddings, `WHERE tenant = '<tenant>'` on public.docs), so
+a filtered query walks a graph holding only its own vectors. Queries must
+inline the same literal (see `partial_predicate()`) for the planner to
+match the partial index. ross.chunk_embeddings is LIST-partitioned by
+tenant (migration 005); its per-model indexes are built on each partition.
+
+Each model's index uses its EMBED_STORAGE format: the float32 column
+itself, a halfvec expression (`col::halfvec(dim)`, half the index RAM) or
+a binary-quantized one (`binary_quantize(col)::bit(dim)`, 1/32 of it,
+Hamming distance). Quantized searches fetch a shortlist through the index
+and re-score it exactly against the float32 column (`ann_order()` and
+`rescore_limit()` build both stages).
+
+At query time `search_settings()` turns the request's recall knob
+("fast" | "balanced" | "high") into transaction-local hnsw.ef_search /
+ivfflat.probes values, plus pgvector's iterative index scan for searches
+that carry extra filters. Run manually with `python index_manager.py`.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg
+from psycopg import sql as psql
+
+from db import DATABASE_URL
+from embedding_service import EMBED_MODEL_TAG, registered_models, storage_format
+from tenant_config import list_tenants
+
+ANN_INDEX_METHOD = os.getenv("ANN_INDEX_METHOD", "hnsw")  # hnsw | ivfflat
+ANN_MAINTENANCE_WORK_MEM = os.getenv("ANN_MAINTENANCE_WORK_MEM", "")  # e.g. "1GB"
+ANN_INDEX_ON_STARTUP = os.getenv("ANN_INDEX_ON_STARTUP", "1") in ("1", "true", "True")
+# relaxed_order | strict_order | off (needs pgvector >= 0.8)
+ANN_ITERATIVE_SCAN = os.getenv("ANN_ITERATIVE_SCAN", "relaxed_order")
+ANN_RETUNE_FACTOR = float(os.getenv("ANN_RETUNE_FACTOR", "4"))
+ANN_RETUNE_INTERVAL = float(os.getenv("ANN_RETUNE_INTERVAL", "3600"))  # 0 = startup only
+
+# One index pass at a time across processes; the others skip theirs.
+_ADVISORY_LOCK_ID = 0x524F5349  # "ROSI"
+
+# Shortlist = top_k x factor for quantized formats (ANN_RESCORE_FACTOR overrides).
+_RESCORE_FACTOR = {"vector": 1, "halfvec": 2, "binary": 8}
+ANN_RESCORE_FACTOR = int(os.getenv("ANN_RESCORE_FACTOR", "0"))
+
+RECALL_LEVELS = ("fast", "balanced", "high")
+_EF_SEARCH = {"fast": 20, "balanced": 64, "high": 200}
+_PROBE_FRACTION = {"fast": 0.01, "balanced": 0.05, "high": 0.2}
+
+# (table, column, opclass) for every vector column a route searches;
+# "partial" names the column that gets one partial index per value, and
+# "partitioned" marks parents whose indexes live on the partitions.
+TARGETS: List[Dict[str, str]] = [
+    {
+        "table": "public.docs",
+        "column": "embedding",
+        "ops": "vector_cosine_ops",
+        "dim": os.getenv("EMBEDDING_DIM", "384"),
+        "partial": "tenant",
+    },
+    {
+        "table": "ross.chunk_embeddings",
+        "column": "embedding_384",
+        "ops": "vector_cosine_ops",
+        "dim": "384",
+        "partial": "model",
+        "partitioned": "1",
+    },
+]
+
+
+def ann_expression(column: str, fmt: str = "vector", dim: int = 384) -> str:
+    """Indexed expression for `column` in storage format `fmt`."""
+    if fmt == "halfvec":
+        return f"({column}::halfvec({dim}))"
+    if fmt == "binary":
+        return f"(binary_quantize({column})::bit({dim}))"
+    return column
+
+
+def ann_ops(ops: str, fmt: str = "vector") -> str:
+    if fmt == "halfvec":
+        return ops.replace("vector_", "halfvec_", 1)
+    if fmt == "binary":
+        return "bit_hamming_ops"
+    return ops
+
+
+def ann_order(column: str, fmt: str = "vector", dim: int = 384, param: str = "%(qvec)s") -> str:
+    """
+    ORDER BY expression for the first (index) stage; written exactly like
+    the index expression so the planner can use it.
+    """
+    if fmt == "halfvec":
+        return f"{ann_expression(column, fmt, dim)} <=> {param}::halfvec({dim})"
+    if fmt == "binary":
+        return f"{ann_expression(column, fmt, dim)} <~> binary_quantize({param}::vector({dim}))::bit({dim})"
+    return f"{column} <=> {param}"
+
+
+def rescore_limit(top_k: int, fmt: str = "vector") -> int:
+    """Shortlist size the index stage fetches before exact re-scoring."""
+    if fmt == "vector":
+        return top_k
+    return top_k * (ANN_RESCORE_FACTOR or _RESCORE_FACTOR[fmt])
+
+
+def partial_format(partial_column: str, value: Optional[str]) -> str:
+    # docs rows are embedded with the default model
+    return storage_format(value if partial_column == "model" else EMBED_MODEL_TAG)
+
+
+def partial_values(column: str) -> List[str]:
+    if column == "model":
+        return list(registered_models())
+    if column == "tenant":
+        return list_tenants()
+    raise ValueError(f"no partial index values for column {column!r}")
+
+# What we know about each table's index: {"method": ..., "lists": ...}
+_state: Dict[str, Dict[str, Any]] = {}
+
+
+def hnsw_params(rows: int) -> Dict[str, int]:
+    if rows < 100_000:
+        return {"m": 16, "ef_construction": 64}
+    if rows < 1_000_000:
+        return {"m": 24, "ef_construction": 100}
+    return {"m": 32, "ef_construction": 128}
+
+
+def ivfflat_lists(rows: int) -> int:
+    # pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond
+    if rows <= 1_000_000:
+        return max(10, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", value.lower()).strip("_")
+
+
+def index_name(
+    table: str,
+    column: str,
+    method: str,
+    partial: Optional[str] = None,
+    fmt: str = "vector",
+) -> str:
+    suffix = {"halfvec": "_half", "binary": "_bin"}.get(fmt, "")
+    name = f"ix_{table.split('.')[-1]}_{column}{suffix}_{method}"
+    if partial:
+        name = f"{name}_{_slug(partial)}"
+    # identifiers are truncated at 63 bytes; keep distinct tags distinct
+    if len(name) > 63:
+        name = f"{name[:54]}_{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+    return name
+
+
+def partial_predicate(value: str, column: str = "model") -> psql.Composed:
+    """
+    `column = '<value>'` with the value inlined as a literal.
+
+    A bind parameter would let a generic (prepared) plan ignore the partial
+    index, so both the index definition and the queries use this form.
+    """
+    return psql.SQL("{} = {}").format(psql.Identifier(column), psql.Literal(value))
+
+
+def estimated_rows(conn: psycopg.Connection, table: str) -> int:
+    """Planner estimate from pg_class; avoids a count(*) scan."""
+    row = conn.execute(
+        "SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = %s::regclass",
+        (table,),
+    ).fetchone()
+    return int(row[0]) if row else 0
+
+
+def estimated_value_rows(conn: psycopg.Connection, table: str, column: str, value: str) -> int:
+    """Rows for one value: table estimate x the value's most_common_freqs share."""
+    total = estimated_rows(conn, table)
+    schema, _, rel = table.rpartition(".")
+    row = conn.execute(
+        """
+        SELECT most_common_vals::text::text[], most_common_freqs
+        FROM pg_stats
+        WHERE schemaname = %s AND tablename = %s AND attname = %s
+        """,
+        (schema or "public", rel, column),
+    ).fetchone()
+    if row is None or not row[0]:
+        # not analyzed yet: assume one value owns everything
+        return total
+    freqs = dict(zip(row[0], row[1]))
+    return int(total * freqs.get(value, 0.0))
+
+
+def partitions(conn: psycopg.Connection, table: str) -> List[str]:
+    rows = conn.execute(
+        """
+        SELECT n.nspname || '.' || c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY 1
+        """,
+        (table,),
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def _existing_index(conn: psycopg.Connection, schema: str, name: str) -> Optional[Dict[str, Any]]:
+    row = conn.execute(
+        """
+        SELECT i.indisvalid, am.amname, c.reloptions, obj_description(c.oid, 'pg_class')
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_index i ON i.indexrelid = c.oid
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE n.nspname = %s AND c.relname = %s
+        """,
+        (schema, name),
+    ).fetchone()
+    if row is None:
+        return None
+    options = dict(o.split("=", 1) for o in (row[2] or []))
+    tuned = re.fullmatch(r"rows=(\d+)", row[3] or "")
+    return {
+        "valid": row[0],
+        "method": row[1],
+        "options": options,
+        "tuned_rows": int(tuned.group(1)) if tuned else None,
+    }
+
+
+def _needs_retune(existing: Dict[str, Any], rows: int, params: Dict[str, int]) -> bool:
+    """Parameters differ and the row count moved by ANN_RETUNE_FACTOR since tuning."""
+    if all(str(v) == existing["options"].get(k) for k, v in params.items()):
+        return False
+    tuned = existing["tuned_rows"]
+    if tuned is None:
+        # built before tuned_rows was recorded
+        return True
+    low, high = sorted((max(tuned, 1), max(rows, 1)))
+    return high / low >= ANN_RETUNE_FACTOR
+
+
+def _state_key(table: str, partial: Optional[str] = None) -> str:
+    return f"{table}:{partial}" if partial else table
+
+
+def _remember(table: str, method: str, options: Dict[str, Any], partial: Optional[str] = None) -> None:
+    state: Dict[str, Any] = {"method": method}
+    if "lists" in options:
+        state["lists"] = int(options["lists"])
+    _state[_state_key(table, partial)] = state
+
+
+def ensure_index(
+    conn: psycopg.Connection,
+    table: str,
+    column: str,
+    ops: str,
+    method: str = ANN_INDEX_METHOD,
+    partial: Optional[str] = None,
+    partial_column: str = "model",
+    fmt: str = "vector",
+    dim: int = 384,
+) -> Dict[str, Any]:
+    schema = table.split(".")[0] if "." in table else "public"
+    name = index_name(table, column, method, partial, fmt)
+    # replacement built next to `name` while retuning; a leftover is stale
+    retune_name = index_name(table, column, method, f"{partial or ''}_retune", fmt)
+    if _existing_index(conn, schema, retune_name) is not None:
+        conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {schema}.{retune_name}")
+
+    if partial:
+        rows = estimated_value_rows(conn, table, partial_column, partial)
+    else:
+        rows = estimated_rows(conn, table)
+    if method == "ivfflat":
+        params: Dict[str, int] = {"lists": ivfflat_lists(rows)} if rows else {}
+    else:
+        params = hnsw_params(rows)
+
+    existing = _existing_index(conn, schema, name)
+    retune = False
+    if existing is not None and existing["valid"]:
+        if not params or not _needs_retune(existing, rows, params):
+            _remember(table, existing["method"], existing["options"], partial)
+            return {"index": name, "action": "exists", **existing["options"]}
+        retune = True
+    elif existing is not None:
+        conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {schema}.{name}")
+    if not params:
+        # ivfflat centroids come from existing rows; build once data exists
+        return {"index": name, "action": "deferred", "rows": rows}
+
+    with_clause = ", ".join(f"{k} = {v}" for k, v in params.items())
+    if ANN_MAINTENANCE_WORK_MEM:
+        conn.execute("SELECT set_config('maintenance_work_mem', %s, false)", (ANN_MAINTENANCE_WORK_MEM,))
+    build_name = retune_name if retune else name
+    stmt = psql.SQL(
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {build_name} "
+        f"ON {table} USING {method} ({ann_expression(column, fmt, dim)} {ann_ops(ops, fmt)}) "
+        f"WITH ({with_clause})"
+    )
+    if partial:
+        stmt = psql.SQL("{} WHERE {}").format(stmt, partial_predicate(partial, partial_column))
+    conn.execute(stmt)
+    if retune:
+        # Searches keep the old index until the new one is valid.
+        conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {schema}.{name}")
+        conn.execute(f"ALTER INDEX {schema}.{retune_name} RENAME TO {name}")
+    conn.execute(f"COMMENT ON INDEX {schema}.{name} IS 'rows={rows}'")
+    _remember(table, method, params, partial)
+    verb = "retuned" if retune else "built"
+    print(f"[index_manager] {verb} {name} on {table} ({rows} rows, {with_clause})")
+    result: Dict[str, Any] = {
+        "index": name, "action": "retuned" if retune else "created", "rows": rows, "format": fmt, **params,
+    }
+    if partial:
+        result[partial_column] = partial
+    return result
+
+
+def ensure_partial_indexes(
+    conn: psycopg.Connection,
+    table: str,
+    column: str,
+    ops: str,
+    partial_column: str,
+    method: str = ANN_INDEX_METHOD,
+    dim: int = 384,
+) -> List[Dict[str, Any]]:
+    """
+    One partial index per value of `partial_column`, in that value's storage
+    format; drops indexes left over in other formats and the old shared one.
+    """
+    schema = table.split(".")[0] if "." in table else "public"
+    results: List[Dict[str, Any]] = []
+    for value in partial_values(partial_column):
+        fmt = partial_format(partial_column, value)
+        results.append(
+            ensure_index(
+                conn, table, column, ops, method,
+                partial=value, partial_column=partial_column, fmt=fmt, dim=dim,
+            )
+        )
+        # Only after the new index is valid, so searches never lose their index.
+        for other in _RESCORE_FACTOR:
+            stale = index_name(table, column, method, value, other)
+            if other != fmt and _existing_index(conn, schema, stale) is not None:
+                conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {schema}.{stale}")
+                results.append({"index": stale, "action": "dropped"})
+    shared = index_name(table, column, method)
+    if _existing_index(conn, schema, shared) is not None:
+        conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {schema}.{shared}")
+        results.append({"index": shared, "action": "dropped"})
+    return results
+
+
+def ensure_indexes(dsn: str = DATABASE_URL) -> List[Dict[str, Any]]:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        (locked,) = conn.execute("SELECT pg_try_advisory_lock(%s)", (_ADVISORY_LOCK_ID,)).fetchone()
+        if not locked:
+            # another process is building; don't drop its in-progress indexes
+            print("[index_manager] index pass already running elsewhere; skipped")
+            return [{"action": "skipped", "reason": "locked"}]
+        try:
+            return _ensure_targets(conn)
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s)", (_ADVISORY_LOCK_ID,))
+
+
+def _ensure_targets(conn: psycopg.Connection) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    for t in TARGETS:
+        try:
+            if t.get("partitioned"):
+                # CREATE INDEX CONCURRENTLY is not allowed on a partitioned parent
+                for part in partitions(conn, t["table"]):
+                    results.extend(
+                        ensure_partial_indexes(
+                            conn, part, t["column"], t["ops"], t["partial"], dim=int(t["dim"])
+                        )
+                    )
+                continue
+            if t.get("partial"):
+                results.extend(
+                    ensure_partial_indexes(
+                        conn, t["table"], t["column"], t["ops"], t["partial"], dim=int(t["dim"])
+                    )
+                )
+                continue
+            results.append(ensure_index(conn, t["table"], t["column"], t["ops"]))
+        except Exception as e:
+            results.append({"table": t["table"], "action": "error", "error": str(e)})
+            print(f"[index_manager] failed on {t['table']}: {e}")
+    return results
+
+
+def search_settings(
+    table: str,
+    recall: str = "balanced",
+    top_k: int = 10,
+    partial: Optional[str] = None,
+    filtered: bool = False,
+) -> Dict[str, str]:
+    """
+    Transaction-local GUCs for one ANN query against `table`.
+
+    `filtered` marks queries whose WHERE clause the index cannot answer on
+    its own; those enable iterative scan so the index keeps producing
+    candidates until top_k rows survive the filter.
+
+    Apply with `SELECT set_config(name, value, true)` inside the query's
+    transaction so pooled connections never leak settings.
+    """
+    if recall not in RECALL_LEVELS:
+        recall = "balanced"
+    state = _state.get(_state_key(table, partial)) or _state.get(table, {"method": ANN_INDEX_METHOD})
+    iterative = filtered and ANN_ITERATIVE_SCAN not in ("", "off")
+    if state.get("method") == "ivfflat":
+        lists = int(state.get("lists") or 100)
+        probes = max(1, int(round(lists * _PROBE_FRACTION[recall])))
+        settings = {"ivfflat.probes": str(min(probes, lists))}
+        if iterative:
+            # ivfflat only supports relaxed ordering
+            settings["ivfflat.iterative_scan"] = "relaxed_order"
+        return settings
+    # ef_search below top_k would cap the result count
+    settings = {"hnsw.ef_search": str(max(_EF_SEARCH[recall], top_k))}
+    if iterative:
+        settings["hnsw.iterative_scan"] = ANN_ITERATIVE_SCAN
+    return settings
+
+
+def settings_statement(
+    table: str,
+    recall: str = "balanced",
+    top_k: int = 10,
+    partial: Optional[str] = None,
+    filtered: bool = False,
+) -> Tuple[str, List[str]]:
+    """(sql, params) that applies `search_settings()`; works with psycopg 2 and 3."""
+    settings = search_settings(table, recall, top_k, partial, filtered)
+    sql = "SELECT " + ", ".join(["set_config(%s, %s, true)"] * len(settings))
+    return sql, [x for kv in settings.items() for x in kv]
+
+
+if __name__ == "__main__":
+    for r in ensure_indexes():
+        print(r)
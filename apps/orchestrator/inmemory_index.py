@@ -0,0 +1,591 @@
+"""
+In-process vector index for small tenants (and retrieval without the db).
+
+Tenants listed in INMEMORY_TENANTS are served from a contiguous float32
+matrix of L2-normalized chunk embeddings, memory-mapped from
+INMEMORY_INDEX_DIR/<tenant>/<model>/:
+
+  vectors.f32    n x dim float32, row-major, append-only
+  ids.i64        chunk id per row
+  docs.i64       document id per row
+  eids.i64       ross.chunk_embeddings id per row
+  ts.i64         its created_at (unix epoch microseconds)
+  snippets.jsonl one JSON string per row
+  deleted.i64    tombstones: (chunk id, row count when it was deleted) pairs
+  state.json     row count, dim and the sync cursor; written last, so rows
+                 past `count` (a torn append) are ignored on load
+
+Top-k is one matrix product plus argpartition; a batch of queries is a
+single (n x dim) @ (dim x q) product. `sync()` pulls embeddings from the
+tenant's partition of ross.chunk_embeddings newer than the stored
+(created_at, id) cursor. created_at is the writer's transaction start, not
+its commit time, so the cursor only advances to a settled watermark: the
+start of the oldest transaction still open on the server, minus
+INMEMORY_SYNC_LAG seconds. Rows past the watermark are fetched again on the
+next sync and skipped if already appended ((id, created_at) de-dup). A
+re-embedded chunk is appended again and its older row masked out.
+
+Deletions: embedding_worker only deletes embeddings (chunks truncated by a
+re-chunk, chunks moved to another tenant) while completing an embedding
+job, so each sync re-checks just the documents whose job completed since
+the last check (up to the same watermark) and masks rows whose chunk no
+longer has an embedding here. Every INMEMORY_FULL_CHECK_INTERVAL seconds,
+and on the first sync after startup, every chunk id of the tenant is
+checked instead, which catches deletes made outside the worker. Tombstones
+keep masked rows masked across restarts.
+Once masked rows outnumber live ones by INMEMORY_COMPACT_RATIO, `compact()`
+rewrites the snapshot with live rows only (into a side directory that is
+swapped in), which also drops the tombstones.
+
+main.py runs `sync_all()` (every registered model of every tenant) each
+INMEMORY_SYNC_INTERVAL seconds. When the db is unreachable the last on-disk
+snapshot keeps serving; an index with no live rows yet (cold start, new
+model) is not used, and retrieval goes to pgvector instead.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from fastapi import APIRouter, HTTPException
+
+from embedding_service import EMBED_MODEL_TAG, registered_models
+
+INMEMORY_TENANTS = {
+    t.strip() for t in os.getenv("INMEMORY_TENANTS", "").split(",") if t.strip()
+}
+INMEMORY_INDEX_DIR = Path(
+    os.getenv("INMEMORY_INDEX_DIR", str(Path(__file__).resolve().parent / "data" / "vector_index"))
+)
+INMEMORY_SYNC_INTERVAL = float(os.getenv("INMEMORY_SYNC_INTERVAL", "30"))
+INMEMORY_SYNC_BATCH = int(os.getenv("INMEMORY_SYNC_BATCH", "2000"))
+# Extra margin behind the oldest open transaction (covers sessions whose
+# xact_start this role cannot see in pg_stat_activity).
+INMEMORY_SYNC_LAG = float(os.getenv("INMEMORY_SYNC_LAG", "5"))
+# Compact once masked (re-embedded / deleted) rows exceed live rows x this.
+INMEMORY_COMPACT_RATIO = float(os.getenv("INMEMORY_COMPACT_RATIO", "1.0"))
+INMEMORY_FULL_CHECK_INTERVAL = float(os.getenv("INMEMORY_FULL_CHECK_INTERVAL", "3600"))
+_COMPACT_MIN_DEAD = 256
+
+router = APIRouter(prefix="/retrieve/inmemory", tags=["retrieval"])
+
+SYNC_SQL = """
+SELECT e.id, e.created_at, c.id AS chunk_id, c.document_id,
+       left(c.content, 300) AS snippet, e.embedding_384
+FROM ross.chunk_embeddings e
+JOIN ross.document_chunks c ON c.id = e.chunk_id
+WHERE e.tenant = %(tenant)s
+  AND e.model = %(model)s
+  AND (e.created_at, e.id) > (%(since)s::timestamptz, %(after_id)s)
+ORDER BY e.created_at, e.id
+LIMIT %(limit)s;
+"""
+
+LIVE_SQL = """
+SELECT chunk_id FROM ross.chunk_embeddings
+WHERE tenant = %(tenant)s AND model = %(model)s;
+"""
+
+# Documents embedding_worker rewrote (and may have deleted chunks of).
+TOUCHED_DOCS_SQL = """
+SELECT DISTINCT document_id FROM ross.embedding_jobs
+WHERE status = 'completed' AND model = %(model)s
+  AND updated_at > %(since)s AND updated_at <= %(until)s;
+"""
+
+LIVE_IN_DOCS_SQL = """
+SELECT e.chunk_id
+FROM ross.chunk_embeddings e
+JOIN ross.document_chunks c ON c.id = e.chunk_id
+WHERE e.tenant = %(tenant)s AND e.model = %(model)s AND c.document_id = ANY(%(docs)s);
+"""
+
+# Every row created before this has committed (or rolled back).
+WATERMARK_SQL = """
+SELECT LEAST(
+         clock_timestamp(),
+         (SELECT min(xact_start) FROM pg_stat_activity
+          WHERE xact_start IS NOT NULL AND pid <> pg_backend_pid())
+       ) - make_interval(secs => %(lag)s);
+"""
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NO_CURSOR: Tuple[str, int] = ("-infinity", 0)
+
+
+def _micros(ts: datetime) -> int:
+    return (ts - _EPOCH) // timedelta(microseconds=1)
+
+
+def _cursor_micros(cursor: Tuple[str, int]) -> int:
+    if cursor[0] == "-infinity":
+        return -(2**63)
+    return _micros(datetime.fromisoformat(cursor[0]))
+
+
+def serves(tenant: Optional[str]) -> bool:
+    return bool(tenant) and tenant in INMEMORY_TENANTS
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    mat = np.ascontiguousarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+class TenantIndex:
+    def __init__(self, tenant: str, model: str = EMBED_MODEL_TAG, root: Path = INMEMORY_INDEX_DIR) -> None:
+        self.tenant = tenant
+        self.model = model
+        self.path = root / tenant / re.sub(r"[^A-Za-z0-9_.-]+", "_", model)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.last_sync: Optional[float] = None
+        self.last_full_check = 0.0
+        self._jobs_checked: Optional[datetime] = None  # deletions seen up to here
+        self.last_error: Optional[str] = None
+        self._reset()
+        self._recover()
+        self.load()
+
+    def _reset(self) -> None:
+        self.dim = 0
+        self.cursor: Tuple[str, int] = _NO_CURSOR
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._docs = np.zeros(0, dtype=np.int64)
+        self._live = np.zeros(0, dtype=bool)
+        self._snippets: List[str] = []
+        self._row_of: Dict[int, int] = {}  # chunk id -> its newest row
+        # (embedding id, created_at us) of rows past the cursor, for de-dup
+        self._recent: Set[Tuple[int, int]] = set()
+
+    # ---------- storage ----------
+
+    def _file(self, name: str) -> Path:
+        return self.path / name
+
+    @property
+    def count(self) -> int:
+        return len(self._ids)
+
+    def _map_vectors(self, n: int, dim: int) -> np.ndarray:
+        if not n:
+            return np.zeros((0, dim), dtype=np.float32)
+        return np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(n, dim))
+
+    def _read_i64(self, name: str, n: int) -> np.ndarray:
+        f = self._file(name)
+        if not f.exists():
+            # snapshot written before this column existed: zeros, on disk too
+            np.zeros(n, dtype=np.int64).tofile(f)
+        return np.fromfile(f, dtype=np.int64, count=n)
+
+    def _side(self, suffix: str) -> Path:
+        return self.path.with_name(self.path.name + suffix)
+
+    def _recover(self) -> None:
+        # A compaction interrupted between its two renames.
+        old, new = self._side(".old"), self._side(".compact")
+        if not self.path.exists() and old.exists():
+            old.rename(self.path)
+        shutil.rmtree(old, ignore_errors=True)
+        shutil.rmtree(new, ignore_errors=True)
+
+    @property
+    def live_count(self) -> int:
+        return int(self._live.sum())
+
+    def load(self) -> None:
+        state_file = self._file("state.json")
+        if not state_file.exists():
+            return
+        state = json.loads(state_file.read_text())
+        n, dim = int(state["count"]), int(state["dim"])
+        cursor = (state["cursor"][0], int(state["cursor"][1]))
+        ids = np.fromfile(self._file("ids.i64"), dtype=np.int64, count=n)
+        docs = np.fromfile(self._file("docs.i64"), dtype=np.int64, count=n)
+        eids = self._read_i64("eids.i64", n)
+        ts = self._read_i64("ts.i64", n)
+        with self._file("snippets.jsonl").open() as f:
+            snippets = [json.loads(line) for _, line in zip(range(n), f)]
+        since = _cursor_micros(cursor)
+        recent = {(int(e), int(t)) for e, t in zip(eids[ts >= since], ts[ts >= since])}
+        live, row_of = self._latest_rows(ids)
+        for cid, deleted_at in self._read_tombstones():
+            row = row_of.get(cid)
+            if row is not None and row < deleted_at:
+                live[row] = False
+        with self._lock:
+            self.dim = dim
+            self.cursor = cursor
+            self._vectors, self._ids, self._docs = self._map_vectors(n, dim), ids, docs
+            self._snippets = snippets
+            self._live, self._row_of = live, row_of
+            self._recent = recent
+
+    @staticmethod
+    def _latest_rows(ids: np.ndarray) -> Tuple[np.ndarray, Dict[int, int]]:
+        # Keep only the newest row per chunk id (re-embeds are appended).
+        live = np.zeros(len(ids), dtype=bool)
+        if not len(ids):
+            return live, {}
+        uniq, last = np.unique(ids[::-1], return_index=True)
+        rows = len(ids) - 1 - last
+        live[rows] = True
+        return live, dict(zip(uniq.tolist(), rows.tolist()))
+
+    def _read_tombstones(self) -> List[Tuple[int, int]]:
+        f = self._file("deleted.i64")
+        if not f.exists():
+            return []
+        flat = np.fromfile(f, dtype=np.int64)
+        pairs = flat[: len(flat) // 2 * 2].reshape(-1, 2)
+        return [(int(c), int(n)) for c, n in pairs]
+
+    def _truncate(self, n: int, dim: int) -> None:
+        # Drop bytes from a torn append past the committed row count.
+        widths = (("vectors.f32", 4 * dim), ("ids.i64", 8), ("docs.i64", 8), ("eids.i64", 8), ("ts.i64", 8))
+        for name, width in widths:
+            f = self._file(name)
+            if f.exists() and f.stat().st_size != n * width:
+                os.truncate(f, n * width)
+        snippets = self._file("snippets.jsonl")
+        if snippets.exists():
+            lines = snippets.read_text().splitlines(keepends=True)
+            if len(lines) != n:
+                snippets.write_text("".join(lines[:n]))
+
+    def _write_state(self, count: int, dim: int, cursor: Tuple[str, int]) -> None:
+        tmp = self._file("state.json.tmp")
+        tmp.write_text(json.dumps({"count": count, "dim": dim, "cursor": list(cursor)}))
+        tmp.replace(self._file("state.json"))
+
+    def append(
+        self,
+        chunk_ids: Sequence[int],
+        document_ids: Sequence[int],
+        vectors: np.ndarray,
+        snippets: Sequence[str],
+        cursor: Tuple[str, int],
+        row_ids: Optional[Sequence[int]] = None,
+        created_us: Optional[Sequence[int]] = None,
+    ) -> int:
+        """
+        Append rows and move the cursor; the in-memory arrays are extended
+        in place of a reload (the vector memmap is re-opened at the new size).
+        """
+        if not len(chunk_ids):
+            self.advance(cursor)
+            return 0
+        mat = _normalize(np.asarray(vectors))
+        if self.dim and mat.shape[1] != self.dim:
+            raise ValueError(f"dimension mismatch: index {self.dim}, rows {mat.shape[1]}")
+        k = len(chunk_ids)
+        new_ids = np.asarray(chunk_ids, dtype=np.int64)
+        new_docs = np.asarray(document_ids, dtype=np.int64)
+        new_eids = np.asarray(row_ids if row_ids is not None else [0] * k, dtype=np.int64)
+        new_ts = np.asarray(created_us if created_us is not None else [0] * k, dtype=np.int64)
+        self.path.mkdir(parents=True, exist_ok=True)
+        n, dim = self.count, mat.shape[1]
+        self._truncate(n, dim)
+        for name, data in (
+            ("vectors.f32", mat),
+            ("ids.i64", new_ids),
+            ("docs.i64", new_docs),
+            ("eids.i64", new_eids),
+            ("ts.i64", new_ts),
+        ):
+            with self._file(name).open("ab") as f:
+                data.tofile(f)
+        with self._file("snippets.jsonl").open("a") as f:
+            f.writelines(json.dumps(sn or "") + "\n" for sn in snippets)
+        self._write_state(n + k, dim, cursor)
+
+        live = np.concatenate([self._live, np.ones(k, dtype=bool)])
+        row_of = dict(self._row_of)
+        for offset, cid in enumerate(new_ids.tolist()):
+            prev = row_of.get(cid)
+            if prev is not None:
+                live[prev] = False
+            row_of[cid] = n + offset
+        since = _cursor_micros(cursor)
+        recent = {r for r in self._recent if r[1] >= since}
+        recent.update((int(e), int(t)) for e, t in zip(new_eids, new_ts) if t >= since)
+        vectors_map = self._map_vectors(n + k, dim)
+        with self._lock:
+            self.dim = dim
+            self.cursor = cursor
+            self._vectors = vectors_map
+            self._ids = np.concatenate([self._ids, new_ids])
+            self._docs = np.concatenate([self._docs, new_docs])
+            self._snippets = self._snippets + list(snippets)
+            self._live, self._row_of = live, row_of
+            self._recent = recent
+        return k
+
+    def advance(self, cursor: Tuple[str, int]) -> None:
+        """Move the cursor without new rows."""
+        if cursor == self.cursor or not self.count:
+            with self._lock:
+                self.cursor = cursor
+            return
+        self._write_state(self.count, self.dim, cursor)
+        since = _cursor_micros(cursor)
+        with self._lock:
+            self.cursor = cursor
+            self._recent = {r for r in self._recent if r[1] >= since}
+
+    def drop_missing(self, present: np.ndarray, document_ids: Optional[np.ndarray] = None) -> int:
+        """
+        Mask live rows whose chunk id is not in `present` (only rows of
+        `document_ids` when given); returns rows masked.
+        """
+        with self._lock:
+            ids, docs, live = self._ids, self._docs, self._live
+        gone = live & ~np.isin(ids, present)
+        if document_ids is not None:
+            gone &= np.isin(docs, document_ids)
+        if not gone.any():
+            return 0
+        stones = np.stack([ids[gone], np.full(int(gone.sum()), len(ids), dtype=np.int64)], axis=1)
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._file("deleted.i64").open("ab") as f:
+            stones.tofile(f)
+        live = live & ~gone
+        with self._lock:
+            self._live = live
+        return int(gone.sum())
+
+    def compact(self) -> int:
+        """Rewrite the snapshot with live rows only; returns rows dropped."""
+        with self._lock:
+            vectors, ids, docs, live = self._vectors, self._ids, self._docs, self._live
+            snippets, recent, cursor, dim = self._snippets, self._recent, self.cursor, self.dim
+        n = len(ids)
+        keep = np.flatnonzero(live)
+        if len(keep) == n:
+            return 0
+        tmp, old = self._side(".compact"), self._side(".old")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        np.ascontiguousarray(vectors[keep]).tofile(tmp / "vectors.f32")
+        ids[keep].tofile(tmp / "ids.i64")
+        docs[keep].tofile(tmp / "docs.i64")
+        self._read_i64("eids.i64", n)[keep].tofile(tmp / "eids.i64")
+        self._read_i64("ts.i64", n)[keep].tofile(tmp / "ts.i64")
+        with (tmp / "snippets.jsonl").open("w") as f:
+            f.writelines(json.dumps(snippets[i]) + "\n" for i in keep.tolist())
+        (tmp / "state.json").write_text(json.dumps({"count": len(keep), "dim": dim, "cursor": list(cursor)}))
+        shutil.rmtree(old, ignore_errors=True)
+        self.path.rename(old)
+        tmp.rename(self.path)
+        self.load()
+        with self._lock:
+            # keep de-dup entries of rows that were dropped as well
+            self._recent = self._recent | recent
+        shutil.rmtree(old, ignore_errors=True)
+        return n - len(keep)
+
+    def _maybe_compact(self) -> None:
+        dead = self.count - self.live_count
+        if dead >= _COMPACT_MIN_DEAD and dead > self.live_count * INMEMORY_COMPACT_RATIO:
+            dropped = self.compact()
+            print(f"[inmemory_index] compacted {self.tenant}/{self.model}: dropped {dropped} rows")
+
+    def clear(self) -> None:
+        with self._lock:
+            for name in (
+                "state.json", "vectors.f32", "ids.i64", "docs.i64", "eids.i64", "ts.i64",
+                "snippets.jsonl", "deleted.i64",
+            ):
+                self._file(name).unlink(missing_ok=True)
+            self._reset()
+
+    # ---------- search ----------
+
+    def search(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        document_ids: Optional[Sequence[int]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """Top-k rows per query row, as /retrieve/multi docs (cosine distance)."""
+        with self._lock:
+            vectors, ids, docs = self._vectors, self._ids, self._docs
+            live, snippets = self._live, self._snippets
+        q = _normalize(np.atleast_2d(queries))
+        if not len(ids):
+            return [[] for _ in range(len(q))]
+
+        scores = vectors @ q.T  # (n, q): one pass over the matrix for the batch
+        mask = live if document_ids is None else live & np.isin(docs, np.asarray(document_ids))
+        scores[~mask] = -np.inf
+        k = min(top_k, int(mask.sum()))
+        out: List[List[Dict[str, Any]]] = []
+        for col in scores.T:
+            if k == 0:
+                out.append([])
+                continue
+            top = np.argpartition(-col, k - 1)[:k]
+            top = top[np.argsort(-col[top])]
+            out.append([
+                {
+                    "id": int(ids[i]),
+                    "document_id": int(docs[i]),
+                    "snippet": snippets[i],
+                    "distance": float(1.0 - col[i]),
+                }
+                for i in top
+            ])
+        return out
+
+    # ---------- sync ----------
+
+    def sync(self, limit: int = INMEMORY_SYNC_BATCH) -> int:
+        """Append embeddings newer than the cursor; returns rows added."""
+        from db import get_sync_pool
+
+        added = 0
+        try:
+            with self._sync_lock, get_sync_pool().connection() as conn:
+                watermark = conn.execute(WATERMARK_SQL, {"lag": INMEMORY_SYNC_LAG}).fetchone()[0]
+                page = self.cursor
+                while True:
+                    rows = conn.execute(
+                        SYNC_SQL,
+                        {
+                            "model": self.model,
+                            "tenant": self.tenant,
+                            "since": page[0],
+                            "after_id": page[1],
+                            "limit": limit,
+                        },
+                    ).fetchall()
+                    if not rows:
+                        break
+                    last = rows[-1]
+                    page = (last[1].isoformat(), int(last[0]))
+                    fresh = [r for r in rows if (int(r[0]), _micros(r[1])) not in self._recent]
+                    # Only rows older than the watermark are settled.
+                    settled = min((last[1], int(last[0])), (watermark, 0))
+                    cursor = max(
+                        (settled[0].isoformat(), settled[1]),
+                        self.cursor,
+                        key=lambda c: (_cursor_micros(c), c[1]),
+                    )
+                    added += self.append(
+                        [r[2] for r in fresh],
+                        [r[3] for r in fresh],
+                        np.stack([np.asarray(r[5], dtype=np.float32) for r in fresh]) if fresh else np.zeros((0, 0)),
+                        [r[4] for r in fresh],
+                        cursor,
+                        row_ids=[int(r[0]) for r in fresh],
+                        created_us=[_micros(r[1]) for r in fresh],
+                    )
+                    if len(rows) < limit:
+                        break
+                self._check_deletions(conn, watermark)
+                self._maybe_compact()
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"[inmemory_index] sync {self.tenant}/{self.model} failed: {e}")
+        else:
+            self.last_error = None
+            self.last_sync = time.time()
+        return added
+
+    def _check_deletions(self, conn: Any, watermark: datetime) -> None:
+        args = {"tenant": self.tenant, "model": self.model}
+        full = (
+            self._jobs_checked is None
+            or time.time() - self.last_full_check >= INMEMORY_FULL_CHECK_INTERVAL
+        )
+        if full:
+            if self.count:
+                present = conn.execute(LIVE_SQL, args).fetchall()
+                self.drop_missing(np.array([r[0] for r in present], dtype=np.int64))
+            self.last_full_check = time.time()
+        elif self.count and watermark > self._jobs_checked:
+            touched = conn.execute(
+                TOUCHED_DOCS_SQL, {**args, "since": self._jobs_checked, "until": watermark}
+            ).fetchall()
+            docs = np.array([r[0] for r in touched], dtype=np.int64)
+            docs = docs[np.isin(docs, self._docs)]
+            if len(docs):
+                present = conn.execute(LIVE_IN_DOCS_SQL, {**args, "docs": docs.tolist()}).fetchall()
+                self.drop_missing(np.array([r[0] for r in present], dtype=np.int64), docs)
+        if self._jobs_checked is None or watermark > self._jobs_checked:
+            self._jobs_checked = watermark
+
+    def rebuild(self) -> int:
+        with self._sync_lock:
+            self.clear()
+        return self.sync()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "tenant": self.tenant,
+            "model": self.model,
+            "rows": self.count,
+            "live_rows": self.live_count,
+            "dim": self.dim,
+            "cursor": list(self.cursor),
+            "pending_dedup": len(self._recent),
+            "last_full_check": self.last_full_check or None,
+            "last_sync": self.last_sync,
+            "last_error": self.last_error,
+            "path": str(self.path),
+        }
+
+
+_indexes: Dict[Tuple[str, str], TenantIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(tenant: str, model: str = EMBED_MODEL_TAG) -> TenantIndex:
+    key = (tenant, model)
+    idx = _indexes.get(key)
+    if idx is None:
+        with _indexes_lock:
+            idx = _indexes.get(key)
+            if idx is None:
+                idx = _indexes[key] = TenantIndex(tenant, model)
+    return idx
+
+
+def sync_all() -> Dict[str, int]:
+    """Sync every registered model's index of every configured tenant."""
+    return {
+        f"{t}/{m}": get_index(t, m).sync()
+        for t in sorted(INMEMORY_TENANTS)
+        for m in registered_models()
+    }
+
+
+@router.get("/stats")
+def inmemory_stats() -> Dict[str, Any]:
+    return {
+        "ok": True,
+        "tenants": sorted(INMEMORY_TENANTS),
+        "indexes": [idx.status() for idx in _indexes.values()],
+    }
+
+
+@router.post("/{tenant}/rebuild")
+def inmemory_rebuild(tenant: str, model: str = EMBED_MODEL_TAG) -> Dict[str, Any]:
+    if not serves(tenant):
+        raise HTTPException(404, f"tenant {tenant!r} is not in INMEMORY_TENANTS")
+    if model not in registered_models():
+        raise HTTPException(404, f"unknown embedding model: {model}")
+    idx = get_index(tenant, model)
+    return {"ok": True, "rows": idx.rebuild(), "index": idx.status()}
@@ -0,0 +1,160 @@
+"""
+Shared async HTTP client for upstream model calls.
+
+One process-wide httpx.AsyncClient with a keep-alive pool (HTTP/2 when the
+`h2` package is available) plus a per-host concurrency limit, so /chat and
+friends never open a fresh TCP/TLS connection per request or park a
+threadpool worker on a blocking call.
+
+main.py closes the client on shutdown via `aclose()`.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from telemetry import stage
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_MAX_CONCURRENCY_PER_HOST = int(os.getenv("LLM_MAX_CONCURRENCY_PER_HOST", "16"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") not in ("0", "false", "False")
+
+try:
+    import h2  # noqa: F401  # type: ignore
+    _HTTP2_AVAILABLE = True
+except Exception:  # pragma: no cover
+    _HTTP2_AVAILABLE = False
+
+
+_client: Optional[httpx.AsyncClient] = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide AsyncClient, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=LLM_HTTP2 and _HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+def host_limit(url: str) -> asyncio.Semaphore:
+    """Per-host semaphore capping in-flight requests to one upstream."""
+    host = urlsplit(url).netloc
+    sem = _host_limits.get(host)
+    if sem is None:
+        sem = asyncio.Semaphore(LLM_MAX_CONCURRENCY_PER_HOST)
+        _host_limits[host] = sem
+    return sem
+
+
+async def aclose() -> None:
+    """Close the shared client (called from the app shutdown hook)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_limits.clear()
+
+
+def _chat_payload(system_prompt: str, user_text: str, **extra: Any) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_text},
+        ],
+        "temperature": 0.3,
+    }
+    payload.update(extra)
+    return payload
+
+
+def _headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+async def chat_completion(system_prompt: str, user_text: str) -> str:
+    """
+    If OPENAI_API_KEY is set, call OpenAI's chat API over the shared pool.
+    If not, stay in DEV-ECHO mode so the stack still works.
+    """
+    if not OPENAI_API_KEY:
+        # Safe dev fallback: keep the old behavior instead of crashing
+        return f"[DEV ECHO – no OPENAI_API_KEY set]\n\n{user_text}"
+
+    url = f"{OPENAI_BASE_URL}/chat/completions"
+    async with host_limit(url):
+        with stage("llm"):
+            r = await get_client().post(
+                url,
+                headers=_headers(),
+                json=_chat_payload(system_prompt, user_text),
+            )
+    r.raise_for_status()
+    data = r.json()
+
+    try:
+        return data["choices"][0]["message"]["content"]
+    except Exception as e:
+        raise RuntimeError(
+            f"Bad OpenAI response shape: {e}; "
+            f"raw={json.dumps(data, indent=2)[:800]}"
+        )
+
+
+async def stream_chat_completion(system_prompt: str, user_text: str) -> AsyncIterator[str]:
+    """
+    Yield content deltas from OpenAI's streaming chat API as they arrive.
+
+    DEV-ECHO mode yields the echo text as a single delta.
+    """
+    if not OPENAI_API_KEY:
+        yield f"[DEV ECHO – no OPENAI_API_KEY set]\n\n{user_text}"
+        return
+
+    url = f"{OPENAI_BASE_URL}/chat/completions"
+    async with host_limit(url):
+        with stage("llm"):
+            async with get_client().stream(
+                "POST",
+                url,
+                headers=_headers(),
+                json=_chat_payload(system_prompt, user_text, stream=True),
+            ) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        delta = json.loads(data)["choices"][0]["delta"].get("content")
+                    except Exception:
+                        continue
+                    if delta:
+                        yield delta
@@ -1,22 +1,27 @@
 
 from typing import Optional
-import os
+import asyncio
 import json
-from pathlib import Path
-from functools import lru_cache
+import time
 
-import yaml
-import httpx
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from status import record_chat_success, record_chat_error
 from pydantic import BaseModel
 
-# ---------- Config ----------
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
-
-PROFILE_DIR = Path(__file__).parent / "profiles"
+import db
+import embedding_cache
+import embedding_service
+import index_manager
+import inmemory_index
+import llm_client
+import migrations
+import reranker
+import telemetry
+from persona_store import get_persona_store
+from profile_registry import get_profile_registry
+import response_cache as _response_cache
 
 # ---------- Models ----------
 
@@ -31,108 +36,159 @@ class ChatResponse(BaseModel):
 
 # ---------- Profiles ----------
 
-@lru_cache(maxsize=32)
-def load_profiles() -> dict[str, dict]:
-    profiles: dict[str, dict] = {}
-    if not PROFILE_DIR.exists():
-        return profiles
+# Name-indexed, hot-reloaded on file change (profile_registry.py)
+profile_registry = get_profile_registry()
 
-    for p in PROFILE_DIR.glob("*.yaml"):
-        try:
-            with p.open("r") as f:
-                data = yaml.safe_load(f) or {}
-        except Exception:
-            continue
-        name = data.get("name") or p.stem
-        profiles[name] = data
-    return profiles
+def load_profiles() -> dict[str, dict]:
+    return profile_registry.profiles()
 
 def get_profile(name: Optional[str]) -> dict:
-    profiles = load_profiles()
-    if name and name in profiles:
-        return profiles[name]
-    if "general" in profiles:
-        return profiles["general"]
-    if profiles:
-        # return first defined profile
-        return next(iter(profiles.values()))
-    # super-safe fallback
-    return {
-        "name": "fallback",
-        "system_prompt": "You are a helpful assistant for Ross.",
-    }
+    return profile_registry.get(name)
 
 
 # ---------- Persona Memory ----------
 
-PERSONA_DIR = Path(__file__).resolve().parent / "data" / "persona"
-if not PERSONA_DIR.exists():
-    PERSONA_DIR = Path(__file__).resolve().parent / "profiles"
+# Parsed once and re-parsed only when the YAML files change (persona_store.py)
+persona_store = get_persona_store()
 
 def load_persona_memory() -> dict[str, dict]:
-    memory: dict[str, dict] = {}
-    if not PERSONA_DIR.exists():
-        return memory
-
-    for p in PERSONA_DIR.glob("*.yaml"):
-        try:
-            with p.open("r", encoding="utf-8") as f:
-                data = yaml.safe_load(f) or {}
-        except Exception as e:
-            data = {"error": str(e)}
-        memory[p.stem] = data
-    return memory
+    return persona_store.memory()
 
 
 # ---------- LLM Client ----------
 
-def call_openai_chat(system_prompt: str, user_text: str) -> str:
+# Optional exact + semantic reply cache (RESPONSE_CACHE_ENABLED=1)
+response_cache = _response_cache.get_response_cache()
+
+async def call_openai_chat(system_prompt: str, user_text: str) -> str:
     """
-    If OPENAI_API_KEY is set, call OpenAI's chat API.
-    If not, stay in DEV-ECHO mode so the stack still works.
+    Model call over the shared, pooled async client (see llm_client.py).
+    Falls back to DEV-ECHO mode when OPENAI_API_KEY is not set.
     """
-    if not OPENAI_API_KEY:
-        # Safe dev fallback: keep your old behavior instead of crashing
-        return f"[DEV ECHO – no OPENAI_API_KEY set]\n\n{user_text}"
-
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json",
-    }
-
-    payload = {
-        "model": OPENAI_MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_text},
-        ],
-        "temperature": 0.3,
-    }
-
-    with httpx.Client(timeout=30) as client:
-        r = client.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=payload,
-        )
-        r.raise_for_status()
-        data = r.json()
-
-    try:
-        return data["choices"][0]["message"]["content"]
-    except Exception as e:
-        raise RuntimeError(
-            f"Bad OpenAI response shape: {e}; "
-            f"raw={json.dumps(data, indent=2)[:800]}"
-        )
+    return await llm_client.chat_completion(system_prompt, user_text)
 
 # ---------- App ----------
 
 app = FastAPI(title="Ross-LLM Orchestrator", version="1.0.0")
+# Per-route latency/error/in-flight metrics and stage timings (telemetry.py)
+app.add_middleware(telemetry.TimingMiddleware)
 from routes.memory import router as memory_router
 from routes.pgvector_store import router as pgvector_router
 app.include_router(memory_router)
 app.include_router(pgvector_router)
+app.include_router(_response_cache.router)
+app.include_router(embedding_service.router)
+app.include_router(inmemory_index.router)
+app.include_router(reranker.router)
+app.include_router(telemetry.router)
+
+
+_background_tasks: set = set()
+
+
+@app.on_event("startup")
+async def _apply_migrations() -> None:
+    # Schema DDL runs once here, never on request paths.
+    if not migrations.MIGRATE_ON_STARTUP:
+        return
+    try:
+        result = await run_in_threadpool(migrations.run_migrations)
+        print(f"[migrations] schema version {result['version']}")
+    except Exception as e:  # pragma: no cover
+        print("Warning: schema migrations failed:", e)
+        return
+
+    # ANN indexes build CONCURRENTLY in the background; serving starts now.
+    if index_manager.ANN_INDEX_ON_STARTUP:
+        task = asyncio.get_running_loop().create_task(_maintain_ann_indexes())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+async def _maintain_ann_indexes() -> None:
+    # Re-run periodically so indexes tuned on a small table get retuned as it grows.
+    while True:
+        try:
+            await run_in_threadpool(index_manager.ensure_indexes)
+        except Exception as e:  # pragma: no cover
+            print("Warning: ANN index maintenance failed:", e)
+        if index_manager.ANN_RETUNE_INTERVAL <= 0:
+            return
+        await asyncio.sleep(index_manager.ANN_RETUNE_INTERVAL)
+
+
+async def _sync_inmemory_indexes() -> None:
+    while True:
+        try:
+            added = await run_in_threadpool(inmemory_index.sync_all)
+            if any(added.values()):
+                print(f"[inmemory_index] synced {added}")
+        except Exception as e:  # pragma: no cover
+            print("Warning: in-memory index sync failed:", e)
+        await asyncio.sleep(inmemory_index.INMEMORY_SYNC_INTERVAL)
+
+
+@app.on_event("startup")
+async def _start_inmemory_sync() -> None:
+    # Small tenants answer from an in-process matrix (INMEMORY_TENANTS);
+    # keep it caught up with ross.chunk_embeddings in the background.
+    if not inmemory_index.INMEMORY_TENANTS:
+        return
+    task = asyncio.get_running_loop().create_task(_sync_inmemory_indexes())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _prune_embedding_cache() -> None:
+    cache = embedding_cache.get_embedding_cache()
+    while True:
+        try:
+            deleted = await run_in_threadpool(cache.prune)
+            if deleted:
+                print(f"[embedding_cache] pruned {deleted} durable rows")
+        except Exception as e:  # pragma: no cover
+            print("Warning: embedding cache prune failed:", e)
+        await asyncio.sleep(embedding_cache.EMBED_CACHE_PRUNE_INTERVAL)
+
+
+@app.on_event("startup")
+async def _start_embedding_cache_prune() -> None:
+    # The durable tier would otherwise keep every query string ever embedded.
+    if not embedding_cache.EMBED_CACHE_DURABLE or embedding_cache.EMBED_CACHE_PRUNE_INTERVAL <= 0:
+        return
+    task = asyncio.get_running_loop().create_task(_prune_embedding_cache())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("startup")
+async def _listen_embedding_changes() -> None:
+    # embedding_worker NOTIFYs when it writes or deletes embeddings.
+    task = asyncio.get_running_loop().create_task(db.listen_embedding_changes())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("startup")
+async def _warm_reranker() -> None:
+    # Loading the cross-encoder inside a request would blow its rerank budget.
+    if not reranker.RERANK_PRELOAD:
+        return
+    try:
+        await reranker.warm_up()
+        print(f"[reranker] loaded {reranker.RERANK_MODEL_NAME}")
+    except Exception as e:  # pragma: no cover
+        print("Warning: reranker warm-up failed:", e)
+
+
+@app.on_event("shutdown")
+async def _close_shared_clients() -> None:
+    for task in list(_background_tasks):
+        task.cancel()
+    await llm_client.aclose()
+    await embedding_service.aclose()
+    await db.close_pool()
+    db.close_sync_pool()
 
 
 @app.get("/health")
@@ -141,58 +197,109 @@ def health():
 
 @app.get("/profiles")
 def list_profiles():
-    profiles = load_profiles()
+    snap = profile_registry.snapshot()
     return {
+        "version": snap.version,
         "profiles": [
             {
                 "name": v.get("name") or k,
                 "description": v.get("description", ""),
+                "tenant": v.get("tenant"),
             }
-            for k, v in profiles.items()
+            for k, v in snap.profiles.items()
         ]
     }
 
+@app.post("/profiles/reload")
+def reload_profiles():
+    return {"ok": True, **profile_registry.reload()}
 
-@app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
-    profile = get_profile(req.profile)
-    base_system_prompt = profile.get("system_prompt", "You are a helpful assistant for Ross.")
-    profile_name = profile.get("name", req.profile or "unknown")
 
-    # Load persona memory (ross_profile, kids_hq)
-    try:
-        persona_memory = load_persona_memory()
-    except Exception:
-        persona_memory = {}
-
-    persona_snippet_parts = []
-    if "ross_profile" in persona_memory:
-        persona_snippet_parts.append(
-            "Ross persona (YAML): " +
-            json.dumps(persona_memory["ross_profile"], ensure_ascii=False)
-        )
-    if "kids_hq" in persona_memory:
-        persona_snippet_parts.append(
-            "Kids info (YAML): " +
-            json.dumps(persona_memory["kids_hq"], ensure_ascii=False)
-        )
-
-    persona_snippet = "\n\n".join(persona_snippet_parts)
-    system_prompt = base_system_prompt + (
-        "\n\nPersistent private memory (StaffordOS):\n" + persona_snippet
-        if persona_snippet else ""
-    )
+def build_system_prompt(req: ChatRequest) -> tuple[str, str]:
+    """Return (system_prompt, profile_name) for a chat request."""
+    with telemetry.stage("prompt"):
+        profile = get_profile(req.profile)
+        base_system_prompt = profile["system_prompt"]
+        profile_name = profile.get("name", req.profile or "unknown")
+
+        # Persona memory (ross_profile, kids_hq) is pre-rendered by the store
+        try:
+            persona_fragment = persona_store.fragment()
+        except Exception:
+            persona_fragment = ""
+
+        system_prompt = base_system_prompt + persona_fragment
+    return system_prompt, profile_name
 
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest):
+    started = time.perf_counter()
+    system_prompt, profile_name = build_system_prompt(req)
     user_prompt = req.text
 
+    probe = await response_cache.lookup(profile_name, system_prompt, user_prompt)
+    if probe.reply is not None:
+        record_chat_success((time.perf_counter() - started) * 1000.0)
+        return ChatResponse(reply=probe.reply, profile=profile_name)
+
     try:
-        reply = call_openai_chat(system_prompt, user_prompt)
+        reply = await call_openai_chat(system_prompt, user_prompt)
     except Exception as e:
+        record_chat_error(str(e))
         raise HTTPException(status_code=500, detail=f"Orchestrator LLM error: {e}")
 
+    response_cache.store(probe, reply)
+    record_chat_success((time.perf_counter() - started) * 1000.0)
     return ChatResponse(reply=reply, profile=profile_name)
 
 
+def _sse(event: dict) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Server-Sent Events variant of /chat.
+
+    Emits `data: {"profile": ...}` first, then one `data: {"delta": "..."}`
+    per upstream token chunk, and finally `data: [DONE]`. Upstream errors
+    are reported in-band as `data: {"error": "..."}` because the 200 status
+    line has already been sent by then.
+    """
+    started = time.perf_counter()
+    system_prompt, profile_name = build_system_prompt(req)
+
+    async def events():
+        yield _sse({"profile": profile_name})
+        probe = await response_cache.lookup(profile_name, system_prompt, req.text)
+        if probe.reply is not None:
+            yield _sse({"delta": probe.reply, "cached": probe.hit})
+            yield "data: [DONE]\n\n"
+            record_chat_success((time.perf_counter() - started) * 1000.0)
+            return
+
+        parts = []
+        try:
+            async for delta in llm_client.stream_chat_completion(system_prompt, req.text):
+                parts.append(delta)
+                yield _sse({"delta": delta})
+        except Exception as e:
+            record_chat_error(str(e))
+            yield _sse({"error": f"Orchestrator LLM error: {e}"})
+        else:
+            response_cache.store(probe, "".join(parts))
+            record_chat_success((time.perf_counter() - started) * 1000.0)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 
 # StaffordOS status router (auto-added)
 try:
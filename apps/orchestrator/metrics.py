@@ -3,28 +3,40 @@ StaffordOS Metrics Endpoint (logger-aligned)
 
 Reads from the SAME DB as apps/orchestrator/execution_log.py and returns:
 - total calls in a time window
-- average latency
+- average latency and p50/p95/p99
 - per-endpoint breakdown
+
+Only the per-minute rollups (execution_log_rollup, maintained by the
+execution_log writer) are read, via their (minute, endpoint) primary key,
+so a 7-day window costs at most 10080 rows per endpoint rather than a
+scan of every logged request.
 """
 
 from fastapi import APIRouter, Query
+from fastapi.concurrency import run_in_threadpool
 from typing import Any, Dict, List
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 import sqlite3
+import time
 import os
 
+from histogram import LATENCY_BUCKETS_MS, quantile_from_buckets
+
 router = APIRouter()
 
 # Reuse DB_PATH from execution_log so we NEVER drift
 try:
-from execution_log import DB_PATH as EXEC_DB_PATH  # type: ignore
+    from execution_log import BUCKET_COLUMNS, DB_PATH as EXEC_DB_PATH  # type: ignore
     DB_PATH = EXEC_DB_PATH
     print(f"[metrics] Using Execution Logger DB_PATH={DB_PATH}")
 except Exception:
     # Fallback if import fails for some reason
+    BUCKET_COLUMNS = [f"b{i}" for i in range(len(LATENCY_BUCKETS_MS) + 1)]
     DB_PATH = os.path.join("data", "execution_log.sqlite")
     print(f"[metrics] Fallback DB_PATH={DB_PATH}")
 
+QUANTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
 
 def _get_conn() -> sqlite3.Connection:
     """
@@ -38,8 +50,43 @@ def _get_conn() -> sqlite3.Connection:
     return conn
 
 
+def _percentiles(counts: List[int], max_ms: Any) -> Dict[str, Any]:
+    return {
+        f"{name}_latency_ms": quantile_from_buckets(LATENCY_BUCKETS_MS, counts, q, max_ms)
+        for name, q in QUANTILES.items()
+    }
+
+
+def _summarize(cutoff_minute: int) -> List[sqlite3.Row]:
+    buckets = ", ".join(f"SUM({c}) AS {c}" for c in BUCKET_COLUMNS)
+    conn = _get_conn()
+    try:
+        return conn.execute(
+            f"""
+            SELECT
+                endpoint,
+                SUM(count) AS calls,
+                SUM(errors) AS errors,
+                SUM(sum_ms) AS sum_ms,
+                MIN(min_ms) AS min_ms,
+                MAX(max_ms) AS max_ms,
+                {buckets}
+            FROM execution_log_rollup
+            WHERE minute >= ?
+            GROUP BY endpoint
+            ORDER BY calls DESC
+            """,
+            (cutoff_minute,),
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # rollup table not created yet (no execution_log writer has run)
+        return []
+    finally:
+        conn.close()
+
+
 @router.get("/metrics/summary")
-def metrics_summary(
+async def metrics_summary(
     window_minutes: int = Query(
         1440,
         description="Time window in minutes (default: 1440 = last 24h)",
@@ -48,68 +95,51 @@ def metrics_summary(
     )
 ) -> Dict[str, Any]:
     """
-    Returns simple metrics for the given time window based on execution_log:
-    - total calls
-    - average latency
-    - per-endpoint counts + avg latency
+    Returns metrics for the given time window from the per-minute rollups:
+    - total calls, errors
+    - average latency plus p50/p95/p99 (estimated from histogram buckets)
+    - per-endpoint counts, avg latency and percentiles
 
-    NOTE: We assume execution_log has columns:
-      id, ts (TEXT), endpoint (TEXT), status (INT), latency_ms (INT), payload (TEXT)
+    The window is aligned to whole UTC minutes.
     """
-    now_utc = datetime.utcnow()
-    cutoff = now_utc - timedelta(minutes=window_minutes)
-    cutoff_str = cutoff.strftime("%Y-%m-%d %H:%M:%S")
+    now = time.time()
+    cutoff_minute = int(now // 60) - window_minutes + 1
+    cutoff_str = datetime.fromtimestamp(cutoff_minute * 60, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
 
-    conn = _get_conn()
-    cur = conn.cursor()
-
-    # Overall metrics
-    cur.execute(
-        """
-        SELECT
-            COUNT(*) AS total_calls,
-            COALESCE(AVG(latency_ms), 0) AS avg_latency_ms
-        FROM execution_log
-        WHERE ts >= ?
-        """,
-        (cutoff_str,),
-    )
-    row = cur.fetchone()
-    total_calls = row["total_calls"] if row else 0
-    avg_latency_ms = row["avg_latency_ms"] if row else 0
-
-    # Per-endpoint breakdown
-    cur.execute(
-        """
-        SELECT
-            endpoint,
-            COUNT(*) AS calls,
-            COALESCE(AVG(latency_ms), 0) AS avg_latency_ms
-        FROM execution_log
-        WHERE ts >= ?
-        GROUP BY endpoint
-        ORDER BY calls DESC
-        """,
-        (cutoff_str,),
-    )
-    rows = cur.fetchall()
+    rows = await run_in_threadpool(_summarize, cutoff_minute)
+
+    total_calls = 0
+    total_errors = 0
+    total_ms = 0.0
+    total_max = None
+    total_counts = [0] * len(BUCKET_COLUMNS)
     by_endpoint: List[Dict[str, Any]] = []
     for r in rows:
+        counts = [int(r[c] or 0) for c in BUCKET_COLUMNS]
+        total_calls += r["calls"]
+        total_errors += r["errors"]
+        total_ms += r["sum_ms"]
+        total_max = r["max_ms"] if total_max is None else max(total_max, r["max_ms"])
+        total_counts = [a + b for a, b in zip(total_counts, counts)]
         by_endpoint.append(
             {
                 "endpoint": r["endpoint"],
                 "calls": r["calls"],
-                "avg_latency_ms": r["avg_latency_ms"],
+                "errors": r["errors"],
+                "avg_latency_ms": r["sum_ms"] / r["calls"] if r["calls"] else 0,
+                "min_latency_ms": r["min_ms"],
+                "max_latency_ms": r["max_ms"],
+                **_percentiles(counts, r["max_ms"]),
             }
         )
 
-    conn.close()
-
     return {
         "ok": True,
         "window_minutes": window_minutes,
         "since_utc": cutoff_str,
         "total_calls": total_calls,
-        "avg_latency_ms": avg_latency_ms,
+        "total_errors": total_errors,
+        "avg_latency_ms": total_ms / total_calls if total_calls else 0,
+        **_percentiles(total_counts, total_max),
         "by_endpoint": by_endpoint,
     }
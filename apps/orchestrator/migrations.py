@@ -0,0 +1,287 @@
+"""
+Versioned schema migrations for the orchestrator's Postgres database.
+
+Runs once at startup (MIGRATE_ON_STARTUP=1) instead of issuing DDL on
+request paths. Migrations are:
+  - every packages/retriever/sql/NNN_*.sql file (copied to /app/sql in the
+    image; MIGRATIONS_DIR overrides), versioned by file stem
+  - Python migrations registered below for DDL that depends on config
+    (e.g. the docs table's vector dimension, the tenant list)
+
+After the versioned migrations, `ensure_tenant_partitions()` adds a
+ross.chunk_embeddings partition for any tenant added to tenant_config
+since the last startup.
+
+Applied versions are recorded in public.schema_migrations with a checksum.
+A pg_advisory_lock serializes concurrent startups (several replicas,
+workers). Run manually with `python migrations.py`.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg
+from psycopg import sql as psql
+
+from db import DATABASE_URL
+from tenant_config import DEFAULT_TENANT, list_tenants, partition_name
+
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") in ("1", "true", "True")
+EMBED_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+
+_ADVISORY_LOCK_ID = 0x524F5353  # "ROSS"
+_HAS_OWN_TRANSACTION = re.compile(r"^\s*BEGIN\s*;", re.IGNORECASE | re.MULTILINE)
+
+
+class Migration:
+    __slots__ = ("version", "source", "sql", "func")
+
+    def __init__(
+        self,
+        version: str,
+        source: str,
+        sql: Optional[str] = None,
+        func: Optional[Callable[[psycopg.Connection], None]] = None,
+    ) -> None:
+        self.version = version
+        self.source = source
+        self.sql = sql
+        self.func = func
+
+    @property
+    def checksum(self) -> str:
+        body = self.sql if self.sql is not None else self.source
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]
+
+    def apply(self, conn: psycopg.Connection) -> None:
+        if self.func is not None:
+            with conn.transaction():
+                self.func(conn)
+        elif self.sql is not None:
+            if _HAS_OWN_TRANSACTION.search(self.sql):
+                try:
+                    conn.execute(self.sql)
+                except Exception:
+                    # The script's own BEGIN left the session in an aborted
+                    # transaction; end it so the advisory unlock (and the
+                    # original error) get through.
+                    if conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+                        conn.execute("ROLLBACK")
+                    raise
+            else:
+                with conn.transaction():
+                    conn.execute(self.sql)
+
+
+# ---------- Python migrations ----------
+
+def _docs_table(conn: psycopg.Connection) -> None:
+    conn.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS docs(
+      id TEXT PRIMARY KEY,
+      content TEXT,
+      meta JSONB,
+      embedding vector({EMBED_DIM})
+    );
+    """)
+
+
+def ensure_tenant_partitions(conn: psycopg.Connection) -> List[str]:
+    """
+    One LIST partition per tenant. Rows for a tenant that had no partition
+    yet sit in the DEFAULT partition and are moved into the new one.
+    """
+    kind = conn.execute(
+        "SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass('ross.chunk_embeddings')"
+    ).fetchone()
+    if kind is None or kind[0] != "p":
+        return []
+    created: List[str] = []
+    default = psql.Identifier("ross", partition_name(None))
+    for tenant in list_tenants():
+        part = psql.Identifier("ross", partition_name(tenant))
+        exists = conn.execute(
+            "SELECT to_regclass(%s) IS NOT NULL", (f"ross.{partition_name(tenant)}",)
+        ).fetchone()[0]
+        if exists:
+            continue
+        with conn.transaction():
+            stranded = conn.execute(
+                psql.SQL("SELECT EXISTS (SELECT 1 FROM {} WHERE tenant = %s)").format(default),
+                (tenant,),
+            ).fetchone()[0]
+            if stranded:
+                conn.execute(psql.SQL("ALTER TABLE ross.chunk_embeddings DETACH PARTITION {}").format(default))
+            conn.execute(
+                psql.SQL("CREATE TABLE {} PARTITION OF ross.chunk_embeddings FOR VALUES IN ({})").format(
+                    part, psql.Literal(tenant)
+                )
+            )
+            if stranded:
+                conn.execute(
+                    psql.SQL("INSERT INTO ross.chunk_embeddings SELECT * FROM {} WHERE tenant = %s").format(default),
+                    (tenant,),
+                )
+                conn.execute(psql.SQL("DELETE FROM {} WHERE tenant = %s").format(default), (tenant,))
+                conn.execute(psql.SQL("ALTER TABLE ross.chunk_embeddings ATTACH PARTITION {} DEFAULT").format(default))
+        created.append(partition_name(tenant))
+    return created
+
+
+def _tenant_partitions(conn: psycopg.Connection) -> None:
+    # Every document belongs to exactly one tenant; metadata.tenant decides.
+    conn.execute(
+        psql.SQL(
+            "ALTER TABLE ross.documents ADD COLUMN IF NOT EXISTS tenant TEXT "
+            "GENERATED ALWAYS AS (COALESCE(metadata->>'tenant', {})) STORED"
+        ).format(psql.Literal(DEFAULT_TENANT))
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_tenant ON ross.documents (tenant)")
+
+    # chunk_embeddings -> LIST partitioned by tenant. The tenant is part of
+    # every key, so a search pinned to one tenant only touches its partition
+    # (and that partition's own ANN indexes, see index_manager).
+    conn.execute("""
+    CREATE TABLE ross.chunk_embeddings_new (
+      id            BIGSERIAL,
+      tenant        TEXT NOT NULL,
+      chunk_id      BIGINT NOT NULL REFERENCES ross.document_chunks(id) ON DELETE CASCADE,
+      model         TEXT NOT NULL,
+      embedding_384 vector(384) NOT NULL,
+      created_at    TIMESTAMPTZ NOT NULL DEFAULT now(),
+      CONSTRAINT chunk_embeddings_tenant_pkey PRIMARY KEY (tenant, id),
+      CONSTRAINT chunk_embeddings_tenant_chunk_model_key UNIQUE (tenant, chunk_id, model)
+    ) PARTITION BY LIST (tenant)
+    """)
+    conn.execute(
+        "CREATE TABLE ross.chunk_embeddings_default "
+        "PARTITION OF ross.chunk_embeddings_new DEFAULT"
+    )
+    for tenant in list_tenants():
+        conn.execute(
+            psql.SQL("CREATE TABLE {} PARTITION OF ross.chunk_embeddings_new FOR VALUES IN ({})").format(
+                psql.Identifier("ross", partition_name(tenant)), psql.Literal(tenant)
+            )
+        )
+    before = conn.execute("SELECT count(*) FROM ross.chunk_embeddings").fetchone()[0]
+    copied = conn.execute("""
+    INSERT INTO ross.chunk_embeddings_new (id, tenant, chunk_id, model, embedding_384, created_at)
+    SELECT e.id, d.tenant, e.chunk_id, e.model, e.embedding_384, e.created_at
+    FROM ross.chunk_embeddings e
+    JOIN ross.document_chunks c ON c.id = e.chunk_id
+    JOIN ross.documents d ON d.id = c.document_id
+    """).rowcount
+    if copied != before:
+        # Never drop embeddings silently; the transaction rolls back.
+        raise RuntimeError(
+            f"005_tenant_partitions: copied {copied} of {before} ross.chunk_embeddings rows "
+            "(embeddings without a chunk/document?); fix them and restart"
+        )
+    conn.execute("DROP TABLE ross.chunk_embeddings")
+    conn.execute("ALTER TABLE ross.chunk_embeddings_new RENAME TO chunk_embeddings")
+    conn.execute("ALTER SEQUENCE ross.chunk_embeddings_new_id_seq RENAME TO chunk_embeddings_id_seq")
+    conn.execute(
+        "SELECT setval('ross.chunk_embeddings_id_seq', "
+        "GREATEST((SELECT max(id) FROM ross.chunk_embeddings), 1))"
+    )
+    conn.execute("CREATE INDEX idx_chunk_embeddings_chunk ON ross.chunk_embeddings (chunk_id)")
+
+    # /ingest + /retrieve/vector docs: tenant column, per-tenant partial ANN
+    # indexes are built by index_manager.
+    conn.execute(
+        psql.SQL("ALTER TABLE docs ADD COLUMN IF NOT EXISTS tenant TEXT NOT NULL DEFAULT {}").format(
+            psql.Literal(DEFAULT_TENANT)
+        )
+    )
+    conn.execute("UPDATE docs SET tenant = meta->>'tenant' WHERE meta->>'tenant' IS NOT NULL")
+
+
+PYTHON_MIGRATIONS: List[Migration] = [
+    Migration("004_docs_table", f"python:_docs_table(dim={EMBED_DIM})", func=_docs_table),
+    Migration(
+        "005_tenant_partitions",
+        f"python:_tenant_partitions(default={DEFAULT_TENANT})",
+        func=_tenant_partitions,
+    ),
+]
+
+
+# ---------- discovery + runner ----------
+
+def migrations_dir() -> Optional[Path]:
+    env = os.getenv("MIGRATIONS_DIR")
+    candidates = [Path(env)] if env else []
+    here = Path(__file__).resolve()
+    candidates += [
+        here.parent / "sql",                                    # container: /app/sql
+        here.parents[2] / "packages" / "retriever" / "sql",     # repo checkout
+    ]
+    for c in candidates:
+        if c.is_dir():
+            return c
+    return None
+
+
+def discover() -> List[Migration]:
+    found: List[Migration] = list(PYTHON_MIGRATIONS)
+    d = migrations_dir()
+    if d is not None:
+        for f in sorted(d.glob("*.sql")):
+            found.append(Migration(f.stem, str(f), sql=f.read_text(encoding="utf-8")))
+    return sorted(found, key=lambda m: m.version)
+
+
+def run_migrations(dsn: str = DATABASE_URL) -> Dict[str, Any]:
+    applied_now: List[str] = []
+    drifted: List[str] = []
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute("SELECT pg_advisory_lock(%s)", (_ADVISORY_LOCK_ID,))
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS public.schema_migrations (
+                  version    TEXT PRIMARY KEY,
+                  checksum   TEXT NOT NULL,
+                  source     TEXT,
+                  applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """
+            )
+            applied = dict(conn.execute("SELECT version, checksum FROM public.schema_migrations").fetchall())
+
+            for m in discover():
+                if m.version in applied:
+                    if applied[m.version] != m.checksum:
+                        drifted.append(m.version)
+                    continue
+                m.apply(conn)
+                conn.execute(
+                    "INSERT INTO public.schema_migrations (version, checksum, source) VALUES (%s, %s, %s)",
+                    (m.version, m.checksum, m.source),
+                )
+                applied_now.append(m.version)
+                print(f"[migrations] applied {m.version}")
+
+            for part in ensure_tenant_partitions(conn):
+                print(f"[migrations] created partition ross.{part}")
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s)", (_ADVISORY_LOCK_ID,))
+
+    for v in drifted:
+        print(f"[migrations] warning: {v} changed since it was applied (not re-run)")
+    return {"applied": applied_now, "drifted": drifted, "version": schema_version(dsn)}
+
+
+def schema_version(dsn: str = DATABASE_URL) -> Optional[str]:
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        row = conn.execute("SELECT max(version) FROM public.schema_migrations").fetchone()
+    return row[0] if row else None
+
+
+if __name__ == "__main__":
+    print(run_migrations())
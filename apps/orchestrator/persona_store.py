@@ -0,0 +1,146 @@
+"""
+Persona memory store (StaffordOS private memory).
+
+Parses the persona YAML files once, keeps both the parsed dict and the
+rendered system-prompt fragment in memory, and only re-parses when the
+directory signature (mtime/size of the YAML files) changes. The signature
+check itself is rate-limited by PERSONA_CHECK_INTERVAL seconds.
+
+Shared by /chat (main.py), /memory/* (routes/memory.py) and
+state.ROSS_STATE["persona_memory"].
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import yaml  # type: ignore
+except Exception:  # pragma: no cover
+    yaml = None  # type: ignore
+
+from file_watch import Signature, dir_signature
+from state import ROSS_STATE
+
+PERSONA_GLOB = "*.y*ml"
+PERSONA_CHECK_INTERVAL = float(os.getenv("PERSONA_CHECK_INTERVAL", "2"))
+
+
+def candidate_persona_dirs() -> List[Path]:
+    """
+    In-container layout (WORKDIR=/app):
+      /app/data/persona  (preferred, if present)
+      /app/profiles      (fallback)
+    """
+    app_dir = Path(__file__).resolve().parent
+    return [
+        app_dir / "data" / "persona",
+        app_dir / "profiles",
+    ]
+
+
+def _render_fragment(memory: Dict[str, Any]) -> str:
+    parts = []
+    if "ross_profile" in memory:
+        parts.append(
+            "Ross persona (YAML): " +
+            json.dumps(memory["ross_profile"], ensure_ascii=False)
+        )
+    if "kids_hq" in memory:
+        parts.append(
+            "Kids info (YAML): " +
+            json.dumps(memory["kids_hq"], ensure_ascii=False)
+        )
+    snippet = "\n\n".join(parts)
+    if not snippet:
+        return ""
+    return "\n\nPersistent private memory (StaffordOS):\n" + snippet
+
+
+class PersonaStore:
+    def __init__(self, dirs: List[Path], check_interval: float = PERSONA_CHECK_INTERVAL) -> None:
+        self.dirs = dirs
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._dir: Optional[Path] = None
+        self._signature: Optional[Signature] = None
+        self._memory: Dict[str, Any] = {}
+        self._fragment = ""
+        self._checked_at = 0.0
+        self.loaded_at: Optional[float] = None
+        self.loads = 0
+
+    def _active_dir(self) -> Optional[Path]:
+        for d in self.dirs:
+            if d.is_dir():
+                return d
+        return None
+
+    def _load(self, directory: Optional[Path], signature: Signature) -> None:
+        memory: Dict[str, Any] = {}
+        if yaml is None:
+            memory["_error"] = "pyyaml_not_installed"
+        elif directory is not None:
+            for f in sorted(directory.glob(PERSONA_GLOB)):
+                try:
+                    data = yaml.safe_load(f.read_text(encoding="utf-8")) or {}
+                except Exception as e:
+                    data = {"_error": f"failed_to_parse: {e!r}"}
+                memory[f.stem] = data
+
+        # Swap all views together; readers never see a half-built state.
+        self._memory = memory
+        self._fragment = _render_fragment(memory)
+        self._dir = directory
+        self._signature = signature
+        self.loaded_at = time.time()
+        self.loads += 1
+        ROSS_STATE["persona_memory"] = memory
+
+    def _maybe_refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and self._signature is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if not force and self._signature is not None and now - self._checked_at < self.check_interval:
+                return
+            directory = self._active_dir()
+            signature = dir_signature(directory, PERSONA_GLOB)
+            if force or signature != self._signature or directory != self._dir:
+                self._load(directory, signature)
+            self._checked_at = now
+
+    def memory(self) -> Dict[str, Any]:
+        self._maybe_refresh()
+        return self._memory
+
+    def fragment(self) -> str:
+        """System-prompt fragment appended to every profile's prompt."""
+        self._maybe_refresh()
+        return self._fragment
+
+    def reload(self) -> Dict[str, Any]:
+        self._maybe_refresh(force=True)
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "dir": str(self._dir) if self._dir else None,
+            "files": len(self._signature or ()),
+            "loads": self.loads,
+            "loaded_at": self.loaded_at,
+        }
+
+
+_store: Optional[PersonaStore] = None
+
+
+def get_persona_store() -> PersonaStore:
+    global _store
+    if _store is None:
+        _store = PersonaStore(candidate_persona_dirs())
+    return _store
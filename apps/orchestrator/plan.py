@@ -1,20 +1,73 @@
 from __future__ import annotations
 
+import os
 import time
 from typing import Any, Dict, List, Optional
 
-import httpx
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from execution_log import log_event
+from retrieval_parallel import MultiRetrieveRequest, RetrievalRequestError, retrieve_multi
+from tasks_decompose import heuristic_decompose
+from telemetry import span
 
 router = APIRouter(tags=["plan"])
 
+PLAN_RERANK = os.getenv("PLAN_RERANK", "0") in ("1", "true", "True")
+
 
 class PlanRequest(BaseModel):
     goal: str
-    max_subtasks: int = 6
-    top_k: int = 2
+    # same bounds as /tasks/decompose and /retrieve/multi
+    max_subtasks: int = Field(6, ge=1, le=20)
+    top_k: int = Field(2, ge=1, le=50)
+    profile: Optional[str] = None  # retrieval stays inside this profile's tenant (none: the general profile's)
+    rerank: bool = PLAN_RERANK  # cross-encoder pass over over-fetched candidates
+    rerank_budget_ms: Optional[float] = None
+
+
+async def build_plan(body: PlanRequest) -> Dict[str, Any]:
+    """
+    Decompose the goal and retrieve context for every subtask, in-process.
+
+    Calls heuristic_decompose() and the retrieval engine as plain Python
+    functions (no loopback HTTP, JSON or second validation pass); the
+    /tasks/decompose and /retrieve/multi routes wrap the same functions.
+    Returns (subtasks, retrieval block) as the /plan response expects.
+    """
+    # 1) Decompose goal into subtasks
+    with span("decompose"):
+        subtasks: List[Dict[str, Any]] = [
+            t.model_dump() for t in heuristic_decompose(body.goal, body.max_subtasks)
+        ]
+    if not subtasks:
+        # Fallback: single subtask using the goal itself
+        subtasks = [
+            {"id": 1, "text": body.goal},
+        ]
+
+    # 2) Parallel retrieval for each subtask text
+    queries = [s.get("text", "") for s in subtasks if s.get("text")]
+    if not queries:
+        queries = [body.goal]
+
+    # We don't hard-fail if retrieval isn't ok; we just include what we got
+    with span("retrieve", queries=len(queries)):
+        try:
+            retrieval = await retrieve_multi(
+                MultiRetrieveRequest(
+                    queries=queries,
+                    top_k=body.top_k,
+                    profile=body.profile,
+                    rerank=body.rerank,
+                    rerank_budget_ms=body.rerank_budget_ms,
+                )
+            )
+            retrieval_block: Dict[str, Any] = retrieval.model_dump()
+        except RetrievalRequestError as e:
+            retrieval_block = {"ok": False, "detail": str(e)}
+
+    return {"subtasks": subtasks, "retrieval": retrieval_block}
 
 
 @router.post("/plan")
@@ -22,59 +75,16 @@ async def plan_endpoint(body: PlanRequest) -> Dict[str, Any]:
     """
     High-level planner endpoint.
 
-    - Calls /tasks/decompose to break the goal into subtasks
-    - Calls /retrieve/multi to fetch parallel context for each subtask
+    - Decomposes the goal into subtasks (build_plan, in-process)
+    - Fetches parallel context for each subtask
     - Logs execution via Execution Logger
     """
     start = time.time()
-    status_code: int = 200
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # 1) Decompose goal into subtasks
-            decompose_payload = {
-                "goal": body.goal,
-                "max_subtasks": body.max_subtasks,
-            }
-            decomp_resp = await client.post(
-                "http://127.0.0.1:8000/tasks/decompose",
-                json=decompose_payload,
-            )
-            decomp_data = decomp_resp.json()
-
-            if not decomp_resp.is_success or not decomp_data.get("ok", False):
-                raise HTTPException(
-                    status_code=500,
-                    detail={
-                        "message": "Task decomposition failed",
-                        "payload": decomp_data,
-                    },
-                )
-
-            subtasks: List[Dict[str, Any]] = decomp_data.get("subtasks", [])
-            if not subtasks:
-                # Fallback: single subtask using the goal itself
-                subtasks = [
-                    {"id": 1, "text": body.goal},
-                ]
-
-            # 2) Parallel retrieval for each subtask text
-            queries = [s.get("text", "") for s in subtasks if s.get("text")]
-            if not queries:
-                queries = [body.goal]
-
-            retrieve_payload = {
-                "queries": queries,
-                "top_k": body.top_k,
-            }
-            retr_resp = await client.post(
-                "http://127.0.0.1:8000/retrieve/multi",
-                json=retrieve_payload,
-            )
-            retr_data = retr_resp.json()
-
-            # We don't hard-fail if retrieval isn't ok; we just include what we got
-            retrieval_block: Dict[str, Any] = retr_data
+        planned = await build_plan(body)
+        subtasks = planned["subtasks"]
+        retrieval_block = planned["retrieval"]
 
         latency_ms = int((time.time() - start) * 1000)
 
@@ -95,6 +105,7 @@ async def plan_endpoint(body: PlanRequest) -> Dict[str, Any]:
                 "goal": body.goal,
                 "max_subtasks": body.max_subtasks,
                 "top_k": body.top_k,
+                "profile": body.profile,
                 "subtask_count": len(subtasks),
                 "retrieval_ok": bool(retrieval_block.get("ok", False)),
             },
@@ -102,22 +113,6 @@ async def plan_endpoint(body: PlanRequest) -> Dict[str, Any]:
 
         return result
 
-    except HTTPException:
-        # Let FastAPI handle this but still log it
-        latency_ms = int((time.time() - start) * 1000)
-        log_event(
-            endpoint="/plan",
-            status=500,
-            latency_ms=latency_ms,
-            payload={
-                "goal": body.goal,
-                "max_subtasks": body.max_subtasks,
-                "top_k": body.top_k,
-                "error": "HTTPException in plan_endpoint",
-            },
-        )
-        raise
-
     except Exception as e:  # pragma: no cover
         latency_ms = int((time.time() - start) * 1000)
         log_event(
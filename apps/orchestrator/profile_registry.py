@@ -0,0 +1,139 @@
+"""
+Hot-reloadable profile registry.
+
+Profiles come from two places:
+  - profiles/*.yaml            (system prompts, descriptions)
+  - tenant_config.TENANT_PROFILES (tenant walls, descriptions, tags)
+
+The registry merges both into one name-indexed snapshot with each
+profile's system prompt precompiled. When a YAML file changes, a new
+snapshot is built off to the side and swapped in with one reference
+assignment, and `version` is bumped so downstream caches can key on it.
+
+Chat only uses profiles that have a YAML file; a name defined only in
+TENANT_PROFILES is listed (with its tenant) but chats with the `general`
+profile, as before the merge.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import yaml
+
+from file_watch import Signature, dir_signature
+from tenant_config import TENANT_PROFILES
+
+PROFILE_DIR = Path(__file__).parent / "profiles"
+PROFILE_GLOB = "*.yaml"
+PROFILE_CHECK_INTERVAL = float(os.getenv("PROFILE_CHECK_INTERVAL", "2"))
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant for Ross."
+
+
+def _compile_system_prompt(name: str, data: Dict[str, Any]) -> str:
+    prompt = (data.get("system_prompt") or "").strip()
+    if prompt:
+        return prompt
+    description = (data.get("description") or "").strip()
+    if description:
+        return f"You are the {name} profile of Ross-LLM.\n\n{description}"
+    return DEFAULT_SYSTEM_PROMPT
+
+
+class ProfileSnapshot:
+    """Immutable view of all profiles at one registry version."""
+
+    __slots__ = ("version", "profiles", "loaded_at")
+
+    def __init__(self, version: int, profiles: Dict[str, Dict[str, Any]]) -> None:
+        self.version = version
+        self.profiles = profiles
+        self.loaded_at = time.time()
+
+
+class ProfileRegistry:
+    def __init__(self, profile_dir: Path = PROFILE_DIR, check_interval: float = PROFILE_CHECK_INTERVAL) -> None:
+        self.profile_dir = profile_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature: Optional[Signature] = None
+        self._snapshot = ProfileSnapshot(0, {})
+        self._checked_at = 0.0
+
+    def _build(self, version: int) -> ProfileSnapshot:
+        merged: Dict[str, Dict[str, Any]] = {}
+
+        for p in sorted(self.profile_dir.glob(PROFILE_GLOB)) if self.profile_dir.is_dir() else []:
+            try:
+                with p.open("r") as f:
+                    data = yaml.safe_load(f) or {}
+            except Exception:
+                continue
+            name = data.get("name") or p.stem
+            merged[name] = dict(data, name=name, source="yaml")
+
+        for name, meta in TENANT_PROFILES.items():
+            entry = merged.setdefault(name, {"name": name, "source": "tenant_config"})
+            entry.setdefault("description", meta.get("description", ""))
+            entry.setdefault("tenant", meta.get("tenant"))
+            entry.setdefault("tags", list(meta.get("tags", [])))
+
+        for name, entry in merged.items():
+            entry["system_prompt"] = _compile_system_prompt(name, entry)
+
+        return ProfileSnapshot(version, merged)
+
+    def snapshot(self, force: bool = False) -> ProfileSnapshot:
+        now = time.monotonic()
+        if not force and self._signature is not None and now - self._checked_at < self.check_interval:
+            return self._snapshot
+        with self._lock:
+            signature = dir_signature(self.profile_dir, PROFILE_GLOB)
+            if force or signature != self._signature:
+                # Build first, then swap the reference: readers holding the
+                # old snapshot keep a consistent view.
+                self._snapshot = self._build(self._snapshot.version + 1)
+                self._signature = signature
+            self._checked_at = now
+            return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self.snapshot().version
+
+    def profiles(self) -> Dict[str, Dict[str, Any]]:
+        return self.snapshot().profiles
+
+    def get(self, name: Optional[str]) -> Dict[str, Any]:
+        profiles = self.profiles()
+        if name and profiles.get(name, {}).get("source") == "yaml":
+            return profiles[name]
+        if profiles.get("general", {}).get("source") == "yaml":
+            return profiles["general"]
+        yaml_profiles = [p for p in profiles.values() if p.get("source") == "yaml"]
+        if yaml_profiles:
+            # return first defined profile
+            return yaml_profiles[0]
+        # super-safe fallback
+        return {
+            "name": "fallback",
+            "system_prompt": DEFAULT_SYSTEM_PROMPT,
+        }
+
+    def reload(self) -> Dict[str, Any]:
+        snap = self.snapshot(force=True)
+        return {"version": snap.version, "count": len(snap.profiles), "loaded_at": snap.loaded_at}
+
+
+_registry: Optional[ProfileRegistry] = None
+
+
+def get_profile_registry() -> ProfileRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ProfileRegistry()
+    return _registry
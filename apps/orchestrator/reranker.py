@@ -0,0 +1,226 @@
+"""
+Cross-encoder reranking for retrieval results.
+
+/retrieve/multi (rerank=true) over-fetches RERANK_CANDIDATES rows per query
+and calls `rerank()`, which scores (query, chunk text) pairs with a local
+CrossEncoder and returns the best top_k. Candidates carry only a 300-char
+snippet, so the full text of the chunks still to be scored is read from
+ross.document_chunks first (the snippet is used if that read fails).
+
+Config:
+  RERANK_MODEL_NAME   HF cross-encoder
+  RERANK_CANDIDATES   rows fetched per query before reranking
+  RERANK_BATCH_SIZE   pairs per predict() call
+  RERANK_WORKERS      threads in the dedicated scoring executor
+  RERANK_BUDGET_MS    default per-request time budget
+  RERANK_CACHE_SIZE   (query, chunk) scores kept in the LRU
+  RERANK_PRELOAD      load the model (and run one predict) at startup;
+                      defaults to PLAN_RERANK, since the first load would
+                      otherwise eat the budget of the first requests
+
+Scoring runs in batches on its own executor, never on the event loop or
+the embedding executor. If the budget runs out before every candidate is
+scored, the request keeps the first-stage (vector/RRF) order; batches that
+finish late still land in the score cache, so a repeat of the query is
+usually answered from cache within budget.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter
+
+import telemetry
+from histogram import LATENCY_BUCKETS_MS, Histogram
+
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "1"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "250"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+RERANK_PRELOAD = os.getenv("RERANK_PRELOAD", os.getenv("PLAN_RERANK", "0")) in ("1", "true", "True")
+
+router = APIRouter(prefix="/rerank", tags=["retrieval"])
+
+_model: Any = None
+_model_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=RERANK_WORKERS, thread_name_prefix="rerank")
+
+
+def get_model():
+    """Return the shared CrossEncoder, loading it once."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+
+                _model = CrossEncoder(RERANK_MODEL_NAME)
+    return _model
+
+
+def _warm_up() -> None:
+    get_model().predict([("warm up", "warm up")])
+
+
+async def warm_up() -> None:
+    """Load the model and run one predict on the scoring executor."""
+    await asyncio.get_running_loop().run_in_executor(_executor, _warm_up)
+
+
+class ScoreCache:
+    """LRU of cross-encoder scores keyed by (query hash, chunk id, snippet hash)."""
+
+    def __init__(self, size: int = RERANK_CACHE_SIZE) -> None:
+        self.size = size
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[Tuple[str, int, str], float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: List[Tuple[str, int, str]]) -> Dict[Tuple[str, int, str], float]:
+        out: Dict[Tuple[str, int, str], float] = {}
+        with self._lock:
+            for k in keys:
+                score = self._lru.get(k)
+                if score is None:
+                    continue
+                self._lru.move_to_end(k)
+                out[k] = score
+            self.hits += len(out)
+            self.misses += len(keys) - len(out)
+        return out
+
+    def put_many(self, items: List[Tuple[Tuple[str, int, str], float]]) -> None:
+        with self._lock:
+            for k, score in items:
+                self._lru[k] = score
+                self._lru.move_to_end(k)
+            while len(self._lru) > self.size:
+                self._lru.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._lru), "max_entries": self.size, "hits": self.hits, "misses": self.misses}
+
+
+_cache = ScoreCache()
+_latency = Histogram(LATENCY_BUCKETS_MS)
+_stats: Dict[str, int] = {
+    "requests": 0,
+    "completed": 0,
+    "budget_exceeded": 0,
+    "errors": 0,
+    "snippet_fallbacks": 0,
+}
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+async def _chunk_texts(ids: List[int]) -> Dict[int, str]:
+    from db import get_pool
+
+    pool = await get_pool()
+    with telemetry.span("sql", stmt="rerank_chunks", rows=len(ids)):
+        async with pool.connection() as conn:
+            cur = await conn.execute(
+                "SELECT id, content FROM ross.document_chunks WHERE id = ANY(%s)", (ids,)
+            )
+            rows = await cur.fetchall()
+    return {int(i): c for i, c in rows if c}
+
+
+def _score_batch(query: str, keys: List[Tuple[str, int, str]], texts: List[str]) -> None:
+    scores = get_model().predict([(query, t) for t in texts], batch_size=RERANK_BATCH_SIZE)
+    _cache.put_many([(k, float(s)) for k, s in zip(keys, scores)])
+
+
+async def rerank(
+    query: str,
+    docs: List[Dict[str, Any]],
+    top_k: int,
+    deadline: Optional[float] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Reorder `docs` by cross-encoder score; returns (docs[:top_k], reranked).
+
+    `deadline` is a time.monotonic() value shared by every query of one
+    request. When it passes first, the input order is kept (reranked=False).
+    """
+    if not docs:
+        return docs, True
+    _stats["requests"] += 1
+    started = time.monotonic()
+    if deadline is None:
+        deadline = started + RERANK_BUDGET_MS / 1000.0
+
+    qh = _hash(query)
+    keys = [(qh, int(d["id"]), _hash(d.get("snippet") or "")) for d in docs]
+    scores = _cache.get_many(keys)
+    todo = [i for i, k in enumerate(keys) if k not in scores]
+
+    if todo:
+        texts = {int(docs[i]["id"]): docs[i].get("snippet") or "" for i in todo}
+        try:
+            remaining = deadline - time.monotonic()
+            texts.update(await asyncio.wait_for(_chunk_texts(list(texts)), max(0.0, remaining)))
+        except Exception as e:  # score the snippets instead
+            _stats["snippet_fallbacks"] += 1
+            print(f"[reranker] chunk text read failed, scoring snippets: {e!r}")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for start in range(0, len(todo), RERANK_BATCH_SIZE):
+            idx = todo[start:start + RERANK_BATCH_SIZE]
+            futures.append(
+                loop.run_in_executor(
+                    _executor,
+                    _score_batch,
+                    query,
+                    [keys[i] for i in idx],
+                    [texts[int(docs[i]["id"])] for i in idx],
+                )
+            )
+        remaining = deadline - time.monotonic()
+        done, pending = await asyncio.wait(futures, timeout=max(0.0, remaining))
+        for f in pending:
+            # Batches not yet started are dropped; running ones still fill the cache.
+            f.cancel()
+        failed = [f for f in done if not f.cancelled() and f.exception() is not None]
+        if failed:
+            _stats["errors"] += 1
+            print(f"[reranker] scoring failed: {failed[0].exception()!r}")
+        if pending or failed:
+            _stats["budget_exceeded"] += bool(pending)
+            _latency.observe((time.monotonic() - started) * 1000.0)
+            return docs[:top_k], False
+        scores = _cache.get_many(keys)
+        if len(scores) < len(keys):
+            return docs[:top_k], False
+
+    ranked = sorted(range(len(docs)), key=lambda i: scores[keys[i]], reverse=True)[:top_k]
+    _stats["completed"] += 1
+    _latency.observe((time.monotonic() - started) * 1000.0)
+    return [{**docs[i], "rerank_score": scores[keys[i]]} for i in ranked], True
+
+
+@router.get("/stats")
+def rerank_stats() -> Dict[str, Any]:
+    return {
+        "ok": True,
+        "model": RERANK_MODEL_NAME,
+        "loaded": _model is not None,
+        "budget_ms": RERANK_BUDGET_MS,
+        **_stats,
+        "latency_ms": _latency.snapshot(),
+        "cache": _cache.snapshot(),
+    }
@@ -0,0 +1,241 @@
+"""
+Optional response cache in front of the model call for /chat.
+
+Two lookups, both scoped to a tenant (tenant_config) and a profile:
+  1) exact:    sha256(profile, system prompt, text)
+  2) semantic: nearest cached prompt by embedding (embedding_service) with the
+               same profile and system prompt, accepted when cosine
+               similarity >= RESPONSE_CACHE_SIMILARITY
+
+Each tenant has its own LRU (RESPONSE_CACHE_MAX_ENTRIES) with a TTL, so
+one tenant's traffic can neither read nor evict another tenant's entries.
+
+Disabled unless RESPONSE_CACHE_ENABLED=1.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter
+
+import embedding_service
+from tenant_config import get_tenant_for_profile
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0") in ("1", "true", "True")
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "1") in ("1", "true", "True")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+
+router = APIRouter(prefix="/cache/response", tags=["cache"])
+
+
+def _sha(*parts: str) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+async def _embed(text: str) -> List[float]:
+    return (await embedding_service.aembed([text]))[0].tolist()
+
+
+class _Entry:
+    __slots__ = ("profile", "prompt_hash", "reply", "vector", "expires_at")
+
+    def __init__(self, profile: str, prompt_hash: str, reply: str, vector: Optional[List[float]], expires_at: float) -> None:
+        self.profile = profile
+        self.prompt_hash = prompt_hash
+        self.reply = reply
+        self.vector = vector
+        self.expires_at = expires_at
+
+
+class CacheProbe:
+    """Result of a lookup; pass it back to `store()` on a miss."""
+
+    __slots__ = ("tenant", "profile", "prompt_hash", "key", "vector", "reply", "hit")
+
+    def __init__(self, tenant: str, profile: str, prompt_hash: str, key: str) -> None:
+        self.tenant = tenant
+        self.profile = profile
+        self.prompt_hash = prompt_hash
+        self.key = key
+        self.vector: Optional[List[float]] = None
+        self.reply: Optional[str] = None
+        self.hit: Optional[str] = None  # "exact" | "semantic" | None
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        semantic: bool = RESPONSE_CACHE_SEMANTIC,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+    ) -> None:
+        self.enabled = enabled
+        self.semantic = semantic
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._tenants: Dict[str, "OrderedDict[str, _Entry]"] = {}
+        self.stats: Dict[str, int] = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+
+    @staticmethod
+    def tenant_for(profile: str) -> str:
+        try:
+            return get_tenant_for_profile(profile)
+        except KeyError:
+            # Profiles outside tenant_config get a private partition each.
+            return f"profile:{profile}"
+
+    def _bucket(self, tenant: str) -> "OrderedDict[str, _Entry]":
+        bucket = self._tenants.get(tenant)
+        if bucket is None:
+            bucket = self._tenants[tenant] = OrderedDict()
+        return bucket
+
+    def _exact(self, probe: CacheProbe, now: float) -> Optional[str]:
+        with self._lock:
+            bucket = self._bucket(probe.tenant)
+            entry = bucket.get(probe.key)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                del bucket[probe.key]
+                self.stats["expired"] += 1
+                return None
+            bucket.move_to_end(probe.key)
+            return entry.reply
+
+    def _nearest(self, probe: CacheProbe, now: float) -> Optional[str]:
+        import numpy as np
+
+        with self._lock:
+            bucket = self._bucket(probe.tenant)
+            keys = [
+                k for k, e in bucket.items()
+                if e.vector is not None
+                and e.expires_at > now
+                and e.profile == probe.profile
+                and e.prompt_hash == probe.prompt_hash
+            ]
+            if not keys:
+                return None
+            matrix = np.asarray([bucket[k].vector for k in keys], dtype=np.float32)
+
+        # Vectors are L2-normalized, so the dot product is cosine similarity.
+        sims = matrix @ np.asarray(probe.vector, dtype=np.float32)
+        best = int(np.argmax(sims))
+        if float(sims[best]) < self.similarity:
+            return None
+
+        with self._lock:
+            entry = self._bucket(probe.tenant).get(keys[best])
+            if entry is None:
+                return None
+            self._bucket(probe.tenant).move_to_end(keys[best])
+            return entry.reply
+
+    async def lookup(self, profile: str, system_prompt: str, text: str) -> CacheProbe:
+        tenant = self.tenant_for(profile)
+        prompt_hash = _sha(system_prompt)
+        probe = CacheProbe(tenant, profile, prompt_hash, _sha(profile, prompt_hash, text))
+        if not self.enabled:
+            return probe
+
+        now = time.time()
+        reply = self._exact(probe, now)
+        if reply is not None:
+            self.stats["exact_hits"] += 1
+            probe.reply, probe.hit = reply, "exact"
+            return probe
+
+        if self.semantic:
+            try:
+                probe.vector = await _embed(text)
+            except Exception:
+                probe.vector = None
+            if probe.vector is not None:
+                reply = self._nearest(probe, now)
+                if reply is not None:
+                    self.stats["semantic_hits"] += 1
+                    probe.reply, probe.hit = reply, "semantic"
+                    return probe
+
+        self.stats["misses"] += 1
+        return probe
+
+    def store(self, probe: CacheProbe, reply: str) -> None:
+        if not self.enabled or probe.hit:
+            return
+        entry = _Entry(probe.profile, probe.prompt_hash, reply, probe.vector, time.time() + self.ttl)
+        with self._lock:
+            bucket = self._bucket(probe.tenant)
+            bucket[probe.key] = entry
+            bucket.move_to_end(probe.key)
+            while len(bucket) > self.max_entries:
+                bucket.popitem(last=False)
+                self.stats["evictions"] += 1
+            self.stats["stores"] += 1
+
+    def clear(self, tenant: Optional[str] = None) -> None:
+        with self._lock:
+            if tenant is None:
+                self._tenants.clear()
+            else:
+                self._tenants.pop(tenant, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = {t: len(b) for t, b in self._tenants.items()}
+        lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        return {
+            "enabled": self.enabled,
+            "semantic": self.semantic,
+            "similarity": self.similarity,
+            "ttl_seconds": self.ttl,
+            "max_entries_per_tenant": self.max_entries,
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+            **self.stats,
+            "entries_by_tenant": sizes,
+        }
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
+
+
+@router.get("/stats")
+def response_cache_stats() -> Dict[str, Any]:
+    return {"ok": True, **get_response_cache().snapshot()}
+
+
+@router.post("/clear")
+def response_cache_clear(tenant: Optional[str] = None) -> Dict[str, Any]:
+    get_response_cache().clear(tenant)
+    return {"ok": True, "cleared": tenant or "all"}
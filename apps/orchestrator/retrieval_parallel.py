@@ -1,54 +1,90 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Literal, Optional
 import os
 import time
 import hashlib
 
-import psycopg
+import asyncio
+
+import numpy as np
+
+from psycopg import sql as psql
 from psycopg.rows import dict_row
-from pgvector.psycopg import register_vector
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 
-# Optional (but already in your requirements.txt)
-from sentence_transformers import SentenceTransformer
+import embedding_service
+import inmemory_index
+import reranker
+import telemetry
+from db import get_pool, has_embeddings
+from index_manager import ann_order, partial_predicate, rescore_limit, settings_statement
+from parallel_utils import run_parallel
+from tenant_config import DEFAULT_TENANT, partition_name, resolve_tenant
 
 
 router = APIRouter()
 
-DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/rossllm")
-EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
-EMBED_MODEL_TAG  = os.getenv("EMBED_MODEL_TAG", "all-MiniLM-L6-v2")  # stored in ross.chunk_embeddings.model
-
-
-def _connect():
-    conn = psycopg.connect(DATABASE_URL)
-    register_vector(conn)
-    return conn
+EMBED_MODEL_NAME = embedding_service.EMBED_MODEL_NAME
+EMBED_MODEL_TAG = embedding_service.EMBED_MODEL_TAG  # stored in ross.chunk_embeddings.model
 
+# Reciprocal rank fusion: score = sum(1 / (RRF_K + rank)) across legs.
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Each hybrid leg fetches top_k * this many candidates before fusion.
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "3"))
+FULLTEXT_CONFIG = os.getenv("FULLTEXT_CONFIG", "english")  # matches ross.documents.tsv
+# Full-text leg: documents shortlisted (top_k * this) before chunks are matched.
+FULLTEXT_DOC_FACTOR = int(os.getenv("FULLTEXT_DOC_FACTOR", "4"))
 
-_model: Optional[SentenceTransformer] = None
 
-def _get_model() -> SentenceTransformer:
-    global _model
-    if _model is None:
-        # first call will download weights if not present
-        _model = SentenceTransformer(EMBED_MODEL_NAME)
-    return _model
+def _embed_384(text: str) -> List[float]:
+    # plain list[float] for psycopg/pgvector adapter
+    return embedding_service.embed([text])[0].tolist()
 
 
-def _embed_384(text: str) -> List[float]:
-    m = _get_model()
-    vec = m.encode([text], normalize_embeddings=True)[0]
-    # vec is numpy; convert to plain list[float] for psycopg/pgvector adapter
-    return [float(x) for x in vec]
+async def _aembed_batch_384(texts: List[str], model_name: Optional[str] = None) -> np.ndarray:
+    """One batched encode for all texts, off the event loop."""
+    return await embedding_service.aembed(texts, model_name=model_name)
 
 
 class MultiRetrieveRequest(BaseModel):
     queries: List[str] = Field(..., description="Natural language search or retrieval queries.")
     top_k: int = Field(6, ge=1, le=50)
+    recall: Literal["fast", "balanced", "high"] = Field(
+        "balanced", description="ANN recall/latency trade-off (hnsw.ef_search / ivfflat.probes)."
+    )
+    mode: Literal["vector", "fulltext", "hybrid"] = Field(
+        "vector", description="vector (pgvector), fulltext (tsvector) or hybrid (both, fused with RRF)."
+    )
+    profile: Optional[str] = Field(
+        None,
+        description=(
+            "Search only this profile's tenant (default: the general profile's); "
+            "INMEMORY_TENANTS are served in-process."
+        ),
+    )
+    model: Optional[str] = Field(
+        None, description="Embedding model tag to search (EMBED_MODELS); defaults to EMBED_MODEL_TAG."
+    )
+    document_ids: Optional[List[int]] = Field(
+        None, description="Only return chunks from these documents."
+    )
+    rerank: bool = Field(
+        False, description="Over-fetch candidates and reorder them with the cross-encoder."
+    )
+    rerank_candidates: Optional[int] = Field(
+        None, ge=1, le=200, description="Candidates per query to rerank (RERANK_CANDIDATES)."
+    )
+    rerank_budget_ms: Optional[float] = Field(
+        None, ge=0, description="Rerank time budget for the whole request (RERANK_BUDGET_MS)."
+    )
+
+
+class RetrievalRequestError(ValueError):
+    """Unknown model or profile in a retrieval request (HTTP 400 at the route)."""
 
 
 class RetrieveItem(BaseModel):
@@ -64,43 +100,119 @@ class MultiRetrieveResponse(BaseModel):
     backend: str
 
 
-async def _pgvector_retrieve(query: str, top_k: int) -> List[Dict[str, Any]]:
-    qvec = _embed_384(query)
-
-    sql = """
-    SELECT
-      c.id,
-      c.document_id,
-      left(c.content, 300) AS snippet,
-      (e.embedding_384 <=> %(qvec)s) AS distance
-    FROM ross.chunk_embeddings e
-    JOIN ross.document_chunks c ON c.id = e.chunk_id
-    WHERE e.model = %(model)s
-    ORDER BY e.embedding_384 <=> %(qvec)s
+async def _pgvector_retrieve(
+    qvec: np.ndarray,
+    top_k: int,
+    recall: str = "balanced",
+    model: str = EMBED_MODEL_TAG,
+    document_ids: Optional[List[int]] = None,
+    tenant: str = DEFAULT_TENANT,
+) -> List[Dict[str, Any]]:
+    # Tenant and model tag are inlined (not bound) so every plan, generic or
+    # custom, prunes to the tenant's partition and matches that model's
+    # partial index there. The MATERIALIZED CTE keeps the index scan + LIMIT
+    # together; the outer query re-scores the shortlist with the exact
+    # float32 distance, which both restores order under relaxed iterative
+    # scan and corrects halfvec/binary approximations (EMBED_STORAGE).
+    fmt = embedding_service.storage_format(model)
+    shortlist = rescore_limit(top_k, fmt)
+    filtered = document_ids is not None
+    doc_filter = psql.SQL("AND c.document_id = ANY(%(doc_ids)s)" if filtered else "")
+    sql = psql.SQL("""
+    WITH hits AS MATERIALIZED (
+      SELECT
+        c.id,
+        c.document_id,
+        left(c.content, 300) AS snippet,
+        e.embedding_384
+      FROM ross.chunk_embeddings e
+      JOIN ross.document_chunks c ON c.id = e.chunk_id
+      WHERE e.{tenant_pred} AND e.{model_pred} {doc_filter}
+      ORDER BY {order}
+      LIMIT %(n)s
+    )
+    SELECT id, document_id, snippet, (embedding_384 <=> %(qvec)s) AS distance
+    FROM hits
+    ORDER BY distance
     LIMIT %(k)s;
-    """
+    """).format(
+        tenant_pred=partial_predicate(tenant, "tenant"),
+        model_pred=partial_predicate(model),
+        doc_filter=doc_filter,
+        order=psql.SQL(ann_order("e.embedding_384", fmt, 384)),
+    )
 
-    with _connect() as conn, conn.cursor(row_factory=dict_row) as cur:
-        cur.execute(sql, {"qvec": qvec, "model": EMBED_MODEL_TAG, "k": top_k})
-        rows = cur.fetchall()
+    settings_sql, settings_params = settings_statement(
+        f"ross.{partition_name(tenant)}", recall, shortlist, partial=model, filtered=filtered
+    )
+
+    pool = await get_pool()
+    # db span = pool wait + statements; the sql span is the search alone
+    with telemetry.stage("db", leg="vector"):
+        async with pool.connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            # One transaction per checkout, so set_config(..., true) is query-local.
+            await cur.execute(settings_sql, settings_params)
+            with telemetry.span("sql", stmt="ann", shortlist=shortlist):
+                await cur.execute(
+                    sql, {"qvec": qvec, "n": shortlist, "k": top_k, "doc_ids": document_ids}
+                )
+                rows = await cur.fetchall()
     return [dict(r) for r in rows]
 
 
-async def _keyword_fallback(query: str, top_k: int) -> List[Dict[str, Any]]:
-    # Simple fallback if embeddings are empty
-    sql = """
+async def _fulltext_retrieve(
+    query: str,
+    top_k: int,
+    document_ids: Optional[List[int]] = None,
+    tenant: str = DEFAULT_TENANT,
+) -> List[Dict[str, Any]]:
+    """
+    Full-text leg: websearch_to_tsquery against the GIN-indexed
+    ross.documents.tsv shortlists documents; only chunks that match the
+    query themselves are returned, ranked by their own ts_rank_cd (the
+    document rank breaks ties).
+    """
+    doc_filter = "AND d.id = ANY(%(doc_ids)s)" if document_ids is not None else ""
+    sql = f"""
+    WITH q AS (
+      SELECT websearch_to_tsquery(%(cfg)s::regconfig, %(q)s) AS tsq
+    ),
+    docs AS (
+      SELECT d.id, ts_rank_cd(d.tsv, q.tsq) AS doc_rank
+      FROM ross.documents d, q
+      WHERE d.tenant = %(tenant)s AND d.tsv @@ q.tsq {doc_filter}
+      ORDER BY doc_rank DESC
+      LIMIT %(n)s
+    )
     SELECT
-      id,
-      document_id,
-      left(content, 300) AS snippet
-    FROM ross.document_chunks
-    WHERE content ILIKE %(pat)s
-    ORDER BY id DESC
+      c.id,
+      c.document_id,
+      left(c.content, 300) AS snippet,
+      ts_rank_cd(ct.tsv, q.tsq) AS rank
+    FROM docs
+    JOIN ross.document_chunks c ON c.document_id = docs.id
+    CROSS JOIN q
+    CROSS JOIN LATERAL (SELECT to_tsvector(%(cfg)s::regconfig, c.content) AS tsv) ct
+    WHERE ct.tsv @@ q.tsq
+    ORDER BY rank DESC, docs.doc_rank DESC, c.chunk_index
     LIMIT %(k)s;
     """
-    with _connect() as conn, conn.cursor(row_factory=dict_row) as cur:
-        cur.execute(sql, {"pat": f"%{query}%", "k": top_k})
-        rows = cur.fetchall()
+    pool = await get_pool()
+    with telemetry.stage("db", leg="fulltext"):
+        async with pool.connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            with telemetry.span("sql", stmt="fulltext"):
+                await cur.execute(
+                    sql,
+                    {
+                        "cfg": FULLTEXT_CONFIG,
+                        "q": query,
+                        "k": top_k,
+                        "n": top_k * FULLTEXT_DOC_FACTOR,
+                        "doc_ids": document_ids,
+                        "tenant": tenant,
+                    },
+                )
+                rows = await cur.fetchall()
     out = []
     for r in rows:
         d = dict(r)
@@ -109,30 +221,193 @@ async def _keyword_fallback(query: str, top_k: int) -> List[Dict[str, Any]]:
     return out
 
 
-@router.post("/retrieve/multi", response_model=MultiRetrieveResponse)
-async def multi_retrieve(payload: MultiRetrieveRequest) -> MultiRetrieveResponse:
-    started = time.time()
+def rrf_fuse(legs: List[List[Dict[str, Any]]], top_k: int, k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    Reciprocal rank fusion over ranked chunk lists (keyed by chunk id).
 
-    # If no embeddings exist, do fallback
-    with _connect() as conn, conn.cursor() as cur:
-        cur.execute("SELECT count(*) FROM ross.chunk_embeddings WHERE model=%s", (EMBED_MODEL_TAG,))
-        (n,) = cur.fetchone()
+    Rows keep the fields from whichever leg saw them first (vector distance
+    wins over full-text rank when both are present) plus an `rrf_score`.
+    """
+    scores: Dict[int, float] = {}
+    rows: Dict[int, Dict[str, Any]] = {}
+    for leg in legs:
+        for rank, row in enumerate(leg, start=1):
+            cid = row["id"]
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank)
+            merged = rows.setdefault(cid, dict(row))
+            for key, value in row.items():
+                if merged.get(key) is None:
+                    merged[key] = value
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [{**rows[cid], "rrf_score": scores[cid]} for cid in ranked]
+
+
+async def _hybrid_retrieve(
+    query: str,
+    qvec: np.ndarray,
+    top_k: int,
+    recall: str = "balanced",
+    model: str = EMBED_MODEL_TAG,
+    document_ids: Optional[List[int]] = None,
+    tenant: str = DEFAULT_TENANT,
+) -> List[Dict[str, Any]]:
+    """Run the vector and full-text legs concurrently and fuse with RRF."""
+    n = top_k * max(1, HYBRID_CANDIDATE_FACTOR)
+    vector_rows, text_rows = await asyncio.gather(
+        _pgvector_retrieve(qvec, n, recall, model, document_ids, tenant),
+        _fulltext_retrieve(query, n, document_ids, tenant),
+    )
+    return rrf_fuse([vector_rows, text_rows], top_k)
+
+
+def _query_spans(jobs: List[Any]) -> List[Any]:
+    """Wrap per-query jobs so each query is its own span in the request trace."""
+    async def _run(i: int, job: Any) -> Any:
+        with telemetry.span("query", i=i):
+            return await job()
+
+    return [lambda i=i, job=job: _run(i, job) for i, job in enumerate(jobs)]
+
+
+async def _inmemory_retrieve(
+    index: "inmemory_index.TenantIndex",
+    queries: List[str],
+    qvecs: np.ndarray,
+    top_k: int,
+    mode: str,
+    document_ids: Optional[List[int]] = None,
+) -> List[Any]:
+    """
+    Vector leg from the tenant's in-process index: all queries in one
+    matrix product. Hybrid still fuses with the full-text leg, but keeps
+    the vector hits on their own if Postgres is unreachable.
+    """
+    if not queries:
+        return []
+    n = top_k * max(1, HYBRID_CANDIDATE_FACTOR) if mode == "hybrid" else top_k
+    with telemetry.span("inmemory_search", queries=len(queries)):
+        hits = await run_in_threadpool(index.search, qvecs, n, document_ids)
+    if mode != "hybrid":
+        return hits
+    texts = await run_parallel(
+        _query_spans([lambda q=q: _fulltext_retrieve(q, n, document_ids, index.tenant) for q in queries])
+    )
+    return [
+        h[:top_k] if isinstance(t, BaseException) else rrf_fuse([h, t], top_k)
+        for h, t in zip(hits, texts)
+    ]
 
-    results = []
-    backend = "pgvector" if n > 0 else "keyword_fallback"
 
-    for q in payload.queries:
+async def retrieve_multi(payload: MultiRetrieveRequest) -> MultiRetrieveResponse:
+    """
+    The retrieval engine behind /retrieve/multi, callable in-process
+    (plan.py uses it directly). Raises RetrievalRequestError for an unknown
+    model or profile; per-query failures are reported inside the results.
+    """
+    model = payload.model or EMBED_MODEL_TAG
+    try:
+        model_name = embedding_service.model_name_for_tag(model)
+    except KeyError:
+        raise RetrievalRequestError(f"unknown embedding model: {model}")
+
+    # Every search is pinned to one tenant; no profile means DEFAULT_TENANT.
+    try:
+        tenant = resolve_tenant(payload.profile)
+    except KeyError:
+        raise RetrievalRequestError(f"unknown profile: {payload.profile}")
+    memory = inmemory_index.get_index(tenant, model) if inmemory_index.serves(tenant) else None
+    if memory is not None and memory.live_count == 0:
+        # not synced yet (cold start, new model): pgvector holds the same rows
+        memory = None
+
+    # If no embeddings exist, fall back to the full-text leg alone
+    # (cached flag, no count(*) scan)
+    mode = payload.mode
+    backend = {"vector": "pgvector", "fulltext": "fulltext", "hybrid": "hybrid_rrf"}[mode]
+    if memory is not None and mode != "fulltext":
+        backend = "inmemory" if mode == "vector" else "hybrid_rrf_inmemory"
+    elif mode != "fulltext" and not await has_embeddings(model, tenant):
+        mode, backend = "fulltext", "fulltext_fallback"
+    queries = list(payload.queries)
+    doc_ids = payload.document_ids
+    # With rerank on, every backend over-fetches and the cross-encoder cuts to top_k.
+    top_k = payload.top_k
+    if payload.rerank:
+        top_k = max(top_k, payload.rerank_candidates or reranker.RERANK_CANDIDATES)
+
+    # Embed every query in one batch off the event loop, then run the
+    # per-query searches concurrently over the pool: latency tracks the
+    # slowest query rather than the number of queries.
+    outcomes: List[Any]
+    if mode == "fulltext":
+        outcomes = await run_parallel(
+            _query_spans([lambda q=q: _fulltext_retrieve(q, top_k, doc_ids, tenant) for q in queries])
+        )
+    else:
         try:
-            if n > 0:
-                docs = await _pgvector_retrieve(q, payload.top_k)
-            else:
-                docs = await _keyword_fallback(q, payload.top_k)
-            results.append({"query": q, "docs": docs})
+            qvecs = await _aembed_batch_384(queries, model_name) if queries else []
         except Exception as e:
-            results.append({"query": q, "docs": [{"id": -1, "document_id": -1, "snippet": f"retrieval error: {e}", "distance": None}]})
+            outcomes = [e] * len(queries)
+        else:
+            if memory is not None:
+                outcomes = await _inmemory_retrieve(memory, queries, np.asarray(qvecs), top_k, mode, doc_ids)
+            elif mode == "hybrid":
+                jobs = [
+                    lambda q=q, v=v: _hybrid_retrieve(
+                        q, v, top_k, payload.recall, model, doc_ids, tenant
+                    )
+                    for q, v in zip(queries, qvecs)
+                ]
+                outcomes = await run_parallel(_query_spans(jobs))
+            else:
+                jobs = [
+                    lambda v=v: _pgvector_retrieve(v, top_k, payload.recall, model, doc_ids, tenant)
+                    for v in qvecs
+                ]
+                outcomes = await run_parallel(_query_spans(jobs))
+
+    if payload.rerank:
+        budget_ms = payload.rerank_budget_ms
+        if budget_ms is None:
+            budget_ms = reranker.RERANK_BUDGET_MS
+        deadline = time.monotonic() + budget_ms / 1000.0
+
+        async def _rerank_one(q: str, docs: Any) -> Any:
+            if isinstance(docs, BaseException):
+                return docs, False
+            try:
+                return await reranker.rerank(q, docs, payload.top_k, deadline)
+            except Exception as e:  # keep first-stage order
+                print(f"[retrieve/multi] rerank failed: {e!r}")
+                return docs[:payload.top_k], False
+
+        with telemetry.stage("rerank"):
+            reranked = await asyncio.gather(*(_rerank_one(q, d) for q, d in zip(queries, outcomes)))
+        outcomes = [r[0] for r in reranked]
+        flags = [r[1] for r in reranked]
+    else:
+        flags = [False] * len(queries)
+
+    results = []
+    for q, docs, was_reranked in zip(queries, outcomes, flags):
+        if isinstance(docs, BaseException):
+            results.append({"query": q, "docs": [{"id": -1, "document_id": -1, "snippet": f"retrieval error: {docs}", "distance": None}]})
+        else:
+            result = {"query": q, "docs": docs}
+            if payload.rerank:
+                result["reranked"] = was_reranked
+            results.append(result)
 
     return MultiRetrieveResponse(
         ok=True,
         results=results,
         backend=backend,
     )
+
+
+@router.post("/retrieve/multi", response_model=MultiRetrieveResponse)
+async def multi_retrieve(payload: MultiRetrieveRequest) -> MultiRetrieveResponse:
+    try:
+        return await retrieve_multi(payload)
+    except RetrievalRequestError as e:
+        raise HTTPException(400, str(e))
@@ -5,46 +5,25 @@ from typing import Any, Dict
 
 from fastapi import APIRouter
 
-try:
-    import yaml  # type: ignore
-except Exception:  # pragma: no cover
-    yaml = None  # type: ignore
+from persona_store import candidate_persona_dirs, get_persona_store
 
 router = APIRouter()
 
 
 def _candidate_persona_dirs() -> list[Path]:
     """
-    In-container layout (WORKDIR=/app):
-      /app/routes/memory.py  -> parents[1] == /app
-    We try:
-      /app/data/persona  (if you later add it)
-      /app/profiles      (you already have this)
+    Delegates to persona_store.candidate_persona_dirs(), which resolves
+    relative to the app dir (WORKDIR=/app). The first existing one wins:
+      /app/data/persona
+      /app/profiles
+    Persona files are matched by PERSONA_GLOB ("*.y*ml": .yaml and .yml).
     """
-    app_dir = Path(__file__).resolve().parents[1]
-    return [
-        app_dir / "data" / "persona",
-        app_dir / "profiles",
-    ]
+    return candidate_persona_dirs()
 
 
 def _load_yaml_files() -> Dict[str, Any]:
-    if yaml is None:
-        return {"_error": "pyyaml_not_installed"}
-
-    for d in _candidate_persona_dirs():
-        if d.exists() and d.is_dir():
-            out: Dict[str, Any] = {}
-            for f in sorted(d.glob("*.y*ml")):
-                try:
-                    data = yaml.safe_load(f.read_text()) or {}
-                except Exception as e:
-                    data = {"_error": f"failed_to_parse: {e!r}"}
-                out[f.stem] = data
-            return out
-
-    # nothing found
-    return {}
+    # Same parsed cache /chat uses; only re-parses when the files change.
+    return get_persona_store().memory()
 
 
 @router.get("/memory/status")
@@ -57,4 +36,12 @@ def memory_status() -> Dict[str, Any]:
         "loaded": keys,
         "has_error": any(k.startswith("_") for k in mem.keys()),
         "candidates": [str(p) for p in _candidate_persona_dirs()],
+        "cache": get_persona_store().status(),
     }
+
+
+@router.post("/memory/reload")
+@router.post("/admin/reload-memory")  # used by scripts/reload_persona_and_ping.sh
+def memory_reload() -> Dict[str, Any]:
+    """Force a re-parse of the persona YAML files (no restart needed)."""
+    return {"status": "ok", "cache": get_persona_store().reload()}
@@ -1,9 +1,10 @@
-import os, json, hashlib
+import os, json, hashlib, time
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 import psycopg2
 import psycopg2.extras
-from typing import List, Dict, Optional
+from psycopg2 import sql as psql2
+from typing import List, Dict, Literal, Optional
 
 import os
 EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
@@ -11,11 +12,22 @@ HF_EMBED_MODEL = os.getenv("HF_EMBED_MODEL", "sentence-transformers/all-MiniLM-L
 EMBED_DIM = int(os.getenv("EMBEDDING_DIM", "1536"))
 
 
-from embeddings_hf import embed_texts
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from psycopg.types.json import Jsonb
+
+from db import get_pool, register_session_setup
+from embedding_service import aembed, storage_format
+from index_manager import ann_order, rescore_limit, settings_statement
+from telemetry import span, stage
+from tenant_config import DEFAULT_TENANT, resolve_tenant
 
 router = APIRouter()
 
 EMBED_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+INGEST_STREAM_BATCH = int(os.getenv("INGEST_STREAM_BATCH", "256"))
+INGEST_MAX_LINE_BYTES = int(os.getenv("INGEST_MAX_LINE_BYTES", str(4 * 1024 * 1024)))
 
 def db():
     url=os.getenv("DATABASE_URL")
@@ -23,27 +35,17 @@ def db():
         raise RuntimeError("DATABASE_URL missing")
     return psycopg2.connect(url)
 
-def ensure_schema():
-    with db() as conn:
-        with conn.cursor() as cur:
-            cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-            cur.execute(f"""
-            CREATE TABLE IF NOT EXISTS docs(
-              id TEXT PRIMARY KEY,
-              content TEXT,
-              meta JSONB,
-              embedding vector({EMBED_DIM})
-            );
-            """)
-            cur.execute("ANALYZE docs;")
-
 def vec(v):
     return "[" + ",".join(f"{x:.6f}" for x in v) + "]"
 
-def stable_id(content,meta):
+def stable_id(content,meta,tenant=None):
+    # Other tenants salt the hash, so the same document ingested by two
+    # tenants gets two rows; DEFAULT_TENANT keeps the pre-tenant ids.
     h=hashlib.sha256()
     h.update(content.encode())
     h.update(json.dumps(meta,sort_keys=True).encode())
+    if tenant and tenant!=DEFAULT_TENANT:
+        h.update(b"\0"+tenant.encode())
     return h.hexdigest()[:24]
 
 class Doc(BaseModel):
@@ -53,38 +55,59 @@ class Doc(BaseModel):
 
 class IngestReq(BaseModel):
     docs:List[Doc]
+    profile:Optional[str]=None  # docs land in this profile's tenant
+
+def _tenant(profile):
+    try:
+        return resolve_tenant(profile)
+    except KeyError:
+        raise HTTPException(400,f"unknown profile: {profile}")
+
+# An id owned by another tenant is left alone rather than moved across the
+# wall; RETURNING only lists rows actually written, so callers report the
+# rest as failed.
+UPSERT_DOCS_CONFLICT = """
+ON CONFLICT(id) DO UPDATE SET
+content=EXCLUDED.content,
+meta=EXCLUDED.meta,
+embedding=EXCLUDED.embedding
+WHERE docs.tenant=EXCLUDED.tenant
+RETURNING id
+"""
+TENANT_CONFLICT_ERROR="id belongs to another tenant"
+
+def _upsert_docs(rows):
+    """Upsert rows; returns the set of ids written."""
+    with db() as conn:
+        with conn.cursor() as cur:
+            written=psycopg2.extras.execute_values(
+                cur,
+                "INSERT INTO docs(id,tenant,content,meta,embedding) VALUES %s"+UPSERT_DOCS_CONFLICT,
+                rows,
+                template="(%s,%s,%s,%s::jsonb,%s::vector)",
+                fetch=True,
+            )
+    return {r[0] for r in written}
 
 @router.post("/ingest")
-def ingest(req:IngestReq):
+async def ingest(req:IngestReq):
+    tenant=_tenant(req.profile)
     try:
-        ensure_schema()
-        vecs=embed_texts([d.content for d in req.docs])
+        # Shared micro-batcher: concurrent ingests/queries share one encode
+        vecs=(await aembed([d.content for d in req.docs])).tolist()
 
         rows=[]
         ids=[]
 
         for d,v in zip(req.docs,vecs):
-            _id=d.id or stable_id(d.content,d.meta)
+            _id=d.id or stable_id(d.content,d.meta,tenant)
             ids.append(_id)
-            rows.append((_id,d.content,json.dumps(d.meta),vec(v)))
-
-        with db() as conn:
-            with conn.cursor() as cur:
-                psycopg2.extras.execute_values(
-                    cur,
-                    """
-                    INSERT INTO docs(id,content,meta,embedding)
-                    VALUES %s
-                    ON CONFLICT(id) DO UPDATE SET
-                    content=EXCLUDED.content,
-                    meta=EXCLUDED.meta,
-                    embedding=EXCLUDED.embedding
-                    """,
-                    rows,
-                    template="(%s,%s,%s::jsonb,%s::vector)"
-                )
+            rows.append((_id,tenant,d.content,json.dumps(d.meta),vec(v)))
+
+        written=await run_in_threadpool(_upsert_docs, rows)
+        failed=[{"id":i,"error":TENANT_CONFLICT_ERROR} for i in dict.fromkeys(ids) if i not in written]
 
-        return {"ok":True,"ids":ids}
+        return {"ok":not failed,"ids":[i for i in ids if i in written],"failed":failed}
 
     except Exception as e:
         raise HTTPException(500,str(e))
@@ -92,25 +115,155 @@ def ingest(req:IngestReq):
 class Query(BaseModel):
     query:str
     top_k:int=5
+    recall:Literal["fast","balanced","high"]="balanced"
+    profile:Optional[str]=None  # search only this profile's tenant (none: the general profile's)
+
+def _search_docs(v, top_k, recall="balanced", tenant=None):
+    tenant=tenant or resolve_tenant(None)
+    fmt=storage_format()
+    shortlist=rescore_limit(top_k,fmt)
+    settings_sql,settings_params=settings_statement("public.docs",recall,shortlist,partial=tenant)
+    # tenant inlined as a literal so the planner matches its partial ANN index;
+    # the shortlist from a halfvec/binary index is re-scored in float32
+    query=psql2.SQL("""
+            WITH hits AS MATERIALIZED (
+              SELECT id,content,meta,embedding
+              FROM docs
+              WHERE tenant = {tenant}
+              ORDER BY {order}
+              LIMIT %s
+            )
+            SELECT id,content,meta,
+            1-(embedding <=> %s::vector) as score
+            FROM hits
+            ORDER BY embedding <=> %s::vector
+            LIMIT %s
+            """).format(
+        tenant=psql2.Literal(tenant),
+        order=psql2.SQL(ann_order("embedding",fmt,EMBED_DIM,"%s::vector")),
+    )
+    with stage("db"), db() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(settings_sql,settings_params)
+            with span("sql",stmt="ann",shortlist=shortlist):
+                cur.execute(query,(v,shortlist,v,v,top_k))
+                return cur.fetchall()
 
 @router.post("/retrieve/vector")
-def retrieve(q:Query):
+async def retrieve(q:Query):
+    tenant=_tenant(q.profile)
     try:
-        ensure_schema()
-        v=vec(embed_texts([q.query])[0])
-
-        with db() as conn:
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("""
-                SELECT id,content,meta,
-                1-(embedding <=> %s::vector) as score
-                FROM docs
-                ORDER BY embedding <=> %s::vector
-                LIMIT %s
-                """,(v,v,q.top_k))
-                rows=cur.fetchall()
+        v=vec((await aembed([q.query]))[0])
+
+        rows=await run_in_threadpool(_search_docs, v, q.top_k, q.recall, tenant)
 
         return {"ok":True,"results":rows}
 
     except Exception as e:
-        raise HTTPException(500,str(e))
\ No newline at end of file
+        raise HTTPException(500,str(e))
+
+
+# ---------- streaming NDJSON ingest ----------
+#
+# POST /ingest/stream with one Doc JSON object per line. The body is read
+# incrementally and handled INGEST_STREAM_BATCH docs at a time (embed, then
+# binary COPY into a session temp table, then upsert into docs), so memory
+# stays bounded by one batch no matter how large the upload is. Progress
+# is streamed back as NDJSON, one line per batch plus a final summary.
+# ?profile=<name> picks the tenant the docs belong to; ids already owned
+# by another tenant are not written and are listed under "failed". The docs table
+# itself is created by migrations.py at startup.
+
+# Session-local staging table, created once per pooled connection (db.py).
+register_session_setup(
+    "CREATE TEMP TABLE IF NOT EXISTS _ingest_docs "
+    "(ord INT, id TEXT, content TEXT, meta JSONB, embedding vector) "
+    "ON COMMIT DELETE ROWS"
+)
+
+async def _iter_ndjson(request:Request):
+    buf=b""
+    lineno=0
+    async for chunk in request.stream():
+        buf+=chunk
+        if len(buf)>INGEST_MAX_LINE_BYTES and b"\n" not in buf:
+            raise ValueError(f"line {lineno+1} exceeds {INGEST_MAX_LINE_BYTES} bytes")
+        *lines,buf=buf.split(b"\n")
+        for line in lines:
+            lineno+=1
+            if line.strip():
+                yield lineno,line
+    if buf.strip():
+        yield lineno+1,buf
+
+async def _copy_batch(docs:List[Doc],tenant:str):
+    """Stage and upsert one batch; returns (rows written, ids not written)."""
+    vecs=await aembed([d.content for d in docs])
+    ids=[d.id or stable_id(d.content,d.meta,tenant) for d in docs]
+    pool=await get_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                async with cur.copy(
+                    "COPY _ingest_docs (ord, id, content, meta, embedding) FROM STDIN WITH (FORMAT BINARY)"
+                ) as copy:
+                    copy.set_types(["int4","text","text","jsonb","vector"])
+                    for i,(_id,d,v) in enumerate(zip(ids,docs,vecs)):
+                        await copy.write_row((i,_id,d.content,Jsonb(d.meta),v))
+                # a repeated id keeps its last line, like the per-row upsert would
+                await cur.execute(
+                    "INSERT INTO docs(id,tenant,content,meta,embedding) "
+                    "SELECT DISTINCT ON (id) id,%s,content,meta,embedding FROM _ingest_docs "
+                    "ORDER BY id, ord DESC"
+                    +UPSERT_DOCS_CONFLICT,
+                    (tenant,),
+                )
+                written={r[0] for r in await cur.fetchall()}
+    return len(written),[i for i in dict.fromkeys(ids) if i not in written]
+
+def _batch_line(batches,total,conflicts):
+    line={"batch":batches,"ingested":total}
+    if conflicts:
+        line["failed"]=[{"id":i,"error":TENANT_CONFLICT_ERROR} for i in conflicts]
+    return json.dumps(line)+"\n"
+
+@router.post("/ingest/stream")
+async def ingest_stream(request:Request,profile:Optional[str]=None):
+    tenant=_tenant(profile)
+    async def progress():
+        batch:List[Doc]=[]
+        total=0
+        batches=0
+        skipped=0
+        failed=0
+        started=time.time()
+        try:
+            async for lineno,line in _iter_ndjson(request):
+                try:
+                    batch.append(Doc.model_validate_json(line))
+                except Exception as e:
+                    skipped+=1
+                    yield json.dumps({"line":lineno,"error":str(e)[:300]})+"\n"
+                    continue
+                if len(batch)>=INGEST_STREAM_BATCH:
+                    n,conflicts=await _copy_batch(batch,tenant)
+                    total+=n
+                    failed+=len(conflicts)
+                    batches+=1
+                    batch=[]
+                    yield _batch_line(batches,total,conflicts)
+            if batch:
+                n,conflicts=await _copy_batch(batch,tenant)
+                total+=n
+                failed+=len(conflicts)
+                batches+=1
+                yield _batch_line(batches,total,conflicts)
+        except Exception as e:
+            yield json.dumps({"done":True,"ok":False,"ingested":total,"batches":batches,"skipped":skipped,"failed":failed,"error":str(e)})+"\n"
+            return
+        yield json.dumps({
+            "done":True,"ok":not failed,"ingested":total,"batches":batches,"skipped":skipped,"failed":failed,
+            "latency_ms":int((time.time()-started)*1000),
+        })+"\n"
+
+    return StreamingResponse(progress(),media_type="application/x-ndjson")
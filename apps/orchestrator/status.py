@@ -1,8 +1,10 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, Optional
 import time
 
+import telemetry
+
 router = APIRouter()
 
 _start_time = time.time()
@@ -21,6 +23,11 @@ class StatusResponse(BaseModel):
     last_chat_latency_ms: Optional[float]
     total_chats: int
     total_chat_errors: int
+    in_flight: int = 0
+    # "METHOD /route" -> count, errors, avg/p50/p95/p99 latency (ms)
+    routes: Dict[str, Dict[str, Any]] = {}
+    # stage (prompt, embed, db, llm, rerank) -> count, avg/p50/p95/p99 (ms)
+    stages: Dict[str, Dict[str, Any]] = {}
 
 
 def record_chat_success(latency_ms: float) -> None:
@@ -47,4 +54,5 @@ async def get_status() -> StatusResponse:
         last_chat_latency_ms=_last_chat_latency_ms,
         total_chats=_total_chats,
         total_chat_errors=_total_chat_errors,
+        **telemetry.snapshot(),
     )
@@ -0,0 +1,323 @@
+"""
+Request and stage timing for the orchestrator.
+
+`TimingMiddleware` is a pure ASGI middleware (no BaseHTTPMiddleware, so
+streaming responses are not buffered). It records, per route template:
+  - request latency histogram, until the last body chunk is sent
+  - request count by status and error count (5xx or unhandled exception)
+  - in-flight requests
+
+`stage(name)` times one sub-step of a request ("prompt", "embed", "db",
+"llm", "rerank"). Durations go to a per-stage histogram and to the
+current request's breakdown, which is returned as a `Server-Timing`
+response header. Stages that run concurrently are summed.
+
+Everything is exported for Prometheus at /metrics (prometheus_client) and
+summarized with p50/p95/p99 from the in-process histograms in /status.
+
+Tracing: every request gets a trace id (the incoming X-Trace-Id header,
+else a new one), echoed back as X-Trace-Id. `span(name, **attrs)` records
+a nested, timed span on the current trace; every `stage()` is also a
+span. Sub-calls forward the id with `trace_headers()`, so the gateway
+hop, /plan and its loopback calls all share one trace. At the end of a
+request with spans, the trace is handed to execution_log.log_trace() as
+one compact row; /logs/trace/{id} reassembles it.
+
+Config:
+  TRACE_SAMPLE     fraction of traces persisted, decided from the trace id
+                   so every hop keeps or drops the same trace (5xx always kept)
+  TRACE_MAX_SPANS  spans kept per request; later ones are only counted
+"""
+from __future__ import annotations
+
+import contextvars
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from histogram import LATENCY_BUCKETS_MS, Histogram
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, generate_latest
+    from prometheus_client import Histogram as PromHistogram
+    _PROMETHEUS = True
+except Exception:  # pragma: no cover
+    _PROMETHEUS = False
+
+SERVICE_NAME = "orchestrator"
+TRACE_SAMPLE = float(os.getenv("TRACE_SAMPLE", "1.0"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "256"))
+TRACE_HEADER = "X-Trace-Id"
+_TRACE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+_SECONDS_BUCKETS = tuple(b / 1000.0 for b in LATENCY_BUCKETS_MS)
+
+router = APIRouter(tags=["metrics"])
+
+if _PROMETHEUS:
+    REQ_COUNTER = Counter(
+        "http_requests_total",
+        "Total HTTP requests",
+        ["service", "method", "path", "status"],
+    )
+    REQ_LATENCY = PromHistogram(
+        "http_request_duration_seconds",
+        "Request latency in seconds",
+        ["service", "method", "path"],
+        buckets=_SECONDS_BUCKETS,
+    )
+    REQ_ERRORS = Counter(
+        "http_request_errors_total",
+        "Requests that ended in a 5xx or an unhandled exception",
+        ["service", "method", "path", "kind"],
+    )
+    REQ_IN_FLIGHT = Gauge(
+        "http_requests_in_flight",
+        "Requests currently being served",
+        ["service", "method"],
+    )
+    STAGE_LATENCY = PromHistogram(
+        "orchestrator_stage_duration_seconds",
+        "Time spent in one stage of a request (prompt, embed, db, llm, rerank)",
+        ["stage"],
+        buckets=_SECONDS_BUCKETS,
+    )
+
+_lock = threading.Lock()
+_routes: Dict[str, Histogram] = {}
+_stages: Dict[str, Histogram] = {}
+_errors: Dict[str, int] = {}
+_in_flight = 0
+
+# Per-request stage totals (ms); one dict shared by the request's tasks.
+_request_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_stages", default=None
+)
+
+
+class Trace:
+    """
+    Spans of one request. Each span is stored compactly as
+    [name, start_ms, duration_ms, parent, attrs]: start is relative to the
+    request start, parent is the index of the enclosing span (-1 = root).
+    """
+
+    def __init__(self, trace_id: str) -> None:
+        self.trace_id = trace_id
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: List[List[Any]] = []
+        self.dropped = 0
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000.0
+
+    def open(self, name: str, parent: int, attrs: Dict[str, Any]) -> int:
+        with self._lock:
+            if len(self.spans) >= TRACE_MAX_SPANS:
+                self.dropped += 1
+                return -1
+            self.spans.append([name, round(self.elapsed_ms(), 3), None, parent, attrs or None])
+            return len(self.spans) - 1
+
+    def close(self, idx: int) -> None:
+        if idx >= 0:
+            span = self.spans[idx]
+            span[2] = round(self.elapsed_ms() - span[1], 3)
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+_parent_span: contextvars.ContextVar[int] = contextvars.ContextVar("parent_span", default=-1)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def trace_headers() -> Dict[str, str]:
+    """Headers that carry the current trace into an outgoing sub-call."""
+    trace_id = current_trace_id()
+    return {TRACE_HEADER: trace_id} if trace_id else {}
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[None]:
+    """Record the enclosed block as a span of the current trace (no-op outside a request)."""
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    idx = trace.open(name, _parent_span.get(), attrs)
+    token = _parent_span.set(idx)
+    try:
+        yield
+    finally:
+        try:
+            _parent_span.reset(token)
+        except ValueError:
+            # async generator finalized from another context (client went away)
+            pass
+        trace.close(idx)
+
+
+def _hist(table: Dict[str, Histogram], key: str) -> Histogram:
+    h = table.get(key)
+    if h is None:
+        with _lock:
+            h = table.setdefault(key, Histogram(LATENCY_BUCKETS_MS))
+    return h
+
+
+def observe_stage(name: str, ms: float) -> None:
+    _hist(_stages, name).observe(ms)
+    if _PROMETHEUS:
+        STAGE_LATENCY.labels(name).observe(ms / 1000.0)
+    current = _request_stages.get()
+    if current is not None:
+        current[name] = current.get(name, 0.0) + ms
+
+
+@contextmanager
+def stage(name: str, **attrs: Any) -> Iterator[None]:
+    """Time the enclosed block as stage `name` (works in sync and async code)."""
+    started = time.perf_counter()
+    try:
+        with span(name, **attrs):
+            yield
+    finally:
+        observe_stage(name, (time.perf_counter() - started) * 1000.0)
+
+
+def current_stages() -> Dict[str, float]:
+    """Stage totals (ms) recorded so far for the current request."""
+    return dict(_request_stages.get() or {})
+
+
+def _route_label(scope: Dict[str, Any]) -> str:
+    # Route template (set by the router) keeps label cardinality bounded.
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path or "unmatched"
+
+
+def _incoming_trace_id(scope: Dict[str, Any]) -> Optional[str]:
+    wanted = TRACE_HEADER.lower().encode("latin-1")
+    for key, value in scope.get("headers", []):
+        if key == wanted:
+            trace_id = value.decode("latin-1").strip()
+            return trace_id if _TRACE_ID_RE.match(trace_id) else None
+    return None
+
+
+def sampled(trace_id: str) -> bool:
+    return zlib.crc32(trace_id.encode("utf-8")) / 2**32 < TRACE_SAMPLE
+
+
+def _persist_trace(trace: Trace, method: str, route: str, status: int, elapsed_ms: float) -> None:
+    if not trace.spans:
+        return
+    if status < 500 and not sampled(trace.trace_id):
+        return
+    try:
+        from execution_log import log_trace
+
+        log_trace(trace, f"{method} {route}", status, elapsed_ms)
+    except Exception as e:  # pragma: no cover
+        print(f"[telemetry] trace {trace.trace_id} not logged: {e!r}")
+
+
+class TimingMiddleware:
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        global _in_flight
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "GET")
+        started = time.perf_counter()
+        stages: Dict[str, float] = {}
+        token = _request_stages.set(stages)
+        trace = Trace(_incoming_trace_id(scope) or uuid.uuid4().hex)
+        trace_token = _trace.set(trace)
+        status = 500
+        failed = False
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((TRACE_HEADER.lower().encode("latin-1"), trace.trace_id.encode("latin-1")))
+                if stages:
+                    timing = ", ".join(f"{k};dur={v:.1f}" for k, v in stages.items())
+                    headers.append((b"server-timing", timing.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        with _lock:
+            _in_flight += 1
+        if _PROMETHEUS:
+            REQ_IN_FLIGHT.labels(SERVICE_NAME, method).inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            _request_stages.reset(token)
+            _trace.reset(trace_token)
+            route = _route_label(scope)
+            with _lock:
+                _in_flight -= 1
+            _hist(_routes, f"{method} {route}").observe(elapsed_ms)
+            kind = "exception" if failed else ("5xx" if status >= 500 else None)
+            if kind:
+                with _lock:
+                    key = f"{method} {route}"
+                    _errors[key] = _errors.get(key, 0) + 1
+            if _PROMETHEUS:
+                REQ_IN_FLIGHT.labels(SERVICE_NAME, method).dec()
+                REQ_COUNTER.labels(SERVICE_NAME, method, route, str(status)).inc()
+                REQ_LATENCY.labels(SERVICE_NAME, method, route).observe(elapsed_ms / 1000.0)
+                if kind:
+                    REQ_ERRORS.labels(SERVICE_NAME, method, route, kind).inc()
+            _persist_trace(trace, method, route, 500 if failed else status, elapsed_ms)
+
+
+def _summary(h: Histogram) -> Dict[str, Any]:
+    snap = h.snapshot()
+    snap.pop("buckets", None)
+    return snap
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        routes = dict(_routes)
+        stages = dict(_stages)
+        errors = dict(_errors)
+        in_flight = _in_flight
+    return {
+        "in_flight": in_flight,
+        "routes": {k: {**_summary(h), "errors": errors.get(k, 0)} for k, h in sorted(routes.items())},
+        "stages": {k: _summary(h) for k, h in sorted(stages.items())},
+    }
+
+
+@router.get("/metrics")
+def prometheus_metrics() -> Response:
+    if not _PROMETHEUS:
+        return Response("prometheus_client not installed\n", status_code=503, media_type="text/plain")
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
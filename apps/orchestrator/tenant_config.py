@@ -1,4 +1,5 @@
-from typing import Dict, Any
+import re
+from typing import Dict, Any, List, Optional
 
 """
 Tenant + profile layout for Ross-LLM.
@@ -154,3 +155,25 @@ def get_tenant_for_profile(profile: str) -> str:
 
 def list_profiles() -> Dict[str, Dict[str, Any]]:
     return TENANT_PROFILES
+
+
+# Tenant for requests that name no profile (the "general" profile's tenant).
+DEFAULT_TENANT = TENANT_PROFILES["general"]["tenant"]
+
+
+def list_tenants() -> List[str]:
+    return sorted({p["tenant"] for p in TENANT_PROFILES.values()})
+
+
+def resolve_tenant(profile: Optional[str]) -> str:
+    """Tenant whose data a request may touch; KeyError for unknown profiles."""
+    if not profile:
+        return DEFAULT_TENANT
+    return get_tenant_for_profile(profile)
+
+
+def partition_name(tenant: Optional[str]) -> str:
+    """Partition of ross.chunk_embeddings holding `tenant` (None: DEFAULT)."""
+    if tenant is None:
+        return "chunk_embeddings_default"
+    return "chunk_embeddings_" + re.sub(r"[^a-z0-9]+", "_", tenant.lower()).strip("_")
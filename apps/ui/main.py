@@ -1,6 +1,6 @@
 from fastapi import Request
 from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from pathlib import Path
 from typing import List
 import httpx
@@ -8,6 +8,7 @@ import httpx
 app = FastAPI()
 
 ORCH_URL = "http://127.0.0.1:8000/chat"
+ORCH_STREAM_URL = "http://127.0.0.1:8000/chat/stream"
 STATUS_URL = "http://127.0.0.1:8000/status"
 
 
@@ -52,13 +53,41 @@ def home():
         add("user", text);
         box.value = "";
 
-        const res = await fetch("/api/chat", {
+        const res = await fetch("/api/chat/stream", {
           method: "POST",
           headers: { "Content-Type": "application/json" },
           body: JSON.stringify({ message: text })
         });
-        const data = await res.json();
-        add("assistant", data.reply || JSON.stringify(data));
+        if (!res.ok || !res.body) {
+          add("assistant", "Error: HTTP " + res.status);
+          return;
+        }
+
+        // Render deltas as they arrive (SSE frames: "data: {...}\n\n")
+        const div = document.createElement("div");
+        div.className = "msg-assistant";
+        log.appendChild(div);
+
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buf = "";
+        while (true) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buf += decoder.decode(value, { stream: true });
+          let idx;
+          while ((idx = buf.indexOf("\n\n")) >= 0) {
+            const frame = buf.slice(0, idx);
+            buf = buf.slice(idx + 2);
+            if (!frame.startsWith("data:")) continue;
+            const data = frame.slice(5).trim();
+            if (data === "[DONE]") continue;
+            const evt = JSON.parse(data);
+            if (evt.delta) div.textContent += evt.delta;
+            if (evt.error) div.textContent += "\n[error] " + evt.error;
+          }
+          log.scrollTop = log.scrollHeight;
+        }
       }
     </script>
   </body>
@@ -82,6 +111,47 @@ async def ui_chat(payload: dict):
         return r.json()
 
 
+@app.post("/api/chat/stream")
+async def ui_chat_stream(payload: dict):
+    text = payload.get("message", "").strip()
+    if not text:
+        return JSONResponse({"error": "empty message"}, status_code=400)
+
+    client = httpx.AsyncClient(timeout=httpx.Timeout(60, read=120))
+    req = client.build_request("POST", ORCH_STREAM_URL, json={
+        "user_id": "ross-ui",
+        "text": text,
+        "profile": "general"
+    })
+    try:
+        r = await client.send(req, stream=True)
+    except Exception as e:
+        await client.aclose()
+        return JSONResponse({"error": str(e)}, status_code=502)
+
+    # An upstream error is a JSON body, not SSE: pass it on with its status
+    # before any stream starts (the page checks res.ok).
+    if r.status_code >= 400:
+        body = await r.aread()
+        await r.aclose()
+        await client.aclose()
+        try:
+            detail = r.json()
+        except ValueError:
+            detail = {"error": body[:300].decode("utf-8", "replace")}
+        return JSONResponse(detail, status_code=r.status_code)
+
+    async def relay():
+        try:
+            async for chunk in r.aiter_raw():
+                yield chunk
+        finally:
+            await r.aclose()
+            await client.aclose()
+
+    return StreamingResponse(relay(), media_type="text/event-stream")
+
+
 @app.post("/api/upload")
 async def upload(files: List[UploadFile] = File(...)):
     folder = Path(__file__).resolve().parents[2] / "data" / "uploads"
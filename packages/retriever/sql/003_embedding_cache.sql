@@ -0,0 +1,9 @@
+-- Durable tier of the orchestrator's embedding cache (apps/orchestrator/embedding_cache.py).
+-- Keyed by model tag + sha256(text); the untyped vector column holds any dimension.
+CREATE TABLE IF NOT EXISTS ross.embedding_cache (
+  model        TEXT NOT NULL,
+  content_hash TEXT NOT NULL,
+  embedding    vector NOT NULL,
+  created_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (model, content_hash)
+);
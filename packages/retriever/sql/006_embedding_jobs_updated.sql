@@ -0,0 +1,4 @@
+-- Completed jobs by completion time: the orchestrator's in-memory index
+-- (apps/orchestrator/inmemory_index.py) re-checks the documents whose job
+-- completed since its last sync for deleted chunks.
+CREATE INDEX IF NOT EXISTS idx_embedding_jobs_status_updated ON ross.embedding_jobs (status, updated_at);
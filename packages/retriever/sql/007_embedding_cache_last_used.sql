@@ -0,0 +1,5 @@
+-- Recency for pruning the durable embedding cache (embedding_cache.prune()).
+ALTER TABLE ross.embedding_cache
+  ADD COLUMN IF NOT EXISTS last_used TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON ross.embedding_cache (last_used);
@@ -51,10 +51,10 @@ with conn.cursor() as cur:
     cur.execute("""
       INSERT INTO ross.documents (source, source_id, title, url, content, content_hash, metadata)
       VALUES ('demo', NULL, 'Path B Demo', NULL, %s, %s, '{}'::jsonb)
-      RETURNING id;
+      RETURNING id, tenant;
     """, (doc_text, content_hash))
-    doc_id = cur.fetchone()[0]
-    print("Inserted ross.documents id:", doc_id)
+    doc_id, tenant = cur.fetchone()
+    print("Inserted ross.documents id:", doc_id, "tenant:", tenant)
 
     # chunks + embeddings
     chunks = chunk(doc_text)
@@ -71,10 +71,12 @@ with conn.cursor() as cur:
         vec = [float(x) for x in vec]
 
         cur.execute("""
-          INSERT INTO ross.chunk_embeddings (chunk_id, model, embedding_384)
-          VALUES (%s, %s, %s);
-        """, (chunk_id, MODEL_TAG, vec))
+          INSERT INTO ross.chunk_embeddings (tenant, chunk_id, model, embedding_384)
+          VALUES (%s, %s, %s, %s);
+        """, (tenant, chunk_id, MODEL_TAG, vec))
 
+    # running orchestrators drop their cached "no embeddings yet" flag on commit
+    cur.execute("SELECT pg_notify('ross_embeddings', %s);", (MODEL_TAG,))
     print(f"Inserted chunks: {len(chunks)} and embeddings: {len(chunks)}")
 
 print("Done.")